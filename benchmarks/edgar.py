@@ -0,0 +1,199 @@
+'''
+Benchmark edgar spider end to end against the local EDGAR server (see
+edgar_server.py), which serves the reports of a corpus with the given
+latency, bandwidth and errors.
+
+The spider crawls every company of the corpus in a child process, the same
+way as ``pystock-crawler reports``, with the HTTP cache off. Reported are the
+filings (XML reports) crawled per second, CPU time per filing (including
+parser workers) and the peak memory of the crawl. Settings can be changed
+with -s to compare throttle, concurrency and parser options, e.g.:
+
+    python benchmarks/edgar.py --latency 50 -s PASSIVETHROTTLE_MODE=adaptive
+
+With --cache, the corpus is crawled twice with the HTTP cache on (in a
+temporary directory), and the second crawl, from the cache filled by the
+first one, is reported. The server sends Last-Modified and ETag, so pages are
+either fresh in the cache or revalidated with 304 responses.
+
+The default corpus is the sample data downloaded by the loader tests. Run
+them once to fill it:
+
+    py.test pystock_crawler/tests/test_loaders.py
+
+Results are saved as JSON to benchmarks/results/edgar-<commit>.json by
+default.
+
+Usage:
+  edgar.py [-c CORPUS] [-o RESULT] [--latency MS] [--jitter MS]
+           [--bandwidth KBPS] [--error-rate RATE] [--error-codes CODES]
+           [--seed SEED] [--cache] [-s NAME=VALUE]...
+  edgar.py (-h | --help)
+
+Options:
+  -h --help            Show this screen
+  -c CORPUS            Directory of XML reports [default: ]
+  -o RESULT            File to save the result to [default: ]
+  --latency MS         Delay before every response in ms [default: 0]
+  --jitter MS          Random delay added to the latency, up to MS [default: 0]
+  --bandwidth KBPS     Send responses at KBPS KB/s, 0 is unlimited [default: 0]
+  --error-rate RATE    Fraction of requests answered with an error [default: 0]
+  --error-codes CODES  Comma-separated status codes of errors [default: 503]
+  --seed SEED          Seed of the random latency and errors [default: 0]
+  --cache              Report a crawl from a warm HTTP cache
+  -s NAME=VALUE        Override a Scrapy setting
+
+'''
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT_DIR)
+
+from edgar_server import create_server
+from loader import RESULTS_DIR, git_commit
+from pystock_crawler import runner
+
+
+def parse_settings(values):
+    settings = {}
+    for value in values:
+        name, sep, value = value.partition('=')
+        if not sep:
+            raise ValueError('Setting must be NAME=VALUE: %s' % name)
+        settings[name] = value
+    return settings
+
+
+def count_rows(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        # Minus the header
+        return max(0, sum(1 for line in f) - 1)
+
+
+def run(server, settings, filings=None):
+    '''
+    Crawl the corpus and return the stats. `filings` is the number of filings
+    crawled, counted by the server if not given (reports from the cache are
+    not requested).
+
+    '''
+    symbols = sorted(server.archive.companies)
+    tmp_dir = tempfile.mkdtemp()
+    output = os.path.join(tmp_dir, 'reports.csv')
+    settings = dict({
+        'FEED_URI': output,
+        'FEED_FORMAT': 'csv',
+        'HTTPCACHE_ENABLED': False
+    }, **settings)
+
+    # Spider requests go to the server as a proxy
+    os.environ['http_proxy'] = server.url
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'pystock_crawler.settings')
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    try:
+        exit_code = runner.crawl_in_child('edgar', {'symbols': ','.join(symbols)}, settings)
+        elapsed = time.time() - start
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        items = count_rows(output)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if filings is None:
+        filings = server.counts['reports']
+    cpu_time = (child_usage.ru_utime - usage.ru_utime) + (child_usage.ru_stime - usage.ru_stime)
+    return {
+        'exit_code': exit_code,
+        'symbols': len(symbols),
+        'filings': filings,
+        'items': items,
+        'time': elapsed,
+        'cpu_time': cpu_time,
+        'filings_per_second': filings / elapsed if elapsed else 0.0,
+        'cpu_per_filing': cpu_time / filings if filings else None,
+        # In KB on Linux
+        'peak_rss': child_usage.ru_maxrss * 1024,
+        'server': dict(server.counts)
+    }
+
+
+def print_result(result):
+    stats = result['stats']
+    print 'Symbols: %d' % stats['symbols']
+    print 'Filings: %d (%d items)' % (stats['filings'], stats['items'])
+    print 'Requests: %d (%d errors, %d not modified, %d not found)' % (
+        stats['server'].get('requests', 0), stats['server'].get('errors', 0),
+        stats['server'].get('not_modified', 0), stats['server'].get('not_found', 0))
+    print 'Time: %.2f s' % stats['time']
+    print 'Filings/second: %.2f' % stats['filings_per_second']
+    if stats['cpu_per_filing'] is not None:
+        print 'CPU per filing: %.1f ms' % (stats['cpu_per_filing'] * 1000)
+    print 'Peak memory: %.1f MB' % (stats['peak_rss'] / 1048576.0)
+
+
+def main():
+    args = docopt(__doc__)
+    settings = parse_settings(args['-s'])
+
+    server = create_server(args, port=0)
+    if not server.archive.companies:
+        sys.stderr.write('No XML reports in %s\n' % server.archive.corpus_dir)
+        sys.exit(1)
+    server.start()
+
+    commit = git_commit()
+    output = args['-o'] or os.path.join(RESULTS_DIR, 'edgar-%s.json' % commit)
+
+    if args['--cache']:
+        cache_dir = tempfile.mkdtemp()
+        settings = dict(settings, HTTPCACHE_ENABLED=True, HTTPCACHE_DIR=cache_dir)
+        try:
+            # Fill the cache
+            uncached_stats = run(server, settings)
+            server.counts.clear()
+            stats = run(server, settings, uncached_stats['filings'])
+        finally:
+            shutil.rmtree(cache_dir)
+    else:
+        uncached_stats = None
+        stats = run(server, settings)
+    server.shutdown()
+
+    result = {
+        'commit': commit,
+        'corpus': server.archive.corpus_dir,
+        'server': {
+            'latency': server.latency,
+            'jitter': server.jitter,
+            'bandwidth': server.bandwidth,
+            'error_rate': server.error_rate,
+            'error_codes': server.error_codes
+        },
+        'settings': settings,
+        'stats': stats
+    }
+    if uncached_stats:
+        result['uncached_stats'] = uncached_stats
+    print_result(result)
+
+    dir_path = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print 'Saved to %s' % output
+
+
+if __name__ == '__main__':
+    main()
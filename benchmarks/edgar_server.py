@@ -0,0 +1,335 @@
+'''
+A local stand-in for EDGAR, to crawl with edgar spider without the network.
+
+It serves a corpus of XBRL reports laid out by URL path, like the sample data
+downloaded by the loader tests, e.g.:
+
+    CORPUS/Archives/edgar/data/1288776/000128877613000055/goog-20130630.xml
+
+A report belongs to the company named by its file name (GOOG above). Filing
+lists (/cgi-bin/browse-edgar?CIK=GOOG&datea=...&dateb=...), filing index
+pages (-index.htm) and directory listings (index.json) are generated from the
+reports, unless a recorded page is in the corpus:
+
+    CORPUS/cgi-bin/browse-edgar/GOOG.htm
+    CORPUS/Archives/edgar/data/1288776/000128877613000055/0001288776-13-000055-index.htm
+    CORPUS/Archives/edgar/data/1288776/000128877613000055/index.json
+
+The server is an HTTP proxy as well, so the spider's sec.gov URLs reach it
+with http_proxy set:
+
+    python benchmarks/edgar_server.py -p 8000 &
+    http_proxy=http://127.0.0.1:8000 pystock-crawler reports GOOG,KO -o out.csv
+
+Latency, bandwidth and error responses can be added to see how the throttle
+and the spider behave on a slow or overloaded server.
+
+Pages have Last-Modified (the modification time of the file, or of the newest
+report for generated pages) and ETag headers, and conditional requests are
+answered with 304, so the HTTP cache of the spider works as it does on EDGAR.
+
+Usage:
+  edgar_server.py [-c CORPUS] [-p PORT] [--latency MS] [--jitter MS]
+                  [--bandwidth KBPS] [--error-rate RATE] [--error-codes CODES]
+                  [--seed SEED]
+  edgar_server.py (-h | --help)
+
+Options:
+  -h --help            Show this screen
+  -c CORPUS            Directory of XML reports [default: ]
+  -p PORT              Port to listen on [default: 8000]
+  --latency MS         Delay before every response in ms [default: 0]
+  --jitter MS          Random delay added to the latency, up to MS [default: 0]
+  --bandwidth KBPS     Send responses at KBPS KB/s, 0 is unlimited [default: 0]
+  --error-rate RATE    Fraction of requests answered with an error [default: 0]
+  --error-codes CODES  Comma-separated status codes of errors [default: 503]
+  --seed SEED          Seed of the random latency and errors [default: 0]
+
+'''
+import email.utils
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import Counter, defaultdict
+from SocketServer import ThreadingMixIn
+from docopt import docopt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT_DIR)
+
+from pystock_crawler.tests.base import SAMPLE_DATA_DIR
+
+
+RE_REPORT_NAME = re.compile(r'^([A-Za-z]+)\-(\d{8})\.xml$')
+
+CONTENT_TYPES = {
+    '.htm': 'text/html',
+    '.html': 'text/html',
+    '.json': 'application/json',
+    '.xml': 'application/xml'
+}
+
+
+class Filing(object):
+
+    def __init__(self, dir_path, url_path, reports):
+        self.dir_path = dir_path
+        self.url_path = url_path
+        self.reports = reports
+
+        # Reports of a filing have the same date
+        self.date = RE_REPORT_NAME.match(reports[0]).group(2)
+
+    @property
+    def index_url(self):
+        return '%s/%s-index.htm' % (self.url_path, os.path.basename(self.url_path))
+
+
+class EdgarArchive(object):
+    '''Filings of every company in a corpus directory.'''
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = os.path.abspath(corpus_dir)
+        self.companies = defaultdict(list)
+        self.filings = {}
+        self.last_modified = 0
+
+        for dir_path, dir_names, filenames in os.walk(self.corpus_dir):
+            reports = sorted(f for f in filenames if RE_REPORT_NAME.match(f))
+            if not reports:
+                continue
+            url_path = '/' + os.path.relpath(dir_path, self.corpus_dir).replace(os.sep, '/')
+            for name in reports:
+                self.last_modified = max(self.last_modified, os.path.getmtime(os.path.join(dir_path, name)))
+            filing = Filing(dir_path, url_path, reports)
+            self.filings[url_path] = filing
+
+            company = RE_REPORT_NAME.match(reports[0]).group(1).upper()
+            self.companies[company].append(filing)
+
+        for filings in self.companies.itervalues():
+            filings.sort(key=lambda f: f.date, reverse=True)
+
+    @property
+    def num_reports(self):
+        return sum(len(filing.reports) for filing in self.filings.itervalues())
+
+    def local_path(self, url_path):
+        path = os.path.normpath(os.path.join(self.corpus_dir, url_path.lstrip('/')))
+        if path.startswith(self.corpus_dir + os.sep) and os.path.isfile(path):
+            return path
+        return None
+
+    def filing_list(self, symbol, start_date='', end_date=''):
+        '''HTML list of the filings of `symbol` between the dates, newest first.'''
+        links = []
+        for filing in self.companies.get(symbol.upper(), []):
+            if (start_date and filing.date < start_date) or (end_date and filing.date > end_date):
+                continue
+            links.append('<tr><td>10-Q</td><td><a href="%s" id="documentsbutton">Documents</a></td>'
+                         '<td>%s</td></tr>' % (filing.index_url, filing.date))
+        return '<html><body><table class="tableFile2">%s</table></body></html>' % ''.join(links)
+
+    def filing_index(self, url_path):
+        '''HTML index page of a filing, or None if there's no such filing.'''
+        filing = self.filings.get(url_path.rsplit('/', 1)[0])
+        if filing is None or url_path != filing.index_url:
+            return None
+        links = ['<tr><td><a href="%s/%s">%s</a></td></tr>' % (filing.url_path, name, name)
+                 for name in filing.reports]
+        return '<html><body><table class="tableFile">%s</table></body></html>' % ''.join(links)
+
+    def directory_listing(self, url_path):
+        '''Directory listing (index.json) of a filing, or None if there's no such filing.'''
+        filing = self.filings.get(url_path.rsplit('/', 1)[0])
+        if filing is None or not url_path.endswith('/index.json'):
+            return None
+        names = [os.path.basename(filing.index_url)] + filing.reports
+        return json.dumps({
+            'directory': {
+                'name': filing.url_path,
+                'item': [{'name': name, 'type': 'text.gif'} for name in names]
+            }
+        })
+
+
+class EdgarRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse.urlparse(self.path)
+        server.count('requests')
+
+        delay = server.latency
+        if server.jitter:
+            delay += server.random('uniform', 0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if server.error_rate and server.random('random') < server.error_rate:
+            status = server.random('choice', server.error_codes)
+            server.count('errors')
+            self.send_body(status, 'text/html', '<html><body>Error %d</body></html>' % status)
+            return
+
+        if url.path == '/cgi-bin/browse-edgar':
+            query = urlparse.parse_qs(url.query)
+            symbol = query.get('CIK', [''])[0]
+            recorded = server.archive.local_path('/cgi-bin/browse-edgar/%s.htm' % symbol.upper())
+            if recorded:
+                self.send_file(recorded)
+            else:
+                body = server.archive.filing_list(symbol, query.get('datea', [''])[0],
+                                                  query.get('dateb', [''])[0])
+                self.send_page('text/html', body, server.archive.last_modified)
+            return
+
+        local_path = server.archive.local_path(url.path)
+        if local_path:
+            self.send_file(local_path)
+            return
+
+        body = server.archive.filing_index(url.path)
+        if body is not None:
+            self.send_page('text/html', body, server.archive.last_modified)
+            return
+
+        body = server.archive.directory_listing(url.path)
+        if body is not None:
+            self.send_page('application/json', body, server.archive.last_modified)
+            return
+
+        server.count('not_found')
+        self.send_body(404, 'text/html', '<html><body>Not Found</body></html>')
+
+    def send_file(self, path):
+        content_type = CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        with open(path, 'rb') as f:
+            body = f.read()
+        if content_type == 'application/xml':
+            self.server.count('reports')
+        self.send_page(content_type, body, os.path.getmtime(path))
+
+    def send_page(self, content_type, body, last_modified):
+        '''Send a 200 response with validators, or 304 if the client has it.'''
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = {'Last-Modified': email.utils.formatdate(last_modified, usegmt=True), 'ETag': etag}
+        if self.is_not_modified(int(last_modified), etag):
+            self.server.count('not_modified')
+            self.send_body(304, None, '', headers)
+        else:
+            self.send_body(200, content_type, body, headers)
+
+    def is_not_modified(self, last_modified, etag):
+        if_none_match = self.headers.getheader('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match == '*'
+
+        if_modified_since = self.headers.getheader('If-Modified-Since')
+        if if_modified_since:
+            date = email.utils.parsedate_tz(if_modified_since)
+            return date is not None and last_modified <= email.utils.mktime_tz(date)
+        return False
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in sorted((headers or {}).iteritems()):
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+
+        # Send a tenth of a second's worth of data at a time
+        chunk_size = max(1, int(bandwidth / 10))
+        for i in xrange(0, len(body), chunk_size):
+            self.wfile.write(body[i:i + chunk_size])
+            time.sleep(0.1)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EdgarServer(ThreadingMixIn, HTTPServer):
+    '''
+    Serve an EdgarArchive. `latency` and `jitter` are in seconds, `bandwidth`
+    in bytes per second. `counts` has the numbers of requests, errors, reports,
+    not modified and not found responses served.
+
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, archive, latency=0.0, jitter=0.0, bandwidth=0, error_rate=0.0,
+                 error_codes=(503,), seed=0):
+        HTTPServer.__init__(self, address, EdgarRequestHandler)
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def random(self, method, *args):
+        with self._lock:
+            return getattr(self._random, method)(*args)
+
+    def start(self):
+        '''Serve in a daemon thread.'''
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def create_server(args, port=None):
+    '''Create an EdgarServer from command line `args` (see the usage).'''
+    archive = EdgarArchive(args['-c'] or SAMPLE_DATA_DIR)
+    return EdgarServer(('127.0.0.1', int(args['-p'] if port is None else port)), archive,
+                       latency=float(args['--latency']) / 1000,
+                       jitter=float(args['--jitter']) / 1000,
+                       bandwidth=float(args['--bandwidth']) * 1024,
+                       error_rate=float(args['--error-rate']),
+                       error_codes=[int(c) for c in args['--error-codes'].split(',')],
+                       seed=int(args['--seed']))
+
+
+def main():
+    args = docopt(__doc__)
+    server = create_server(args)
+    archive = server.archive
+    print 'Serving %d reports of %d companies from %s at %s' % (archive.num_reports, len(archive.companies),
+                                                              archive.corpus_dir, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print dict(server.counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+Compare the speed of SgmlLinkExtractor and HrefLinkExtractor with the rules
+of edgar spider.
+
+Pages are read from a directory of recorded EDGAR pages (.htm files) if given,
+otherwise a filing list like EDGAR's is generated.
+
+Usage:
+  link_extractors.py [-c PAGES] [-n REPEAT] [-r ROWS]
+  link_extractors.py (-h | --help)
+
+Options:
+  -h --help  Show this screen
+  -c PAGES   Directory of recorded HTML pages [default: ]
+  -n REPEAT  Number of times to extract links from each page [default: 20]
+  -r ROWS    Number of filings in the generated filing list [default: 300]
+
+'''
+import os
+import sys
+import time
+
+from docopt import docopt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT_DIR)
+
+from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+from scrapy.http import HtmlResponse
+
+from pystock_crawler.linkextractors import HrefLinkExtractor
+from pystock_crawler.spiders.edgar import REPORT_URL_PATTERN
+
+
+ALLOWS = (('/Archives/edgar/data/[^\"]+\-index\.htm',), (REPORT_URL_PATTERN,))
+
+ROW = '''
+<tr>
+<td nowrap="nowrap">10-Q</td>
+<td nowrap="nowrap"><a href="/Archives/edgar/data/1288776/%(acc)s/%(acc_dashes)s-index.htm" id="documentsbutton">&nbsp;Documents</a>&nbsp; <a href="/cgi-bin/viewer?action=view&amp;cik=1288776&amp;accession_number=%(acc_dashes)s&amp;xbrl_type=v" id="interactiveDataBtn">&nbsp;Interactive Data</a></td>
+<td class="small">Quarterly report [Sections 13 or 15(d)]<br />Acc-no: %(acc_dashes)s&nbsp;(34 Act)&nbsp; Size: 13 MB</td>
+<td>2013-07-25</td>
+<td nowrap="nowrap"><a href="/cgi-bin/browse-edgar?action=getcompany&amp;filenum=000-50726&amp;owner=exclude&amp;count=40">000-50726</a><br>13986433</td>
+</tr>
+'''
+
+
+def filing_list(rows):
+    body = []
+    for i in xrange(rows):
+        acc = '000128877613%06d' % i
+        body.append(ROW % {'acc': acc, 'acc_dashes': '%s-%s-%s' % (acc[:10], acc[10:12], acc[12:])})
+    return '<html><body><table class="tableFile2">%s</table></body></html>' % ''.join(body)
+
+
+def load_pages(pages_dir, rows):
+    if not pages_dir:
+        return [HtmlResponse('http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=GOOG',
+                             body=filing_list(rows))]
+    responses = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith('.htm'):
+            with open(os.path.join(pages_dir, filename), 'rb') as f:
+                url = 'http://www.sec.gov/Archives/edgar/data/%s' % filename
+                responses.append(HtmlResponse(url, body=f.read()))
+    return responses
+
+
+def measure(extractor_class, responses, repeat):
+    extractors = [extractor_class(allow=allow) for allow in ALLOWS]
+    times = []
+    for i in xrange(repeat):
+        # New responses, so nothing cached from the last round is reused
+        copies = [r.replace() for r in responses]
+        start = time.time()
+        urls = [[link.url for link in e.extract_links(r)] for r in copies for e in extractors]
+        times.append(time.time() - start)
+    return min(times), urls
+
+
+def main():
+    args = docopt(__doc__)
+    responses = load_pages(args['-c'], int(args['-r']))
+    repeat = max(1, int(args['-n']))
+
+    sgml_time, sgml_urls = measure(SgmlLinkExtractor, responses, repeat)
+    href_time, href_urls = measure(HrefLinkExtractor, responses, repeat)
+
+    print 'Pages: %d (%.1f KB)' % (len(responses), sum(len(r.body) for r in responses) / 1024.0)
+    print 'Links: %d' % sum(len(urls) for urls in href_urls)
+    print 'SgmlLinkExtractor: %8.2f ms' % (sgml_time * 1000)
+    print 'HrefLinkExtractor: %8.2f ms (%.1fx)' % (href_time * 1000, sgml_time / href_time)
+    if sgml_urls != href_urls:
+        print 'Links are different!'
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
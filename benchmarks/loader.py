@@ -0,0 +1,329 @@
+'''
+Benchmark ReportItemLoader over a local corpus of XBRL reports.
+
+Every report is parsed in a child process, so its peak memory is measured on
+its own. The report is parsed REPEAT times for the parse time (the fastest is
+taken), and once more with instrumentation for the time spent in each field
+(its XPaths and processors, see LoaderStats), the number of XPath queries and
+evaluations, and the number of XPaths compiled. Compiled XPaths are reused
+across documents, so after the first parse, compiles should be 0.
+
+The default corpus is the sample data downloaded by the loader tests. Run
+them once to fill it:
+
+    py.test pystock_crawler/tests/test_loaders.py
+
+A report that fails to parse (or kills its child process) is reported and left
+out of the result. Results are saved as JSON to
+benchmarks/results/loader-<commit>.json by default. Compare two commits with --compare:
+
+    python benchmarks/loader.py --compare benchmarks/results/loader-abc1234.json
+
+Usage:
+  loader.py [-c CORPUS] [-o RESULT] [-n REPEAT] [--compare BASE]
+  loader.py (-h | --help)
+
+Options:
+  -h --help       Show this screen
+  -c CORPUS       Directory of XML reports [default: ]
+  -o RESULT       File to save the result to [default: ]
+  -n REPEAT       Number of times to parse each report [default: 3]
+  --compare BASE  Saved result to compare with
+
+'''
+import hashlib
+import json
+import multiprocessing
+import os
+import Queue
+import resource
+import subprocess
+import sys
+import time
+import traceback
+
+from collections import defaultdict
+from contextlib import contextmanager
+from docopt import docopt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT_DIR)
+
+from scrapy.http.response.xml import XmlResponse
+from scrapy.selector import Selector
+
+from pystock_crawler import loaders
+from pystock_crawler.loaders import ReportItemLoader, XmlXPathItemLoader
+from pystock_crawler.tests.base import SAMPLE_DATA_DIR
+
+
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+
+def find_reports(corpus_dir):
+    paths = []
+    for dir_path, dir_names, filenames in os.walk(corpus_dir):
+        for filename in filenames:
+            if filename.endswith('.xml'):
+                paths.append(os.path.join(dir_path, filename))
+    return sorted(paths)
+
+
+def sha1_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def max_rss():
+    # In KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def parse(path, body, instrument=False):
+    response = XmlResponse('file://%s' % path, body=body)
+    loader = ReportItemLoader(response=response, instrument=instrument)
+    loader.load_item()
+    return loader
+
+
+@contextmanager
+def count_queries(stats):
+    '''
+    Count XPath queries of the loader, XPaths evaluated (through
+    loaders.select_xpath() or Selector.xpath()) and XPaths compiled (misses
+    of the compiled XPath cache) while in this context. `stats` is updated in
+    place.
+
+    '''
+    orig_select = XmlXPathItemLoader._select
+    orig_select_xpath = loaders.select_xpath
+    orig_compile_xpath = loaders.compile_xpath
+    orig_xpath = Selector.xpath
+
+    # select_xpath() falls back to Selector.xpath(), which is counted once
+    in_select_xpath = [False]
+
+    def _select(self, xpath):
+        stats['loader_queries'] += 1
+        return orig_select(self, xpath)
+
+    def select_xpath(selector, xpath):
+        stats['xpath_evaluations'] += 1
+        in_select_xpath[0] = True
+        try:
+            return orig_select_xpath(selector, xpath)
+        finally:
+            in_select_xpath[0] = False
+
+    def compile_xpath(xpath, namespaces):
+        size = len(loaders._compiled_xpaths)
+        compiled = orig_compile_xpath(xpath, namespaces)
+        if len(loaders._compiled_xpaths) != size:
+            stats['xpath_compiles'] += 1
+        return compiled
+
+    def xpath(self, query):
+        if not in_select_xpath[0]:
+            stats['xpath_evaluations'] += 1
+        return orig_xpath(self, query)
+
+    stats['loader_queries'] = 0
+    stats['xpath_evaluations'] = 0
+    stats['xpath_compiles'] = 0
+
+    XmlXPathItemLoader._select = _select
+    loaders.select_xpath = select_xpath
+    loaders.compile_xpath = compile_xpath
+    Selector.xpath = xpath
+    try:
+        yield stats
+    finally:
+        XmlXPathItemLoader._select = orig_select
+        loaders.select_xpath = orig_select_xpath
+        loaders.compile_xpath = orig_compile_xpath
+        Selector.xpath = orig_xpath
+
+
+def measure(path, repeat, queue):
+    try:
+        queue.put(_measure(path, repeat))
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+
+
+def _measure(path, repeat):
+    with open(path, 'rb') as f:
+        body = f.read()
+
+    rss = max_rss()
+    start = time.time()
+    parse(path, body)
+    times = [time.time() - start]
+    peak_rss = max_rss() - rss
+
+    for i in xrange(repeat - 1):
+        start = time.time()
+        parse(path, body)
+        times.append(time.time() - start)
+
+    stats = {}
+    with count_queries(stats):
+        loader = parse(path, body, instrument=True)
+    stats['fields'] = dict(loader.loader_stats.fields)
+
+    stats.update({
+        'time': min(times),
+        'peak_rss': peak_rss * 1024
+    })
+    return stats
+
+
+def measure_in_child(path, repeat):
+    '''Run `measure()` in a child process. Return its stats or {'error': ...}.'''
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(path, repeat, queue))
+    process.start()
+
+    # Don't wait forever if the child dies without putting anything, e.g.,
+    # killed by the OOM killer
+    stats = None
+    while stats is None:
+        try:
+            stats = queue.get(timeout=1)
+        except Queue.Empty:
+            if not process.is_alive():
+                try:
+                    stats = queue.get_nowait()
+                except Queue.Empty:
+                    stats = {'error': 'Child process exited with code %s' % process.exitcode}
+    process.join()
+    return stats
+
+
+def run(corpus_dir, repeat):
+    results = {}
+    errors = {}
+    for path in find_reports(corpus_dir):
+        name = os.path.relpath(path, corpus_dir)
+        stats = measure_in_child(path, repeat)
+        if 'error' in stats:
+            errors[name] = stats['error']
+            print_error(name, stats['error'])
+            continue
+
+        stats.update({
+            'sha1': sha1_file(path),
+            'size': os.path.getsize(path)
+        })
+        results[name] = stats
+        print_report(name, stats)
+    return results, errors
+
+
+def print_header():
+    print '%-60s %9s %9s %9s %8s %8s %8s' % ('Report', 'KB', 'ms', 'Peak MB', 'Queries', 'XPaths',
+                                             'Compiles')
+
+
+def print_report(name, stats):
+    print '%-60s %9.1f %9.1f %9.1f %8d %8d %8d' % (name[-60:], stats['size'] / 1024.0, stats['time'] * 1000,
+                                                  stats['peak_rss'] / 1048576.0, stats['loader_queries'],
+                                                  stats['xpath_evaluations'], stats['xpath_compiles'])
+
+
+def print_error(name, error):
+    print '%-60s %s' % (name[-60:], 'ERROR')
+    sys.stderr.write('Failed to measure %s:\n%s\n' % (name, error))
+
+
+def print_summary(result):
+    reports = result['reports']
+    field_times = defaultdict(float)
+    for stats in reports.itervalues():
+        for field, seconds in stats['fields'].iteritems():
+            field_times[field] += seconds
+
+    print
+    print 'Time of each field (ms):'
+    for field, seconds in sorted(field_times.iteritems(), key=lambda a: -a[1]):
+        print '  %-20s %9.1f' % (field, seconds * 1000)
+
+    print
+    print 'Reports: %d' % len(reports)
+    if result['errors']:
+        print 'Failed reports: %d' % len(result['errors'])
+    print 'Total parse time: %.1f ms' % (result['total_time'] * 1000)
+    print 'Max peak memory: %.1f MB' % (max([s['peak_rss'] for s in reports.itervalues()] or [0]) / 1048576.0)
+
+
+def compare(result, base):
+    print
+    print 'Compared with %s:' % base['commit']
+    print '%-60s %9s %9s %8s' % ('Report', 'Base ms', 'ms', 'Change')
+
+    base_total = 0.0
+    total = 0.0
+    for name, stats in sorted(result['reports'].iteritems()):
+        base_stats = base['reports'].get(name)
+        if not base_stats or base_stats['sha1'] != stats['sha1']:
+            # Not the same report, can't compare
+            continue
+        base_total += base_stats['time']
+        total += stats['time']
+        print '%-60s %9.1f %9.1f %+7.1f%%' % (name[-60:], base_stats['time'] * 1000, stats['time'] * 1000,
+                                             (stats['time'] / base_stats['time'] - 1) * 100)
+
+    if base_total:
+        print '%-60s %9.1f %9.1f %+7.1f%%' % ('Total', base_total * 1000, total * 1000,
+                                             (total / base_total - 1) * 100)
+
+
+def main():
+    args = docopt(__doc__)
+
+    corpus_dir = os.path.abspath(args['-c'] or SAMPLE_DATA_DIR)
+    repeat = max(1, int(args['-n']))
+
+    commit = git_commit()
+    output = args['-o'] or os.path.join(RESULTS_DIR, 'loader-%s.json' % commit)
+
+    print_header()
+    reports, errors = run(corpus_dir, repeat)
+    if not reports and not errors:
+        sys.stderr.write('No XML reports in %s\n' % corpus_dir)
+        sys.exit(1)
+
+    result = {
+        'commit': commit,
+        'corpus': corpus_dir,
+        'repeat': repeat,
+        'total_time': sum(stats['time'] for stats in reports.itervalues()),
+        'reports': reports,
+        'errors': errors
+    }
+    print_summary(result)
+
+    dir_path = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print 'Saved to %s' % output
+
+    if args['--compare']:
+        with open(args['--compare']) as f:
+            compare(result, json.load(f))
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Compare memory and export time of PriceItem and PriceRecord.
+
+Each item class is measured in a child process, which creates COUNT items of
+a price row, keeps them alive and reports the increase of its max RSS. Then
+the items are exported with CsvItemExporter2.
+
+Run from the root directory of the repository:
+
+    python benchmarks/price_items.py [COUNT]
+
+'''
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from pystock_crawler.items import PriceItem, PriceRecord
+
+
+ROW = (
+    ('symbol', 'GOOG'),
+    ('date', '2013-11-22'),
+    ('open', 121.58),
+    ('high', 122.75),
+    ('low', 117.93),
+    ('close', 121.38),
+    ('volume', 11096700),
+    ('adj_close', 121.38)
+)
+
+
+def max_rss():
+    # In KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(item_class, count, queue):
+    from pystock_crawler.exporters import CsvItemExporter2
+
+    rss = max_rss()
+    start = time.time()
+    items = [item_class(ROW) for i in xrange(count)]
+    create_time = time.time() - start
+    rss = max_rss() - rss
+
+    with open(os.devnull, 'wb') as f:
+        exporter = CsvItemExporter2(f)
+        exporter.start_exporting()
+        start = time.time()
+        for item in items:
+            exporter.export_item(item)
+        export_time = time.time() - start
+        exporter.finish_exporting()
+
+    queue.put((rss, create_time, export_time))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print 'Items: %d' % count
+    print '%-12s %12s %14s %12s %12s' % ('Class', 'RSS (MB)', 'Bytes/item', 'Create (s)', 'Export (s)')
+
+    for item_class in (PriceItem, PriceRecord):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(item_class, count, queue))
+        process.start()
+        rss, create_time, export_time = queue.get()
+        process.join()
+        print '%-12s %12.1f %14.1f %12.2f %12.2f' % (item_class.__name__, rss / 1024.0,
+                                                     rss * 1024.0 / count, create_time,
+                                                     export_time)
+
+
+if __name__ == '__main__':
+    main()
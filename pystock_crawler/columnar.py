@@ -0,0 +1,278 @@
+'''
+A binary file format of typed columns, so prices and reports can be loaded
+without parsing CSV.
+
+Layout (all numbers are little-endian)::
+
+    MAGIC
+    chunk 1: column 1 block, column 2 block, ...
+    chunk 2: ...
+    footer (JSON)
+    footer length (uint64)
+    MAGIC
+
+The footer has the column names and types, and the offset, length and number
+of rows of every block. Offsets are relative to the first MAGIC. Column types:
+
+* ``date``: int32, days since 1970-01-01, ``NULL_INT32`` if missing
+* ``float64``: NaN if missing
+* ``int64``: ``NULL_INT64`` if missing
+* ``bool``: int8, 0 or 1, -1 if missing
+* ``string``: uint32 row count, uint32 end offsets of the rows, UTF-8 data
+
+'''
+import json
+import math
+import mmap
+import struct
+
+from datetime import date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAGIC = 'PSCOL1\n\x00'
+
+DEFAULT_CHUNK_SIZE = 65536
+
+NULL_INT32 = -2 ** 31
+NULL_INT64 = -2 ** 63
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+NUMPY_DTYPES = {
+    'date': '<i4',
+    'float64': '<f8',
+    'int64': '<i8',
+    'bool': '<i1'
+}
+
+STRUCT_CODES = {
+    'date': 'i',
+    'float64': 'd',
+    'int64': 'q',
+    'bool': 'b'
+}
+
+
+def to_date(value):
+    if not value:
+        return NULL_INT32
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH_ORDINAL
+    try:
+        # Faster than strptime()
+        return date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal() - EPOCH_ORDINAL
+    except ValueError:
+        return NULL_INT32
+
+
+def to_float64(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def to_int64(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return NULL_INT64
+
+
+def to_bool(value):
+    if value is None or value == '':
+        return -1
+    if isinstance(value, basestring):
+        return 1 if value.lower() == 'true' else 0
+    return 1 if value else 0
+
+
+CONVERTERS = {
+    'date': to_date,
+    'float64': to_float64,
+    'int64': to_int64,
+    'bool': to_bool
+}
+
+
+def encode_column(column_type, values):
+    '''Encode a list of values to a column block.'''
+    if column_type == 'string':
+        data = []
+        ends = []
+        end = 0
+        for value in values:
+            if value is None:
+                value = ''
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            else:
+                value = str(value)
+            data.append(value)
+            end += len(value)
+            ends.append(end)
+        return struct.pack('<I%dI' % len(ends), len(ends), *ends) + ''.join(data)
+
+    convert = CONVERTERS[column_type]
+    code = STRUCT_CODES[column_type]
+    return struct.pack('<%d%s' % (len(values), code), *[convert(v) for v in values])
+
+
+def decode_column(column_type, buf, offset, length):
+    '''
+    Decode a column block. Return a NumPy array if NumPy is available,
+    otherwise a tuple. Strings are always returned in a list. The values are
+    copied out of `buf`, so they can still be used after it's closed.
+
+    '''
+    if column_type == 'string':
+        count = struct.unpack_from('<I', buf, offset)[0]
+        ends = struct.unpack_from('<%dI' % count, buf, offset + 4)
+        start = offset + 4 + count * 4
+        values = []
+        prev = 0
+        for end in ends:
+            values.append(buf[start + prev:start + end].decode('utf-8'))
+            prev = end
+        return values
+
+    if numpy is not None:
+        dtype = numpy.dtype(NUMPY_DTYPES[column_type])
+        # A view into an mmap would crash on access once the mmap is closed
+        return numpy.frombuffer(buf, dtype, length // dtype.itemsize, offset).copy()
+
+    code = STRUCT_CODES[column_type]
+    count = length // struct.calcsize('<' + code)
+    return struct.unpack_from('<%d%s' % (count, code), buf, offset)
+
+
+class ColumnWriter(object):
+    '''
+    Write rows to a file object in columnar format. `columns` is a list of
+    (name, type) tuples. Rows are buffered and written `chunk_size` rows a
+    chunk. Call `close()` to write the footer.
+
+    '''
+    def __init__(self, file, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.file = file
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.offset = 0
+        self._values = [[] for c in self.columns]
+        self._write(MAGIC)
+
+    def write_row(self, row):
+        for values, value in zip(self._values, row):
+            values.append(value)
+        if len(self._values[0]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        num_rows = len(self._values[0]) if self._values else 0
+        if not num_rows:
+            return
+
+        blocks = []
+        for (name, column_type), values in zip(self.columns, self._values):
+            data = encode_column(column_type, values)
+            blocks.append([self.offset, len(data)])
+            self._write(data)
+
+        self.chunks.append({'rows': num_rows, 'blocks': blocks})
+        self._values = [[] for c in self.columns]
+
+    def close(self):
+        self.flush()
+        footer = json.dumps({
+            'columns': [{'name': name, 'type': column_type} for name, column_type in self.columns],
+            'chunks': self.chunks,
+            'length': self.offset
+        })
+        self._write(footer)
+        self._write(struct.pack('<Q', len(footer)))
+        self._write(MAGIC)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+
+class ColumnReader(object):
+    '''
+    Read a columnar file through mmap, so a column can be read without
+    reading the whole file.
+
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        size = len(self.buf)
+        tail = len(MAGIC) + 8
+        if size < tail * 2 or self.buf[size - len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError('Not a columnar file: %s' % path)
+
+        footer_length = struct.unpack_from('<Q', self.buf, size - tail)[0]
+        footer_start = size - tail - footer_length
+        footer = json.loads(self.buf[footer_start:footer_start + footer_length])
+
+        # The file may have something before the first MAGIC
+        self.base = footer_start - footer['length']
+        self.columns = [(c['name'], c['type']) for c in footer['columns']]
+        self.chunks = footer['chunks']
+        self.num_rows = sum(chunk['rows'] for chunk in self.chunks)
+
+    def close(self):
+        self.buf.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def names(self):
+        return [name for name, column_type in self.columns]
+
+    def read_chunk(self, index, name):
+        '''Read a column of a chunk.'''
+        i = self.names.index(name)
+        column_type = self.columns[i][1]
+        offset, length = self.chunks[index]['blocks'][i]
+        return decode_column(column_type, self.buf, self.base + offset, length)
+
+    def read_column(self, name):
+        '''Read a whole column.'''
+        parts = [self.read_chunk(i, name) for i in xrange(len(self.chunks))]
+        if self.columns[self.names.index(name)][1] == 'string':
+            return [value for part in parts for value in part]
+        if numpy is not None:
+            if not parts:
+                return numpy.array([], NUMPY_DTYPES[self.columns[self.names.index(name)][1]])
+            return parts[0] if len(parts) == 1 else numpy.concatenate(parts)
+        return tuple(value for part in parts for value in part)
+
+
+def is_null(value, column_type):
+    '''Return True if `value` read from a column of `column_type` is missing.'''
+    if column_type == 'float64':
+        return math.isnan(value)
+    if column_type == 'date':
+        return value == NULL_INT32
+    if column_type == 'int64':
+        return value == NULL_INT64
+    if column_type == 'bool':
+        return value == -1
+    return False
@@ -1,6 +1,9 @@
 from scrapy.conf import settings
 from scrapy.contrib.exporter import BaseItemExporter, CsvItemExporter
 
+from pystock_crawler.columnar import ColumnWriter
+from pystock_crawler.items import PriceItem, PriceSeriesItem
+
 
 class CsvItemExporter2(CsvItemExporter):
     '''
@@ -17,6 +20,21 @@ class CsvItemExporter2(CsvItemExporter):
 
         super(CsvItemExporter2, self).__init__(*args, **kwargs)
 
+    def export_item(self, item):
+        if isinstance(item, PriceSeriesItem):
+            self._export_price_series(item)
+        else:
+            super(CsvItemExporter2, self).export_item(item)
+
+    def _export_price_series(self, item):
+        if self._headers_not_written:
+            self._headers_not_written = False
+            self._write_headers_and_set_fields_to_export(PriceItem())
+
+        # Write all the rows at once, without an item for each of them
+        fields = self.fields_to_export or PriceItem.fields.keys()
+        self.csv_writer.writerows(item.rows(fields, default=''))
+
     def _write_headers_and_set_fields_to_export(self, item):
         # HACK: Override this private method to filter fields that are in
         # fields_to_export but not in item
@@ -37,3 +55,58 @@ class SymbolListExporter(BaseItemExporter):
 
     def export_item(self, item):
         self.file.write('%s\t%s\n' % (item['symbol'], item['name']))
+
+
+# Column types of the fields that are not float64
+COLUMN_TYPES = {
+    'symbol': 'string',
+    'name': 'string',
+    'date': 'date',
+    'end_date': 'date',
+    'volume': 'int64',
+    'fiscal_year': 'int64',
+    'amend': 'bool',
+    'doc_type': 'string',
+    'period_focus': 'string'
+}
+
+
+class ColumnarItemExporter(BaseItemExporter):
+    '''
+    Export items to typed columns. See pystock_crawler.columnar for the file
+    format. Columns are in the order of EXPORT_FIELDS, like CsvItemExporter2.
+
+    '''
+    def __init__(self, file, **kwargs):
+        kwargs['fields_to_export'] = settings.getlist('EXPORT_FIELDS') or None
+        self._configure(kwargs, dont_fail=True)
+        self.file = file
+        self.chunk_size = settings.getint('COLUMNAR_CHUNK_SIZE')
+        self.writer = None
+
+    def export_item(self, item):
+        if isinstance(item, PriceSeriesItem):
+            self._export_price_series(item)
+            return
+
+        self._create_writer(item)
+        self.writer.write_row([item.get(name) for name in self.fields_to_export])
+
+    def _export_price_series(self, item):
+        self._create_writer(PriceItem())
+        for row in item.rows(self.fields_to_export):
+            self.writer.write_row(row)
+
+    def _create_writer(self, item):
+        if self.writer is None:
+            item_fields = item.fields.keys()
+            if self.fields_to_export:
+                self.fields_to_export = filter(lambda a: a in item_fields, self.fields_to_export)
+            else:
+                self.fields_to_export = item_fields
+            columns = [(name, COLUMN_TYPES.get(name, 'float64')) for name in self.fields_to_export]
+            self.writer = ColumnWriter(self.file, columns, self.chunk_size)
+
+    def finish_exporting(self):
+        if self.writer:
+            self.writer.close()
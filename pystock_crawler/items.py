@@ -3,7 +3,10 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/items.html
 
-from scrapy.item import Item, Field
+from itertools import izip, repeat
+from pprint import pformat
+
+from scrapy.item import BaseItem, Item, Field
 
 
 class ReportItem(Item):
@@ -59,6 +62,103 @@ class PriceItem(Item):
     volume = Field()
 
 
+class PriceRecord(BaseItem):
+    '''
+    A compact alternative to PriceItem with the same fields. The values are
+    kept in slots instead of a dict of each item, which takes a fraction of
+    the memory (see benchmarks/price_items.py). It supports the part of the
+    Item API that exporters and pipelines use: item[key], `in`, get(),
+    keys() and dict(item).
+
+    '''
+    # BaseItem has no __slots__, but __dict__ is never created because all the
+    # values are in slots
+    __slots__ = ('symbol', 'date', 'open', 'close', 'high', 'low', 'adj_close', 'volume')
+
+    fields = PriceItem.fields
+
+    def __init__(self, values=None, **kwargs):
+        if values:
+            if hasattr(values, 'iteritems'):
+                values = values.iteritems()
+            for key, value in values:
+                self[key] = value
+        for key, value in kwargs.iteritems():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError('%s does not support field: %s' % (self.__class__.__name__, key))
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.fields and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return pformat(dict(self))
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.fields else default
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    iterkeys = __iter__
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+
+class PriceSeriesItem(Item):
+    '''
+    Prices of a symbol in columns, instead of a PriceItem for every day.
+    Exporters expand it to rows of PriceItem fields.
+
+    '''
+    symbol = Field()
+
+    # Dict that maps fields of PriceItem (except symbol) to lists of values
+    columns = Field()
+
+    def num_rows(self):
+        columns = self.get('columns')
+        return len(columns.itervalues().next()) if columns else 0
+
+    def rows(self, fields, default=None):
+        '''Return an iterator of rows, each a tuple of values of `fields`.'''
+        columns = self.get('columns') or {}
+        num_rows = self.num_rows()
+        iterables = []
+        for field in fields:
+            if field == 'symbol':
+                iterables.append(repeat(self.get('symbol'), num_rows))
+            elif field in columns:
+                iterables.append(columns[field])
+            else:
+                iterables.append(repeat(default, num_rows))
+        return izip(*iterables)
+
+
 class SymbolItem(Item):
     symbol = Field()
     name = Field()
@@ -0,0 +1,84 @@
+'''
+Link extractors for EDGAR pages.
+
+SgmlLinkExtractor feeds a whole page to the pure-Python SGML parser, once for
+every rule of a CrawlSpider. EDGAR filing lists and index pages are long
+tables where the only thing we need is the href of some <a> tags, so
+HrefLinkExtractor finds them with a regular expression instead.
+
+'''
+import re
+import weakref
+
+from urlparse import urljoin
+
+from scrapy.link import Link
+from scrapy.utils.misc import arg_to_iter
+from scrapy.utils.response import get_base_url
+from scrapy.utils.url import canonicalize_url
+from w3lib.html import replace_entities
+from w3lib.url import safe_url_string
+
+
+# href of <a> and <area> tags, in double, single or no quotes
+RE_HREF = re.compile(r'''<(?:a|area)\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''',
+                     re.IGNORECASE)
+
+# URLs that safe_url_string() would change: unsafe characters, or an empty
+# query or fragment at the end
+RE_UNSAFE = re.compile(r"[^A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]|[?#]$")
+
+# Absolute URLs of the links in a response, shared by all the rules
+_urls_cache = weakref.WeakKeyDictionary()
+
+
+def extract_urls(response):
+    '''Return the absolute URLs of <a> and <area> links in `response`, in order.'''
+    urls = _urls_cache.get(response)
+    if urls is None:
+        base_url = get_base_url(response)
+        encoding = response.encoding
+        urls = []
+        for match in RE_HREF.finditer(response.body):
+            href = match.group(1) or match.group(2) or match.group(3) or ''
+            href = href.strip()
+            if '&' in href:
+                if href.count('&') == href.count('&amp;'):
+                    href = href.replace('&amp;', '&')
+                else:
+                    href = replace_entities(href, encoding=encoding).encode(encoding)
+            url = urljoin(base_url, href)
+            if RE_UNSAFE.search(url):
+                url = safe_url_string(url, encoding)
+            urls.append(url)
+        _urls_cache[response] = urls
+    return urls
+
+
+class HrefLinkExtractor(object):
+    '''
+    Extract links whose URLs match any of the `allow` patterns (all links if
+    there is none), like ``SgmlLinkExtractor(allow=allow)`` but only from the
+    href attributes of <a> and <area> tags. Links are unique and
+    canonicalized. Link texts are not extracted.
+
+    '''
+    def __init__(self, allow=()):
+        self.allow_res = [re.compile(pattern) for pattern in arg_to_iter(allow)]
+
+    def matches(self, url):
+        if not self.allow_res:
+            return True
+        return any(regex.search(url) for regex in self.allow_res)
+
+    def extract_links(self, response):
+        links = []
+        seen = set()
+        for url in extract_urls(response):
+            if not url.startswith(('http://', 'https://', 'file://')) or not self.matches(url):
+                continue
+            url = canonicalize_url(url)
+            if url not in seen:
+                seen.add(url)
+                links.append(Link(url))
+        return links
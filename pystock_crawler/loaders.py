@@ -1,9 +1,15 @@
+import cStringIO
 import re
+import time
 
+from collections import defaultdict
 from datetime import datetime, timedelta
+from itertools import islice
+from lxml import etree
 from scrapy import log
 from scrapy.contrib.loader import ItemLoader
 from scrapy.contrib.loader.processor import Compose, MapCompose, TakeFirst
+from scrapy.selector import Selector, SelectorList
 from scrapy.utils.misc import arg_to_iter
 from scrapy.utils.python import flatten
 
@@ -14,12 +20,85 @@ DATE_FORMAT = '%Y-%m-%d'
 
 MAX_PER_SHARE_VALUE = 1000.0
 
-# If number of characters of response body exceeds this value,
-# remove some useless text defined by RE_XML_GARBAGE to reduce memory usage
+# If number of characters of response body exceeds this value, parse it
+# incrementally with stream_selector() and drop the elements we don't
+# extract to reduce memory usage
 THRESHOLD_TO_CLEAN = 20000000
 
-# Used to get rid of "<tag>LONG STRING...</tag>"
-RE_XML_GARBAGE = re.compile(r'>([^<]{100,})<')
+# XPaths that FactTable can answer: "//prefix:Name" and "//*[predicate]"
+RE_XPATH_QNAME = re.compile(r'^//([\w\-]+):([\w\-\.]+)$')
+RE_XPATH_PREDICATE = re.compile(r'^//\*\[(.+)\]$')
+RE_XPATH_TOKEN = re.compile(r'\s*(local-name\(\)|contains\(|starts-with\(|not\(|and\b|or\b|"[^"]*"|\'[^\']*\'|[(),=])')
+
+# Namespace prefixes in an XPath, e.g., "dei" of "//dei:DocumentType"
+RE_XPATH_PREFIX = re.compile(r'([\w\-]+):[\w\*]')
+
+# Number of elements at the start of a document to look for the namespaces
+# that aren't declared on the root element
+NAMESPACE_SCAN_LIMIT = 1000
+
+# Compiled XPaths are dropped when there are more than this many of them
+MAX_COMPILED_XPATHS = 10000
+
+
+# XPath -> namespace prefixes in it
+_xpath_prefixes = {}
+
+# (XPath, namespace URI of each prefix, ...) -> compiled etree.XPath
+_compiled_xpaths = {}
+
+
+def compile_xpath(xpath, namespaces):
+    '''
+    Return an etree.XPath of `xpath` with its prefixes bound to `namespaces`.
+    It's compiled once and reused by all the documents in the process that
+    have the same URIs for the prefixes.
+
+    '''
+    try:
+        prefixes = _xpath_prefixes[xpath]
+    except KeyError:
+        prefixes = _xpath_prefixes[xpath] = tuple(set(RE_XPATH_PREFIX.findall(xpath)))
+
+    key = (xpath,) + tuple(namespaces.get(prefix) for prefix in prefixes)
+    try:
+        return _compiled_xpaths[key]
+    except KeyError:
+        pass
+
+    xpath_namespaces = dict((prefix, namespaces[prefix]) for prefix in prefixes if prefix in namespaces)
+    try:
+        compiled = etree.XPath(xpath, namespaces=xpath_namespaces, smart_strings=False)
+    except etree.XPathError:
+        raise ValueError('Invalid XPath: %s' % xpath)
+
+    if len(_compiled_xpaths) >= MAX_COMPILED_XPATHS:
+        _compiled_xpaths.clear()
+    _compiled_xpaths[key] = compiled
+    return compiled
+
+
+def select_xpath(selector, xpath):
+    '''
+    Return the same SelectorList as `selector.xpath(xpath)`, but without
+    compiling the XPath again.
+
+    '''
+    root = selector._root
+    if not isinstance(root, etree._Element):
+        return selector.xpath(xpath)
+
+    namespaces = selector.namespaces
+    try:
+        result = compile_xpath(xpath, namespaces)(root)
+    except etree.XPathError:
+        raise ValueError('Invalid XPath: %s' % xpath)
+
+    if type(result) is not list:
+        result = [result]
+
+    cls = selector.__class__
+    return SelectorList([cls(_root=x, _expr=xpath, namespaces=namespaces, type=selector.type) for x in result])
 
 
 class IntermediateValue(object):
@@ -29,7 +108,7 @@ class IntermediateValue(object):
 
     '''
     def __init__(self, local_name, value, text, context, node=None, start_date=None,
-                 end_date=None, instant=None):
+                 end_date=None, instant=None, memberness=None, member=None):
         self.local_name = local_name
         self.value = value
         self.text = text
@@ -39,6 +118,15 @@ class IntermediateValue(object):
         self.end_date = end_date
         self.instant = instant
 
+        # memberness() and is_member() of the context, usually precomputed
+        # once per context by ContextInfo
+        if memberness is None or member is None:
+            texts = explicit_members(context)
+            memberness = memberness_from_members(texts)
+            member = is_member_from_members(texts)
+        self.memberness = memberness
+        self.member = member
+
     def __cmp__(self, other):
         if self.value < other.value:
             return -1
@@ -49,11 +137,11 @@ class IntermediateValue(object):
     def __repr__(self):
         context_id = None
         if self.context:
-            context_id = self.context.xpath('@id')[0].extract()
+            context_id = select_xpath(self.context, '@id')[0].extract()
         return '(%s, %s, %s)' % (self.local_name, self.value, context_id)
 
     def is_member(self):
-        return is_member(self.context)
+        return self.member
 
 
 class ExtractText(object):
@@ -61,12 +149,75 @@ class ExtractText(object):
     def __call__(self, value):
         if hasattr(value, 'select'):
             try:
-                return value.xpath('./text()')[0].extract()
+                return select_xpath(value, './text()')[0].extract()
             except IndexError:
                 return ''
         return unicode(value)
 
 
+class ContextInfo(object):
+    '''
+    Period and explicit members of an XBRL context, parsed once per document
+    so that facts can look up their context by ID instead of searching the
+    whole document.
+
+    '''
+    def __init__(self, context):
+        self.context = context
+
+        texts = explicit_members(context)
+        self.memberness = memberness_from_members(texts)
+        self.member = is_member_from_members(texts)
+
+        self.instant = self.start_date = self.end_date = None
+        try:
+            instant = select_xpath(context, './/*[local-name()="instant"]/text()')[0].extract().strip()
+        except (IndexError, ValueError):
+            try:
+                end_date_str = select_xpath(context, './/*[local-name()="endDate"]/text()')[0].extract().strip()
+                end_date = datetime.strptime(end_date_str, DATE_FORMAT)
+
+                start_date_str = select_xpath(context, './/*[local-name()="startDate"]/text()')[0].extract().strip()
+                start_date = datetime.strptime(start_date_str, DATE_FORMAT)
+            except (IndexError, ValueError):
+                pass
+            else:
+                self.start_date = start_date
+                self.end_date = end_date
+        else:
+            try:
+                self.instant = datetime.strptime(instant, DATE_FORMAT)
+            except ValueError:
+                pass
+
+
+def index_contexts(selector):
+    '''Map context IDs to ContextInfo objects in one pass over the document.'''
+    contexts = {}
+    for context in select_xpath(selector, '//*[local-name()="context"]'):
+        try:
+            context_id = select_xpath(context, '@id')[0].extract()
+        except IndexError:
+            continue
+        if context_id not in contexts:
+            contexts[context_id] = ContextInfo(context)
+    return contexts
+
+
+def find_context(loader_context, context_id):
+    contexts = loader_context.get('context_index')
+    if contexts is not None and context_id in contexts:
+        return contexts[context_id]
+
+    # Not a <context> element or no index available, fall back to searching
+    # the document for any element with the ID
+    try:
+        context = loader_context['selector'].xpath('//*[@id="%s"]' % context_id)[0]
+    except IndexError:
+        return None
+    return ContextInfo(context)
+
+
 class MatchEndDate(object):
 
     def __init__(self, data_type=str, ignore_date_range=False):
@@ -79,12 +230,10 @@ class MatchEndDate(object):
 
         doc_end_date_str = loader_context['end_date']
         doc_type = loader_context['doc_type']
-        selector = loader_context['selector']
 
-        context_id = value.xpath('@contextRef')[0].extract()
-        try:
-            context = selector.xpath('//*[@id="%s"]' % context_id)[0]
-        except IndexError:
+        context_id = select_xpath(value, '@contextRef')[0].extract()
+        context_info = find_context(loader_context, context_id)
+        if context_info is None:
             try:
                 url = loader_context['response'].url
             except KeyError:
@@ -92,43 +241,31 @@ class MatchEndDate(object):
             log.msg(u'Cannot find context: %s in %s' % (context_id, url), log.WARNING)
             return None
 
-        date = instant = start_date = end_date = None
-        try:
-            instant = context.xpath('.//*[local-name()="instant"]/text()')[0].extract().strip()
-        except (IndexError, ValueError):
-            try:
-                end_date_str = context.xpath('.//*[local-name()="endDate"]/text()')[0].extract().strip()
-                end_date = datetime.strptime(end_date_str, DATE_FORMAT)
-
-                start_date_str = context.xpath('.//*[local-name()="startDate"]/text()')[0].extract().strip()
-                start_date = datetime.strptime(start_date_str, DATE_FORMAT)
-
-                if self.ignore_date_range or date_range_matches_doc_type(doc_type, start_date, end_date):
-                    date = end_date
-            except (IndexError, ValueError):
-                pass
-        else:
-            try:
-                instant = datetime.strptime(instant, DATE_FORMAT)
-            except ValueError:
-                pass
-            else:
-                date = instant
+        date = None
+        instant = context_info.instant
+        start_date = context_info.start_date
+        end_date = context_info.end_date
+        if instant:
+            date = instant
+        elif start_date and end_date:
+            if self.ignore_date_range or date_range_matches_doc_type(doc_type, start_date, end_date):
+                date = end_date
 
         if date:
             doc_end_date = datetime.strptime(doc_end_date_str, DATE_FORMAT)
             delta_days = (doc_end_date - date).days
             if abs(delta_days) < 30:
                 try:
-                    text = value.xpath('./text()')[0].extract()
+                    text = select_xpath(value, './text()')[0].extract()
                     val = self.data_type(text)
                 except (IndexError, ValueError):
                     pass
                 else:
-                    local_name = value.xpath('local-name()')[0].extract()
+                    local_name = select_xpath(value, 'local-name()')[0].extract()
                     return IntermediateValue(
-                        local_name, val, text, context, value,
-                        start_date=start_date, end_date=end_date, instant=instant)
+                        local_name, val, text, context_info.context, value,
+                        start_date=start_date, end_date=end_date, instant=instant,
+                        memberness=context_info.memberness, member=context_info.member)
 
         return None
 
@@ -207,7 +344,7 @@ def imd_get_net_income(imd_values):
 
 
 def imd_get_op_income(imd_values):
-    imd_values = filter(lambda v: memberness(v.context) < 2, imd_values)
+    imd_values = filter(lambda v: v.memberness < 2, imd_values)
     return imd_min(imd_values)
 
 
@@ -237,7 +374,7 @@ def imd_get_per_share_value(imd_values):
     value = v.value
     if abs(value) > MAX_PER_SHARE_VALUE:
         try:
-            decimals = int(v.node.xpath('@decimals')[0].extract())
+            decimals = int(select_xpath(v.node, '@decimals')[0].extract())
         except (AttributeError, IndexError, ValueError):
             return None
         else:
@@ -265,7 +402,7 @@ def imd_get_equity(imd_values):
 
 def imd_filter_member(imd_values):
     if imd_values:
-        with_memberness = [(v, memberness(v.context)) for v in imd_values]
+        with_memberness = [(v, v.memberness) for v in imd_values]
         with_memberness = sorted(with_memberness, cmp=lambda a, b: a[1] - b[1])
 
         m0 = with_memberness[0][1]
@@ -283,7 +420,7 @@ def imd_filter_member(imd_values):
 def imd_mult(imd_values):
     for v in imd_values:
         try:
-            node_id = v.node.xpath('@id')[0].extract().lower()
+            node_id = select_xpath(v.node, '@id')[0].extract().lower()
         except (AttributeError, IndexError):
             pass
         else:
@@ -297,10 +434,16 @@ def imd_mult(imd_values):
     return imd_values
 
 
-def memberness(context):
-    '''The likelihood that the context is a "member".'''
+def explicit_members(context):
+    '''Texts of explicitMember elements in the context, None if there's no context.'''
     if context:
-        texts = context.xpath('.//*[local-name()="explicitMember"]/text()').extract()
+        return select_xpath(context, './/*[local-name()="explicitMember"]/text()').extract()
+    return None
+
+
+def memberness_from_members(texts):
+    '''memberness() of a context whose explicit members are `texts`.'''
+    if texts is not None:
         text = str(texts).lower()
 
         if len(texts) > 1:
@@ -317,9 +460,9 @@ def memberness(context):
     return 3
 
 
-def is_member(context):
-    if context:
-        texts = context.xpath('.//*[local-name()="explicitMember"]/text()').extract()
+def is_member_from_members(texts):
+    '''is_member() of a context whose explicit members are `texts`.'''
+    if texts is not None:
         text = str(texts).lower()
 
         # 'SuccessorMember' is a rare case that shouldn't be treated as member
@@ -328,6 +471,15 @@ def is_member(context):
     return True
 
 
+def memberness(context):
+    '''The likelihood that the context is a "member".'''
+    return memberness_from_members(explicit_members(context))
+
+
+def is_member(context):
+    return is_member_from_members(explicit_members(context))
+
+
 def str_to_bool(value):
     if hasattr(value, 'lower'):
         value = value.lower()
@@ -335,11 +487,51 @@ def str_to_bool(value):
     return bool(value)
 
 
+def find_namespaces(xxs, names):
+    '''
+    Return a dict that maps the prefixes in `names` to their namespace URIs
+    ("xmlns" is the default namespace). Prefixes declared on the root element
+    are found without reading the rest of the document. The others are looked
+    for in the first NAMESPACE_SCAN_LIMIT elements.
+
+    '''
+    root = xxs._root
+    if not isinstance(root, etree._Element):
+        return _find_namespaces_in_text(xxs, names)
+
+    namespaces = {}
+    missing = set(names)
+    for element in islice(root.iter(tag=etree.Element), NAMESPACE_SCAN_LIMIT):
+        nsmap = element.nsmap
+        for name in list(missing):
+            uri = nsmap.get(None if name == 'xmlns' else name)
+            if uri:
+                namespaces[name] = uri
+                missing.remove(name)
+        if not missing:
+            break
+    return namespaces
+
+
+def _find_namespaces_in_text(xxs, names):
+    # Serializes the whole document for every name, only for selectors that
+    # have no element tree
+    namespaces = {}
+    for name in names:
+        name_re = name.replace('-', '\-')
+        if not name_re.startswith('xmlns'):
+            name_re = 'xmlns:' + name_re
+        uris = xxs.re('%s=\"([^\"]+)\"' % name_re)
+        if uris:
+            namespaces[name] = uris[0]
+    return namespaces
+
+
 def find_namespace(xxs, name):
-    name_re = name.replace('-', '\-')
-    if not name_re.startswith('xmlns'):
-        name_re = 'xmlns:' + name_re
-    return xxs.re('%s=\"([^\"]+)\"' % name_re)[0]
+    try:
+        return find_namespaces(xxs, (name,))[name]
+    except KeyError:
+        raise IndexError('Namespace not found: %s' % name)
 
 
 def register_namespace(xxs, name):
@@ -349,24 +541,343 @@ def register_namespace(xxs, name):
 
 def register_namespaces(xxs):
     names = ('xmlns', 'xbrli', 'dei', 'us-gaap')
-    for name in names:
+    for name, ns in find_namespaces(xxs, names).iteritems():
+        xxs.register_namespace(name, ns)
+
+
+class FactQuery(object):
+    '''
+    An XPath compiled into a test on element names so it can be evaluated
+    against a FactTable. Only the XPath forms used by ReportItemLoader are
+    supported: "//prefix:Name" and "//*[...]" where the predicate combines
+    local-name()="...", contains(local-name(), "..."),
+    starts-with(local-name(), "...") with and, or and not().
+
+    '''
+    def __init__(self, xpath):
+        self.xpath = xpath
+        self.prefix = self.local_name = self.predicate = None
+
+        match = RE_XPATH_QNAME.match(xpath)
+        if match:
+            self.prefix, self.local_name = match.groups()
+            return
+
+        match = RE_XPATH_PREDICATE.match(xpath)
+        if not match:
+            raise ValueError('Unsupported XPath: %s' % xpath)
+
+        tokens = self._tokenize(match.group(1))
+        self.predicate = self._parse_or(tokens)
+        if tokens:
+            raise ValueError('Unsupported XPath: %s' % xpath)
+
+    def _tokenize(self, text):
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = RE_XPATH_TOKEN.match(text, pos)
+            if not match:
+                raise ValueError('Unsupported XPath: %s' % self.xpath)
+            tokens.append(match.group(1))
+            pos = match.end()
+        tokens.reverse()
+        return tokens
+
+    def _expect(self, tokens, token):
+        if not tokens or tokens.pop() != token:
+            raise ValueError('Unsupported XPath: %s' % self.xpath)
+
+    def _string(self, tokens):
+        if not tokens or tokens[-1][0] not in '"\'':
+            raise ValueError('Unsupported XPath: %s' % self.xpath)
+        return tokens.pop()[1:-1]
+
+    def _parse_or(self, tokens):
+        preds = [self._parse_and(tokens)]
+        while tokens and tokens[-1] == 'or':
+            tokens.pop()
+            preds.append(self._parse_and(tokens))
+        if len(preds) == 1:
+            return preds[0]
+        return lambda name: any(pred(name) for pred in preds)
+
+    def _parse_and(self, tokens):
+        preds = [self._parse_term(tokens)]
+        while tokens and tokens[-1] == 'and':
+            tokens.pop()
+            preds.append(self._parse_term(tokens))
+        if len(preds) == 1:
+            return preds[0]
+        return lambda name: all(pred(name) for pred in preds)
+
+    def _parse_term(self, tokens):
+        token = tokens.pop() if tokens else None
+        if token == 'not(':
+            pred = self._parse_or(tokens)
+            self._expect(tokens, ')')
+            return lambda name: not pred(name)
+        elif token == '(':
+            pred = self._parse_or(tokens)
+            self._expect(tokens, ')')
+            return pred
+        elif token == 'local-name()':
+            self._expect(tokens, '=')
+            value = self._string(tokens)
+            return lambda name: name == value
+        elif token in ('contains(', 'starts-with('):
+            self._expect(tokens, 'local-name()')
+            self._expect(tokens, ',')
+            value = self._string(tokens)
+            self._expect(tokens, ')')
+            if token == 'contains(':
+                return lambda name: value in name
+            return lambda name: name.startswith(value)
+        raise ValueError('Unsupported XPath: %s' % self.xpath)
+
+
+# XPath -> FactQuery, or None if the XPath can't be compiled into one
+_fact_queries = {}
+
+
+def get_fact_query(xpath):
+    try:
+        return _fact_queries[xpath]
+    except KeyError:
         try:
-            register_namespace(xxs, name)
-        except IndexError:
-            pass
+            query = FactQuery(xpath)
+        except ValueError:
+            query = None
+        _fact_queries[xpath] = query
+        return query
+
+
+class FactTable(object):
+    '''
+    All elements of an XML document bucketed by local name, built in a single
+    pass so that each XPath of the fallback chains in ReportItemLoader costs a
+    dict lookup instead of a walk over the whole document.
+
+    '''
+    def __init__(self, selector):
+        self.selector = selector
+        self.elements = defaultdict(list)
+
+        root = selector._root
+        if not hasattr(root, 'iter'):
+            return
+
+        for position, element in enumerate(root.iter(tag=etree.Element)):
+            tag = element.tag
+            if tag[0] == '{':
+                namespace, __, local_name = tag[1:].partition('}')
+            else:
+                namespace, local_name = None, tag
+            self.elements[local_name].append((position, namespace, element))
+
+    def select(self, xpath):
+        '''
+        Return the same SelectorList as `selector.xpath(xpath)`, or None if
+        the XPath isn't supported by FactQuery.
+
+        '''
+        query = get_fact_query(xpath)
+        if query is None:
+            return None
+
+        if query.local_name is not None:
+            try:
+                namespace = self.selector.namespaces[query.prefix]
+            except KeyError:
+                # Same as what lxml reports for an undefined prefix
+                raise ValueError('Invalid XPath: %s' % xpath)
+            matches = [m for m in self.elements.get(query.local_name, ()) if m[1] == namespace]
+        else:
+            names = [name for name in self.elements if query.predicate(name)]
+            matches = []
+            for name in names:
+                matches.extend(self.elements[name])
+            if len(names) > 1:
+                matches.sort()
+
+        namespaces = self.selector.namespaces
+        return SelectorList([Selector(_root=m[2], _expr=xpath, namespaces=namespaces, type='xml')
+                             for m in matches])
+
+
+class ReportElementFilter(object):
+    '''
+    Tells stream_selector() which elements of a report to keep: contexts,
+    dei facts and the facts matched by any of the given XPaths.
+
+    '''
+    def __init__(self, xpaths):
+        self.queries = [get_fact_query(xpath) for xpath in xpaths]
+
+        # Can't tell which elements an arbitrary XPath needs, so keep them all
+        self.keep_all = None in self.queries
+
+        self._names = {}
+
+    def __call__(self, element):
+        if self.keep_all:
+            return True
+
+        local_name = element.tag.rpartition('}')[2]
+        if local_name == 'context' or element.prefix == 'dei':
+            return True
+
+        try:
+            return self._names[local_name]
+        except KeyError:
+            keep = any(self._matches(query, local_name) for query in self.queries)
+            self._names[local_name] = keep
+            return keep
+
+    def _matches(self, query, local_name):
+        if query.local_name is not None:
+            return query.local_name == local_name
+        return query.predicate(local_name)
+
+
+def stream_selector(response, keep):
+    '''
+    Parse an XML response incrementally into a Selector that only has the
+    elements for which `keep(element)` is true, along with their subtrees and
+    ancestors. Everything else is dropped as soon as it's parsed, so big text
+    blocks never pile up in memory. Return None if the document can't be
+    parsed this way.
+
+    '''
+    f = cStringIO.StringIO(response.body)
+    root = None
+    kept = []
+
+    # Elements to drop. The element that just ended may be the last node of
+    # a parse chunk, and libxml2 would attach the nodes parsed after it to it
+    # if it were detached. So an element is only removed once its next
+    # sibling or its parent has ended.
+    dropped = set()
+
+    def remove(element):
+        if element is not None and element in dropped:
+            dropped.remove(element)
+            element.getparent().remove(element)
+
+    try:
+        for event, element in etree.iterparse(f, events=('start', 'end'), recover=True, huge_tree=True,
+                                              remove_comments=True, resolve_entities=False):
+            if event == 'start':
+                if root is None:
+                    root = element
+                kept.append((kept and kept[-1]) or keep(element))
+                continue
+
+            if len(element):
+                remove(element[-1])
+            remove(element.getprevious())
+            if not kept.pop() and len(element) == 0 and element is not root:
+                dropped.add(element)
+    except etree.XMLSyntaxError:
+        return None
+    finally:
+        f.close()
+
+    if root is None:
+        return None
+    return Selector(_root=root, type='xml')
+
+
+class LoaderStats(object):
+    '''
+    Time and number of matches of each field and XPath of a document, recorded
+    by XmlXPathItemLoader when it's created with instrument=True.
+
+    '''
+    def __init__(self):
+        # Field name -> seconds spent in its XPaths and processors
+        self.fields = defaultdict(float)
+
+        # (field name, XPath) -> [seconds, number of matches]
+        self.xpaths = {}
+
+    def add_xpath(self, field_name, xpath, seconds, matches):
+        self.fields[field_name] += seconds
+        stats = self.xpaths.setdefault((field_name, xpath), [0.0, 0])
+        stats[0] += seconds
+        stats[1] += matches
+
+    def add_output(self, field_name, seconds):
+        self.fields[field_name] += seconds
+
+    def total_time(self):
+        return sum(self.fields.itervalues())
+
+    def update_stats(self, stats, spider=None):
+        '''Add the numbers to a Scrapy stats collector.'''
+        stats.inc_value('loader/document_count', spider=spider)
+        stats.inc_value('loader/time_ms', self.total_time() * 1000, spider=spider)
+        for field_name, seconds in self.fields.iteritems():
+            stats.inc_value('loader/field/%s/time_ms' % field_name, seconds * 1000, spider=spider)
+        for (field_name, xpath), (seconds, matches) in self.xpaths.iteritems():
+            prefix = 'loader/xpath/%s/%s' % (field_name, xpath)
+            stats.inc_value(prefix + '/count', spider=spider)
+            stats.inc_value(prefix + '/time_ms', seconds * 1000, spider=spider)
+            stats.inc_value(prefix + '/matches', matches, spider=spider)
+
+    def format(self):
+        '''Return a line of the fields, the slowest first.'''
+        fields = sorted(self.fields.iteritems(), key=lambda a: -a[1])
+        return '%.1f ms: %s' % (self.total_time() * 1000,
+                                ', '.join('%s %.1f ms' % (name, seconds * 1000) for name, seconds in fields))
 
 
 class XmlXPathItemLoader(ItemLoader):
 
+    # If True, answer the XPaths FactQuery understands from a FactTable built
+    # with one pass over the document
+    use_fact_table = False
+
     def __init__(self, *args, **kwargs):
+        # Record time and matches of each field and XPath in self.loader_stats
+        instrument = kwargs.pop('instrument', False)
+        self.loader_stats = LoaderStats() if instrument else None
+
         super(XmlXPathItemLoader, self).__init__(*args, **kwargs)
         register_namespaces(self.selector)
+        self._fact_table = None
+
+    @property
+    def fact_table(self):
+        if self._fact_table is None:
+            self._fact_table = FactTable(self.selector)
+        return self._fact_table
 
     def add_xpath(self, field_name, xpath, *processors, **kw):
+        if self.loader_stats:
+            start = time.time()
+
         values = self._get_values(xpath, **kw)
         self.add_value(field_name, values, *processors, **kw)
+
+        if self.loader_stats:
+            if not isinstance(xpath, basestring):
+                xpath = ' | '.join(xpath)
+            self.loader_stats.add_xpath(field_name, xpath, time.time() - start, len(values))
+
         return len(self._values[field_name])
 
+    def get_output_value(self, field_name):
+        if not self.loader_stats:
+            return super(XmlXPathItemLoader, self).get_output_value(field_name)
+
+        start = time.time()
+        try:
+            return super(XmlXPathItemLoader, self).get_output_value(field_name)
+        finally:
+            self.loader_stats.add_output(field_name, time.time() - start)
+
     def add_xpaths(self, name, paths):
         for path in paths:
             match_count = self.add_xpath(name, path)
@@ -377,7 +888,127 @@ class XmlXPathItemLoader(ItemLoader):
 
     def _get_values(self, xpaths, **kw):
         xpaths = arg_to_iter(xpaths)
-        return flatten([self.selector.xpath(xpath) for xpath in xpaths])
+        return flatten([self._select(xpath) for xpath in xpaths])
+
+    def _select(self, xpath):
+        if self.use_fact_table:
+            values = self.fact_table.select(xpath)
+            if values is not None:
+                return values
+        return select_xpath(self.selector, xpath)
+
+
+# XPaths of the fact fields, each list is tried in order until one matches
+FIELD_XPATHS = {
+    'revenues': [
+        '//us-gaap:SalesRevenueNet',
+        '//us-gaap:Revenues',
+        '//us-gaap:SalesRevenueGoodsNet',
+        '//us-gaap:SalesRevenueServicesNet',
+        '//us-gaap:RealEstateRevenueNet',
+        '//*[local-name()="NetRevenuesIncludingNetInterestIncome"]',
+        '//*[contains(local-name(), "TotalRevenues") and contains(local-name(), "After")]',
+        '//*[contains(local-name(), "TotalRevenues")]',
+        '//*[local-name()="InterestAndDividendIncomeOperating" or local-name()="NoninterestIncome"]',
+        '//*[contains(local-name(), "Revenue")]'
+    ],
+    'net_income': [
+        '//*[contains(local-name(), "NetLossIncome") and contains(local-name(), "Corporation")]',
+        '//*[local-name()="NetIncomeLossAvailableToCommonStockholdersBasic" or local-name()="NetIncomeLoss"]',
+        '//us-gaap:ProfitLoss',
+        '//us-gaap:IncomeLossFromContinuingOperations',
+        '//*[contains(local-name(), "IncomeLossFromContinuingOperations") and not(contains(local-name(), "Per"))]',
+        '//*[contains(local-name(), "NetIncomeLoss")]',
+        '//*[starts-with(local-name(), "NetIncomeAttributableTo")]'
+    ],
+    'op_income': [
+        '//us-gaap:OperatingIncomeLoss'
+    ],
+    'eps_basic': [
+        '//us-gaap:EarningsPerShareBasic',
+        '//us-gaap:IncomeLossFromContinuingOperationsPerBasicShare',
+        '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
+        '//*[contains(local-name(), "NetIncomeLoss") and contains(local-name(), "Per") and contains(local-name(), "Common")]',
+        '//*[contains(local-name(), "Earnings") and contains(local-name(), "Per") and contains(local-name(), "Basic")]',
+        '//*[local-name()="IncomePerShareFromContinuingOperationsAvailableToCompanyStockholdersBasicAndDiluted"]',
+        '//*[contains(local-name(), "NetLossPerShare")]',
+        '//*[contains(local-name(), "NetIncome") and contains(local-name(), "Per") and contains(local-name(), "Basic")]',
+        '//*[local-name()="BasicEarningsAttributableToStockholdersPerCommonShare"]',
+        '//*[local-name()="Earningspersharebasicanddiluted"]',
+        '//*[contains(local-name(), "PerCommonShareBasicAndDiluted")]',
+        '//*[local-name()="NetIncomeLossAttributableToCommonStockholdersBasicAndDiluted"]',
+        '//us-gaap:NetIncomeLossAvailableToCommonStockholdersBasic',
+        '//*[local-name()="NetIncomeLossEPS"]',
+        '//*[local-name()="NetLoss"]'
+    ],
+    'eps_diluted': [
+        '//us-gaap:EarningsPerShareDiluted',
+        '//us-gaap:IncomeLossFromContinuingOperationsPerDilutedShare',
+        '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
+        '//*[contains(local-name(), "Earnings") and contains(local-name(), "Per") and contains(local-name(), "Diluted")]',
+        '//*[local-name()="IncomePerShareFromContinuingOperationsAvailableToCompanyStockholdersBasicAndDiluted"]',
+        '//*[contains(local-name(), "NetLossPerShare")]',
+        '//*[contains(local-name(), "NetIncome") and contains(local-name(), "Per") and contains(local-name(), "Diluted")]',
+        '//*[local-name()="DilutedEarningsAttributableToStockholdersPerCommonShare"]',
+        '//us-gaap:NetIncomeLossAvailableToCommonStockholdersDiluted',
+        '//*[contains(local-name(), "PerCommonShareBasicAndDiluted")]',
+        '//*[local-name()="NetIncomeLossAttributableToCommonStockholdersBasicAndDiluted"]',
+        '//us-gaap:EarningsPerShareBasic',
+        '//*[local-name()="NetIncomeLossEPS"]',
+        '//*[local-name()="NetLoss"]'
+    ],
+    'dividend': [
+        '//us-gaap:CommonStockDividendsPerShareDeclared',
+        '//us-gaap:CommonStockDividendsPerShareCashPaid'
+    ],
+    'assets': [
+        '//us-gaap:Assets',
+        '//us-gaap:AssetsNet',
+        '//us-gaap:LiabilitiesAndStockholdersEquity'
+    ],
+    'cur_assets': [
+        '//us-gaap:AssetsCurrent'
+    ],
+    'cur_liab': [
+        '//us-gaap:LiabilitiesCurrent'
+    ],
+    'equity': [
+        '//*[local-name()="StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest" or local-name()="StockholdersEquity"]',
+        '//*[local-name()="TotalCommonShareholdersEquity"]',
+        '//*[local-name()="CommonShareholdersEquity"]',
+        '//*[local-name()="CommonStockEquity"]',
+        '//*[local-name()="TotalEquity"]',
+        '//us-gaap:RetainedEarningsAccumulatedDeficit',
+        '//*[contains(local-name(), "MembersEquityIncludingPortionAttributableToNoncontrollingInterest")]',
+        '//us-gaap:CapitalizationLongtermDebtAndEquity',
+        '//*[local-name()="TotalCapitalization"]'
+    ],
+    'cash': [
+        '//us-gaap:CashCashEquivalentsAndFederalFundsSold',
+        '//us-gaap:CashAndDueFromBanks',
+        '//us-gaap:CashAndCashEquivalentsAtCarryingValue',
+        '//us-gaap:Cash',
+        '//*[local-name()="CashAndCashEquivalents"]',
+        '//*[contains(local-name(), "CarryingValueOfCashAndCashEquivalents")]',
+        '//*[contains(local-name(), "CashCashEquivalents")]',
+        '//*[contains(local-name(), "CashAndCashEquivalents")]'
+    ],
+    'cash_flow_op': [
+        '//us-gaap:NetCashProvidedByUsedInOperatingActivities',
+        '//us-gaap:NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'
+    ],
+    'cash_flow_inv': [
+        '//us-gaap:NetCashProvidedByUsedInInvestingActivities',
+        '//us-gaap:NetCashProvidedByUsedInInvestingActivitiesContinuingOperations'
+    ],
+    'cash_flow_fin': [
+        '//us-gaap:NetCashProvidedByUsedInFinancingActivities',
+        '//us-gaap:NetCashProvidedByUsedInFinancingActivitiesContinuingOperations'
+    ]
+}
+
+# Always added to revenues, no matter which XPath in the chain matched
+EXTRA_REVENUES_XPATH = '//us-gaap:FinancialServicesRevenue'
 
 
 class ReportItemLoader(XmlXPathItemLoader):
@@ -385,6 +1016,8 @@ class ReportItemLoader(XmlXPathItemLoader):
     default_item_class = ReportItem
     default_output_processor = TakeFirst()
 
+    use_fact_table = True
+
     symbol_in = MapCompose(ExtractText(), unicode.upper)
     symbol_out = Compose(get_symbol)
 
@@ -438,11 +1071,12 @@ class ReportItemLoader(XmlXPathItemLoader):
 
     def __init__(self, *args, **kwargs):
         response = kwargs.get('response')
-        if len(response.body) > THRESHOLD_TO_CLEAN:
-            # Remove some useless text to reduce memory usage
-            body, __ = RE_XML_GARBAGE.subn(lambda m: '><', response.body)
-            response = response.replace(body=body)
-            kwargs['response'] = response
+        if len(response.body) > THRESHOLD_TO_CLEAN and kwargs.get('selector') is None:
+            # Only keep what we extract to reduce memory usage
+            xpaths = [EXTRA_REVENUES_XPATH]
+            for field_xpaths in FIELD_XPATHS.itervalues():
+                xpaths.extend(field_xpaths)
+            kwargs['selector'] = stream_selector(response, ReportElementFilter(xpaths))
 
         super(ReportItemLoader, self).__init__(*args, **kwargs)
 
@@ -464,7 +1098,8 @@ class ReportItemLoader(XmlXPathItemLoader):
 
         self.context.update({
             'end_date': end_date,
-            'doc_type': doc_type
+            'doc_type': doc_type,
+            'context_index': index_contexts(self.selector)
         })
 
         self.add_xpath('symbol', '//dei:TradingSymbol')
@@ -488,128 +1123,37 @@ class ReportItemLoader(XmlXPathItemLoader):
         self.add_value('end_date', end_date)
         self.add_value('doc_type', doc_type)
 
-        self.add_xpaths('revenues', [
-            '//us-gaap:SalesRevenueNet',
-            '//us-gaap:Revenues',
-            '//us-gaap:SalesRevenueGoodsNet',
-            '//us-gaap:SalesRevenueServicesNet',
-            '//us-gaap:RealEstateRevenueNet',
-            '//*[local-name()="NetRevenuesIncludingNetInterestIncome"]',
-            '//*[contains(local-name(), "TotalRevenues") and contains(local-name(), "After")]',
-            '//*[contains(local-name(), "TotalRevenues")]',
-            '//*[local-name()="InterestAndDividendIncomeOperating" or local-name()="NoninterestIncome"]',
-            '//*[contains(local-name(), "Revenue")]'
-        ])
-        self.add_xpath('revenues', '//us-gaap:FinancialServicesRevenue')
-
-        self.add_xpaths('net_income', [
-            '//*[contains(local-name(), "NetLossIncome") and contains(local-name(), "Corporation")]',
-            '//*[local-name()="NetIncomeLossAvailableToCommonStockholdersBasic" or local-name()="NetIncomeLoss"]',
-            '//us-gaap:ProfitLoss',
-            '//us-gaap:IncomeLossFromContinuingOperations',
-            '//*[contains(local-name(), "IncomeLossFromContinuingOperations") and not(contains(local-name(), "Per"))]',
-            '//*[contains(local-name(), "NetIncomeLoss")]',
-            '//*[starts-with(local-name(), "NetIncomeAttributableTo")]'
-        ])
-
-        self.add_xpaths('op_income', [
-            '//us-gaap:OperatingIncomeLoss'
-        ])
-
-        self.add_xpaths('eps_basic', [
-            '//us-gaap:EarningsPerShareBasic',
-            '//us-gaap:IncomeLossFromContinuingOperationsPerBasicShare',
-            '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
-            '//*[contains(local-name(), "NetIncomeLoss") and contains(local-name(), "Per") and contains(local-name(), "Common")]',
-            '//*[contains(local-name(), "Earnings") and contains(local-name(), "Per") and contains(local-name(), "Basic")]',
-            '//*[local-name()="IncomePerShareFromContinuingOperationsAvailableToCompanyStockholdersBasicAndDiluted"]',
-            '//*[contains(local-name(), "NetLossPerShare")]',
-            '//*[contains(local-name(), "NetIncome") and contains(local-name(), "Per") and contains(local-name(), "Basic")]',
-            '//*[local-name()="BasicEarningsAttributableToStockholdersPerCommonShare"]',
-            '//*[local-name()="Earningspersharebasicanddiluted"]',
-            '//*[contains(local-name(), "PerCommonShareBasicAndDiluted")]',
-            '//*[local-name()="NetIncomeLossAttributableToCommonStockholdersBasicAndDiluted"]',
-            '//us-gaap:NetIncomeLossAvailableToCommonStockholdersBasic',
-            '//*[local-name()="NetIncomeLossEPS"]',
-            '//*[local-name()="NetLoss"]'
-        ])
-
-        self.add_xpaths('eps_diluted', [
-            '//us-gaap:EarningsPerShareDiluted',
-            '//us-gaap:IncomeLossFromContinuingOperationsPerDilutedShare',
-            '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
-            '//*[contains(local-name(), "Earnings") and contains(local-name(), "Per") and contains(local-name(), "Diluted")]',
-            '//*[local-name()="IncomePerShareFromContinuingOperationsAvailableToCompanyStockholdersBasicAndDiluted"]',
-            '//*[contains(local-name(), "NetLossPerShare")]',
-            '//*[contains(local-name(), "NetIncome") and contains(local-name(), "Per") and contains(local-name(), "Diluted")]',
-            '//*[local-name()="DilutedEarningsAttributableToStockholdersPerCommonShare"]',
-            '//us-gaap:NetIncomeLossAvailableToCommonStockholdersDiluted',
-            '//*[contains(local-name(), "PerCommonShareBasicAndDiluted")]',
-            '//*[local-name()="NetIncomeLossAttributableToCommonStockholdersBasicAndDiluted"]',
-            '//us-gaap:EarningsPerShareBasic',
-            '//*[local-name()="NetIncomeLossEPS"]',
-            '//*[local-name()="NetLoss"]'
-        ])
-
-        self.add_xpaths('dividend', [
-            '//us-gaap:CommonStockDividendsPerShareDeclared',
-            '//us-gaap:CommonStockDividendsPerShareCashPaid'
-        ])
+        self.add_xpaths('revenues', FIELD_XPATHS['revenues'])
+        self.add_xpath('revenues', EXTRA_REVENUES_XPATH)
+
+        self.add_xpaths('net_income', FIELD_XPATHS['net_income'])
+
+        self.add_xpaths('op_income', FIELD_XPATHS['op_income'])
+
+        self.add_xpaths('eps_basic', FIELD_XPATHS['eps_basic'])
+
+        self.add_xpaths('eps_diluted', FIELD_XPATHS['eps_diluted'])
+
+        self.add_xpaths('dividend', FIELD_XPATHS['dividend'])
 
         # if dividend isn't found in doc, assume it's 0
         self.add_value('dividend', 0.0)
 
-        self.add_xpaths('assets', [
-            '//us-gaap:Assets',
-            '//us-gaap:AssetsNet',
-            '//us-gaap:LiabilitiesAndStockholdersEquity'
-        ])
-
-        self.add_xpaths('cur_assets', [
-            '//us-gaap:AssetsCurrent'
-        ])
-
-        self.add_xpaths('cur_liab', [
-            '//us-gaap:LiabilitiesCurrent'
-        ])
-
-        self.add_xpaths('equity', [
-            '//*[local-name()="StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest" or local-name()="StockholdersEquity"]',
-            '//*[local-name()="TotalCommonShareholdersEquity"]',
-            '//*[local-name()="CommonShareholdersEquity"]',
-            '//*[local-name()="CommonStockEquity"]',
-            '//*[local-name()="TotalEquity"]',
-            '//us-gaap:RetainedEarningsAccumulatedDeficit',
-            '//*[contains(local-name(), "MembersEquityIncludingPortionAttributableToNoncontrollingInterest")]',
-            '//us-gaap:CapitalizationLongtermDebtAndEquity',
-            '//*[local-name()="TotalCapitalization"]'
-        ])
-
-        self.add_xpaths('cash', [
-            '//us-gaap:CashCashEquivalentsAndFederalFundsSold',
-            '//us-gaap:CashAndDueFromBanks',
-            '//us-gaap:CashAndCashEquivalentsAtCarryingValue',
-            '//us-gaap:Cash',
-            '//*[local-name()="CashAndCashEquivalents"]',
-            '//*[contains(local-name(), "CarryingValueOfCashAndCashEquivalents")]',
-            '//*[contains(local-name(), "CashCashEquivalents")]',
-            '//*[contains(local-name(), "CashAndCashEquivalents")]'
-        ])
-
-        self.add_xpaths('cash_flow_op', [
-            '//us-gaap:NetCashProvidedByUsedInOperatingActivities',
-            '//us-gaap:NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'
-        ])
-
-        self.add_xpaths('cash_flow_inv', [
-            '//us-gaap:NetCashProvidedByUsedInInvestingActivities',
-            '//us-gaap:NetCashProvidedByUsedInInvestingActivitiesContinuingOperations'
-        ])
-
-        self.add_xpaths('cash_flow_fin', [
-            '//us-gaap:NetCashProvidedByUsedInFinancingActivities',
-            '//us-gaap:NetCashProvidedByUsedInFinancingActivitiesContinuingOperations'
-        ])
+        self.add_xpaths('assets', FIELD_XPATHS['assets'])
+
+        self.add_xpaths('cur_assets', FIELD_XPATHS['cur_assets'])
+
+        self.add_xpaths('cur_liab', FIELD_XPATHS['cur_liab'])
+
+        self.add_xpaths('equity', FIELD_XPATHS['equity'])
+
+        self.add_xpaths('cash', FIELD_XPATHS['cash'])
+
+        self.add_xpaths('cash_flow_op', FIELD_XPATHS['cash_flow_op'])
+
+        self.add_xpaths('cash_flow_inv', FIELD_XPATHS['cash_flow_inv'])
+
+        self.add_xpaths('cash_flow_fin', FIELD_XPATHS['cash_flow_fin'])
 
     def _get_symbol(self):
         try:
@@ -620,7 +1164,7 @@ class ReportItemLoader(XmlXPathItemLoader):
 
     def _get_doc_fiscal_year(self):
         try:
-            fiscal_year = self.selector.xpath('//dei:DocumentFiscalYearFocus/text()')[0].extract()
+            fiscal_year = select_xpath(self.selector, '//dei:DocumentFiscalYearFocus/text()')[0].extract()
             return int(fiscal_year)
         except (IndexError, ValueError):
             return None
@@ -668,12 +1212,12 @@ class ReportItemLoader(XmlXPathItemLoader):
         url_date_str = url_date.strftime(DATE_FORMAT)
 
         try:
-            doc_date_str = self.selector.xpath('//dei:DocumentPeriodEndDate/text()')[0].extract()
+            doc_date_str = select_xpath(self.selector, '//dei:DocumentPeriodEndDate/text()')[0].extract()
             doc_date = datetime.strptime(doc_date_str, DATE_FORMAT)
         except (IndexError, ValueError):
             return url_date.strftime(DATE_FORMAT)
 
-        context_date_strs = set(self.selector.xpath('//*[local-name()="context"]//*[local-name()="endDate"]/text()').extract())
+        context_date_strs = set(select_xpath(self.selector, '//*[local-name()="context"]//*[local-name()="endDate"]/text()').extract())
 
         date = url_date
         if doc_date_str in context_date_strs:
@@ -683,19 +1227,19 @@ class ReportItemLoader(XmlXPathItemLoader):
 
     def _get_doc_type(self):
         try:
-            return self.selector.xpath('//dei:DocumentType/text()')[0].extract().upper()
+            return select_xpath(self.selector, '//dei:DocumentType/text()')[0].extract().upper()
         except (IndexError, ValueError):
             return None
 
     def _get_period_focus(self, doc_end_date):
         try:
-            return self.selector.xpath('//dei:DocumentFiscalPeriodFocus/text()')[0].extract().strip().upper()
+            return select_xpath(self.selector, '//dei:DocumentFiscalPeriodFocus/text()')[0].extract().strip().upper()
         except IndexError:
             pass
 
         try:
             doc_yr = doc_end_date.split('-')[0]
-            yr_end_date = self.selector.xpath('//dei:CurrentFiscalYearEndDate/text()')[0].extract()
+            yr_end_date = select_xpath(self.selector, '//dei:CurrentFiscalYearEndDate/text()')[0].extract()
             yr_end_date = yr_end_date.replace('--', doc_yr + '-')
         except IndexError:
             return None
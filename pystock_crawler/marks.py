@@ -0,0 +1,73 @@
+'''
+High-water marks for incremental crawling.
+
+A mark is the latest date (in YYYYMMDD format) of a symbol that is already in
+the output. Marks are saved in a text file of "SYMBOL<tab>YYYYMMDD" lines.
+
+'''
+import csv
+import os
+
+
+def load_marks(path):
+    '''Load marks from a file. Return an empty dict if it doesn't exist.'''
+    marks = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) == 2:
+                    marks[tokens[0]] = tokens[1]
+    return marks
+
+
+def save_marks(path, marks):
+    # Write to a temporary file first, so a crash doesn't leave a broken file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for symbol in sorted(marks):
+            f.write('%s\t%s\n' % (symbol, marks[symbol]))
+    os.rename(tmp_path, path)
+
+
+def update_marks(marks, symbol, date):
+    '''Set the mark of `symbol` to `date` if it's later. Return the mark.'''
+    symbol = symbol.upper()
+    date = date.replace('-', '')
+    if date > marks.get(symbol, ''):
+        marks[symbol] = date
+    return marks[symbol]
+
+
+def scan_marks(csv_path, date_field, marks=None):
+    '''
+    Update `marks` with the latest `date_field` of every symbol in a CSV file.
+    Return the marks.
+
+    '''
+    if marks is None:
+        marks = {}
+
+    if not os.path.exists(csv_path):
+        return marks
+
+    with open(csv_path, 'rb') as f:
+        reader = csv.reader(f)
+        try:
+            headers = reader.next()
+        except StopIteration:
+            return marks  # Empty file
+
+        symbol_index = headers.index('symbol')
+        date_index = headers.index(date_field)
+        for row in reader:
+            if len(row) > max(symbol_index, date_index) and row[date_index]:
+                update_marks(marks, row[symbol_index], row[date_index])
+
+    return marks
+
+
+def is_marked(marks, symbol, date):
+    '''Return True if `date` of `symbol` is not later than its mark.'''
+    mark = marks.get(symbol.upper())
+    return bool(mark) and date.replace('-', '') <= mark
@@ -0,0 +1,41 @@
+from scrapy.exceptions import NotConfigured
+
+from pystock_crawler import pricestore
+from pystock_crawler.items import PriceItem, PriceRecord, PriceSeriesItem
+
+
+class PriceStorePipeline(object):
+    '''
+    Save prices (PriceItem, PriceRecord or PriceSeriesItem) to the price
+    store at PRICE_STORE (see pystock_crawler.pricestore), besides the feed
+    output. Needs NumPy.
+
+    '''
+    def __init__(self, crawler):
+        self.path = crawler.settings.get('PRICE_STORE')
+        if not self.path:
+            raise NotConfigured
+        if pricestore.numpy is None:
+            raise NotConfigured('NumPy is required by PRICE_STORE')
+
+        self.stats = crawler.stats
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        self.writer = pricestore.PriceStoreWriter(self.path)
+
+    def close_spider(self, spider):
+        self.writer.close()
+
+    def process_item(self, item, spider):
+        if isinstance(item, (PriceItem, PriceRecord)) and item.get('symbol') and item.get('date'):
+            self.writer.append(item['symbol'], item)
+            self.stats.inc_value('price_store/item_count')
+        elif isinstance(item, PriceSeriesItem) and item.get('symbol'):
+            self.writer.append_columns(item['symbol'], item['columns'])
+            self.stats.inc_value('price_store/item_count', item.num_rows())
+        return item
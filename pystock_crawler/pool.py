@@ -0,0 +1,89 @@
+import multiprocessing
+import signal
+import traceback
+
+from scrapy.http import XmlResponse
+from twisted.internet import defer, reactor
+
+from pystock_crawler.items import ReportItem
+from pystock_crawler.loaders import ReportItemLoader
+
+
+def load_report(url, body, encoding=None):
+    '''Parse an XML report and return its fields as a dict.'''
+    response = XmlResponse(url, body=body, encoding=encoding)
+    loader = ReportItemLoader(response=response)
+    return dict(loader.load_item())
+
+
+def load_report_with_stats(url, body, encoding=None):
+    '''Like load_report(), but return a tuple of the fields and LoaderStats.'''
+    response = XmlResponse(url, body=body, encoding=encoding)
+    loader = ReportItemLoader(response=response, instrument=True)
+    return dict(loader.load_item()), loader.loader_stats
+
+
+def _load_report(args, instrument=False):
+    # Runs in a worker process. Pool.apply_async() in Python 2 has no error
+    # callback, so errors are sent back as a traceback instead of raised.
+    try:
+        if instrument:
+            return load_report_with_stats(*args), None
+        return load_report(*args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _init_worker():
+    # Let the crawling process handle Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ReportLoaderError(Exception):
+    pass
+
+
+class ReportLoaderPool(object):
+    '''
+    Runs ReportItemLoader in worker processes, so parsing a big XBRL document
+    doesn't block the Twisted reactor and all the downloads running in it.
+
+    '''
+    def __init__(self, processes, loader_stats_callback=None):
+        self.pool = multiprocessing.Pool(processes, _init_worker)
+
+        # If set, reports are parsed with instrumentation and it's called with
+        # the response and the LoaderStats of every report
+        self.loader_stats_callback = loader_stats_callback
+
+        # Bytes of the reports that are waiting for or being parsed
+        self.pending_size = 0
+
+    def load_report(self, response):
+        '''Return a Deferred that fires with the ReportItem of the response.'''
+        d = defer.Deferred()
+        self.pending_size += len(response.body)
+
+        def callback(result):
+            # Called in a result handler thread of the pool
+            reactor.callFromThread(self._fire, d, response, result)
+
+        args = (response.url, response.body, response.encoding)
+        instrument = self.loader_stats_callback is not None
+        self.pool.apply_async(_load_report, (args, instrument), callback=callback)
+        return d
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def _fire(self, d, response, result):
+        self.pending_size -= len(response.body)
+        fields, error = result
+        if error:
+            d.errback(ReportLoaderError('Error parsing %s\n%s' % (response.url, error)))
+        else:
+            if self.loader_stats_callback:
+                fields, loader_stats = fields
+                self.loader_stats_callback(response, loader_stats)
+            d.callback(ReportItem(fields))
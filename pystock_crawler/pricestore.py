@@ -0,0 +1,219 @@
+'''
+Daily prices stored as fixed-width NumPy records, so the prices of a symbol
+can be read with ``numpy.memmap`` without loading the whole file.
+
+A store at PATH has two files:
+
+* PATH.dat: records of `PRICE_DTYPE`, appended in the order they are written
+* PATH.idx: JSON index that maps every symbol to the extents of its records,
+  each a [start, count] pair in records
+
+Records of a symbol written one after another share an extent, so a symbol
+crawled in one response is usually one contiguous slice of the data file.
+A symbol has one record per date: a price of a date that is already stored
+replaces the record in place, so crawling the same prices again doesn't add
+duplicates.
+
+'''
+import json
+import os
+
+from itertools import izip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pystock_crawler.columnar import NULL_INT32, to_date, to_float64, to_int64
+
+
+PRICE_FIELDS = ('date', 'open', 'high', 'low', 'close', 'adj_close', 'volume')
+
+PRICE_CONVERTERS = (to_date, to_float64, to_float64, to_float64, to_float64, to_float64, to_int64)
+
+# Dates are days since 1970-01-01
+PRICE_DTYPE = [
+    ('date', '<i4'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('adj_close', '<f8'),
+    ('volume', '<i8')
+]
+
+# Number of records to buffer before writing to the data file
+DEFAULT_BUFFER_SIZE = 4096
+
+
+def price_row(item):
+    '''Convert a PriceItem (or dict) to a record tuple of `PRICE_DTYPE`.'''
+    return tuple(convert(item.get(field)) for field, convert in zip(PRICE_FIELDS, PRICE_CONVERTERS))
+
+
+def _load_index(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'count': 0, 'symbols': {}}
+
+
+class PriceStoreWriter(object):
+    '''
+    Append prices to a store. If the store exists, new records are added
+    after the existing ones, and records of the dates a symbol already has
+    are overwritten.
+
+    '''
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.data_path = path + '.dat'
+        self.index_path = path + '.idx'
+        self.buffer_size = buffer_size
+        self.dtype = numpy.dtype(PRICE_DTYPE)
+
+        index = _load_index(self.index_path)
+        self.symbols = index['symbols']
+        self.count = index['count']
+
+        # Drop records that were written after the index was saved last time,
+        # e.g., by a crawl that crashed
+        self.file = open(self.data_path, 'r+b' if os.path.exists(self.data_path) else 'w+b')
+        self.file.truncate(self.count * self.dtype.itemsize)
+
+        # Memory map of the records written so far, to look up their dates
+        self._data = None
+
+        self._rows = []
+        self._updates = {}
+        self._last_symbol = None
+
+        # Dates of the symbol being written -> record positions. Rows come
+        # grouped by symbol, so only one symbol's dates are kept in memory.
+        self._positions = {}
+        self._positions_symbol = None
+
+    def append(self, symbol, item):
+        self._append_row(symbol, price_row(item))
+
+    def append_columns(self, symbol, columns):
+        '''
+        Append prices in columns, a dict that maps fields to lists of values,
+        like PriceSeriesItem.
+
+        '''
+        num_rows = len(columns.itervalues().next()) if columns else 0
+        converted = []
+        for field, convert in zip(PRICE_FIELDS, PRICE_CONVERTERS):
+            values = columns.get(field)
+            if values is None:
+                converted.append([convert(None)] * num_rows)
+            else:
+                converted.append(map(convert, values))
+        for row in izip(*converted):
+            self._append_row(symbol, row)
+
+    def _dates(self, start, count):
+        '''Return the dates of `count` records from position `start`.'''
+        end = start + count
+        dates = []
+        if start < self.count:
+            if self._data is None or len(self._data) < self.count:
+                self._data = numpy.memmap(self.data_path, self.dtype, 'r', shape=(self.count,))
+            dates.extend(self._data['date'][start:min(end, self.count)].tolist())
+        if end > self.count:
+            dates.extend(row[0] for row in self._rows[max(start - self.count, 0):end - self.count])
+        return dates
+
+    def _date_positions(self, symbol):
+        '''Return a dict that maps the dates of `symbol` to their record positions.'''
+        if symbol != self._positions_symbol:
+            self._positions = {}
+            self._positions_symbol = symbol
+            for start, count in self.symbols.get(symbol, []):
+                self._positions.update((date, start + i) for i, date in enumerate(self._dates(start, count)))
+        return self._positions
+
+    def _append_row(self, symbol, row):
+        symbol = symbol.upper()
+        date = row[0]
+        if date != NULL_INT32:
+            positions = self._date_positions(symbol)
+            position = positions.get(date)
+            if position is not None:
+                if position >= self.count:
+                    self._rows[position - self.count] = row
+                else:
+                    self._updates[position] = row
+                    if len(self._updates) >= self.buffer_size:
+                        self.flush()
+                return
+            positions[date] = self.count + len(self._rows)
+
+        extents = self.symbols.setdefault(symbol, [])
+        position = self.count + len(self._rows)
+        if symbol == self._last_symbol and extents and sum(extents[-1]) == position:
+            extents[-1][1] += 1
+        else:
+            extents.append([position, 1])
+        self._last_symbol = symbol
+
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        for position, row in sorted(self._updates.iteritems()):
+            self.file.seek(position * self.dtype.itemsize)
+            numpy.array([row], self.dtype).tofile(self.file)
+        self._updates = {}
+
+        if self._rows:
+            self.file.seek(self.count * self.dtype.itemsize)
+            numpy.array(self._rows, self.dtype).tofile(self.file)
+            self.count += len(self._rows)
+            self._rows = []
+        self.file.flush()
+
+        # Write to a temporary file first, so a crash doesn't leave a broken
+        # index
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'count': self.count, 'symbols': self.symbols}, f)
+        os.rename(tmp_path, self.index_path)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self._data = None
+
+
+class PriceStore(object):
+    '''Read prices from a store through memory mapping.'''
+
+    def __init__(self, path):
+        index = _load_index(path + '.idx')
+        self.symbols = index['symbols']
+        if index['count']:
+            self.data = numpy.memmap(path + '.dat', PRICE_DTYPE, 'r', shape=(index['count'],))
+        else:
+            self.data = numpy.zeros(0, PRICE_DTYPE)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.symbols
+
+    def __getitem__(self, symbol):
+        '''
+        Return the records of `symbol`. A symbol stored in one extent is a
+        view of the memory-mapped file, otherwise the extents are copied.
+
+        '''
+        extents = self.symbols[symbol.upper()]
+        parts = [self.data[start:start + count] for start, count in extents]
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def dates(self, symbol):
+        '''Return the dates of `symbol` as ``datetime64[D]``.'''
+        return self[symbol]['date'].astype('datetime64[D]')
@@ -0,0 +1,107 @@
+'''
+Re-parse the XML reports kept in edgar spider's HTTP cache without crawling.
+
+'''
+import cPickle as pickle
+import multiprocessing
+import re
+
+from collections import deque
+from scrapy import log
+from scrapy.http import Headers, XmlResponse
+
+from pystock_crawler.items import ReportItem
+from pystock_crawler.pool import _init_worker, _load_report
+from pystock_crawler.spiders.edgar import REPORT_URL_PATTERN, filter_report
+
+
+RE_REPORT_URL = re.compile(REPORT_URL_PATTERN)
+
+
+def iter_cached_responses(db_path):
+    '''
+    Iterate the data dicts (url, status, headers and body) stored by
+    LeveldbCacheStorage in the database at `db_path`.
+
+    '''
+    import leveldb
+    db = leveldb.LevelDB(db_path, create_if_missing=False)
+    for key, value in db.RangeIter():
+        if key.endswith('_data'):
+            yield pickle.loads(value)
+
+
+def iter_cached_reports(db_path):
+    '''Iterate (url, body, encoding) of cached XML reports.'''
+    for data in iter_cached_responses(db_path):
+        if data['status'] == 200 and RE_REPORT_URL.search(data['url']):
+            response = XmlResponse(data['url'], headers=Headers(data['headers']), body=data['body'])
+            yield response.url, response.body, response.encoding
+
+
+def iter_unique_reports(db_paths):
+    '''
+    Iterate (url, body, encoding) of cached XML reports in all the databases
+    at `db_paths`. A report cached in more than one of them, e.g., by lanes
+    of crawls with different -j, is only returned the first time.
+
+    '''
+    seen = set()
+    for db_path in db_paths:
+        log.msg(u'Reparsing reports in %s' % db_path)
+        for args in iter_cached_reports(db_path):
+            if args[0] not in seen:
+                seen.add(args[0])
+                yield args
+
+
+def reparse_reports(db_paths, processes=1):
+    '''
+    Iterate ReportItems of the 10-Q and 10-K reports in the caches at
+    `db_paths` (a path or a list of them). If `processes` > 1, the reports are
+    parsed by that many worker processes.
+
+    '''
+    if isinstance(db_paths, basestring):
+        db_paths = [db_paths]
+
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init_worker)
+        try:
+            for item in _reparse_in_pool(pool, db_paths, processes * 4):
+                yield item
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for args in iter_unique_reports(db_paths):
+            item = _make_item(args[0], _load_report(args))
+            if item:
+                yield item
+
+
+def _reparse_in_pool(pool, db_paths, max_pending):
+    # Pool.imap() reads the whole input in advance, which means all the bodies
+    # would be in memory. Keep at most `max_pending` of them in the pool.
+    pending = deque()
+    for args in iter_unique_reports(db_paths):
+        pending.append((args[0], pool.apply_async(_load_report, (args,))))
+        if len(pending) >= max_pending:
+            url, result = pending.popleft()
+            item = _make_item(url, result.get())
+            if item:
+                yield item
+
+    while pending:
+        url, result = pending.popleft()
+        item = _make_item(url, result.get())
+        if item:
+            yield item
+
+
+def _make_item(url, result):
+    fields, error = result
+    if error:
+        log.msg(u'Error parsing %s\n%s' % (url, error), level=log.ERROR)
+        return None
+    return filter_report(ReportItem(fields))
@@ -0,0 +1,156 @@
+'''
+Run spiders in child processes.
+
+Twisted reactor can't be restarted, so every crawl needs a new process anyway.
+Forking it from the command line process (instead of running a new ``scrapy``
+command) saves the startup time of Python, Scrapy and the settings. The memory
+used by a crawl is returned to the OS as soon as the child process exits.
+
+Don't import ``twisted.internet.reactor`` before forking. The child processes
+would share the same reactor (and its epoll instance) with each other.
+
+'''
+import multiprocessing
+import Queue
+
+from scrapy import log
+
+
+def crawl(spider_name, spider_kwargs=None, settings=None, lane=0):
+    '''
+    Run a spider in the current process and block until it's done. `settings`
+    overrides the project settings, like ``scrapy crawl -s``. A non-zero `lane`
+    gives the crawl files of its own (see `lane_settings()`).
+
+    '''
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    project_settings = get_project_settings()
+
+    # The log observer started by the parent process is inherited
+    project_settings.set('LOG_ENABLED', False, priority='cmdline')
+
+    for name, value in (settings or {}).iteritems():
+        project_settings.set(name, value, priority='cmdline')
+
+    for name, value in lane_settings(project_settings, lane).iteritems():
+        project_settings.set(name, value, priority='cmdline')
+
+    process = CrawlerProcess(project_settings)
+    crawler = process.create_crawler()
+    spider = crawler.spiders.create(spider_name, **(spider_kwargs or {}))
+    crawler.crawl(spider)
+    process.start()
+
+
+def lane_settings(settings, lane):
+    '''
+    Return the settings that give a crawl in a non-zero `lane` an HTTP cache
+    directory and a telemetry file of its own, by suffixing them with the lane.
+    A LevelDB cache can't be opened by multiple processes, and lines appended
+    to the same file by multiple processes may be mixed up.
+
+    '''
+    overrides = {}
+    if lane:
+        for name in ('HTTPCACHE_DIR', 'PASSIVETHROTTLE_TELEMETRY'):
+            if settings.get(name):
+                overrides[name] = '%s-%d' % (settings.get(name), lane)
+    return overrides
+
+
+def crawl_in_child(spider_name, spider_kwargs=None, settings=None, lane=0):
+    '''Run `crawl()` in a child process and wait for it. Return the exit code.'''
+    process = multiprocessing.Process(target=crawl, args=(spider_name, spider_kwargs, settings, lane))
+    process.start()
+    process.join()
+    if process.exitcode:
+        log.msg(u'Crawling %s %r exited with code %s' % (spider_name, spider_kwargs, process.exitcode),
+                level=log.ERROR)
+    return process.exitcode
+
+
+def split_lanes(tasks, jobs):
+    '''
+    Distribute `tasks` round-robin to `jobs` lanes, so the same task always
+    goes to the same lane (and the same HTTP cache) as long as `jobs` is
+    unchanged.
+
+    '''
+    jobs = max(1, min(jobs, len(tasks)))
+    return [tasks[lane::jobs] for lane in xrange(jobs)]
+
+
+def _run_lane(tasks, lane, finish, results=None):
+    '''
+    Run `tasks`, each a tuple of (index, task), one by one. Return the exit
+    codes as a list of (index, exit_code), or put them to `results` queue if
+    it's given.
+
+    '''
+    exit_codes = []
+    for index, task in tasks:
+        spider_name, spider_kwargs, settings = task
+        exit_code = crawl_in_child(spider_name, spider_kwargs, settings, lane)
+        if finish and not exit_code:
+            finish(*task)
+        if results is None:
+            exit_codes.append((index, exit_code))
+        else:
+            results.put((index, exit_code))
+    return exit_codes
+
+
+def crawl_batches(tasks, jobs=1, finish=None):
+    '''
+    Run crawl tasks, each a tuple of (spider_name, spider_kwargs, settings),
+    in `jobs` parallel lanes. A lane runs its tasks one by one, each in a new
+    child process. `finish` is called with the task in the lane process after
+    each successful crawl, so post-processing of a batch runs in parallel too.
+
+    Return the tasks that failed, i.e. whose crawl exited with a non-zero
+    code, or that didn't run or finish because their lane process died.
+
+    '''
+    tasks = list(tasks)
+    lanes = split_lanes(list(enumerate(tasks)), jobs)
+    if len(lanes) == 1:
+        exit_codes = dict(_run_lane(lanes[0], 0, finish))
+    else:
+        results = multiprocessing.Queue()
+        processes = []
+        for lane, lane_tasks in enumerate(lanes):
+            process = multiprocessing.Process(target=_run_lane, args=(lane_tasks, lane, finish, results))
+            process.start()
+            processes.append(process)
+
+        # Keep reading the results while waiting, so the lane processes don't
+        # block on a full queue
+        exit_codes = {}
+        while any(process.is_alive() for process in processes):
+            try:
+                index, exit_code = results.get(timeout=1)
+            except Queue.Empty:
+                continue
+            exit_codes[index] = exit_code
+
+        while True:
+            try:
+                index, exit_code = results.get(timeout=0.1)
+            except Queue.Empty:
+                break
+            exit_codes[index] = exit_code
+
+        for lane, process in enumerate(processes):
+            process.join()
+            if process.exitcode:
+                log.msg(u'Lane %d exited with code %s' % (lane, process.exitcode), level=log.ERROR)
+
+    failed = []
+    for index, task in enumerate(tasks):
+        if exit_codes.get(index, None) != 0:
+            spider_name, spider_kwargs, settings = task
+            log.msg(u'Batch %d failed: %s %r' % (index + 1, spider_name, spider_kwargs), level=log.ERROR)
+            failed.append(task)
+    return failed
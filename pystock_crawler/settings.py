@@ -19,10 +19,30 @@ EXPORT_FIELDS = (
 )
 
 FEED_EXPORTERS = {
+    'columnar': 'pystock_crawler.exporters.ColumnarItemExporter',
     'csv': 'pystock_crawler.exporters.CsvItemExporter2',
     'symbollist': 'pystock_crawler.exporters.SymbolListExporter'
 }
 
+# Number of rows of a chunk in columnar output
+COLUMNAR_CHUNK_SIZE = 65536
+
+ITEM_PIPELINES = {
+    'pystock_crawler.pipelines.PriceStorePipeline': 100
+}
+
+# Make yahoo spider yield PriceRecords instead of PriceItems, which use less
+# memory
+PRICE_RECORDS = False
+
+# Make yahoo spider yield a PriceSeriesItem with all the prices of a symbol,
+# instead of an item for each day. Exporters expand it to rows.
+PRICE_SERIES = False
+
+# Path (without extension) of a NumPy price store to save prices to. See
+# pystock_crawler.pricestore.
+PRICE_STORE = None
+
 HTTPCACHE_ENABLED = True
 
 HTTPCACHE_POLICY = 'scrapy.contrib.httpcache.RFC2616Policy'
@@ -54,4 +74,35 @@ EXTENSIONS = {
 PASSIVETHROTTLE_ENABLED = True
 #PASSIVETHROTTLE_DEBUG = True
 
+# 'passive' multiplies download delay on error responses and halves it on good
+# ones. 'adaptive' adjusts request rate of each download slot from latency and
+# errors of its responses, up to PASSIVETHROTTLE_TARGET_RATE requests/second.
+PASSIVETHROTTLE_MODE = 'passive'
+PASSIVETHROTTLE_TARGET_RATE = 10.0
+
+# Append delay, concurrency, throughput and status codes of every download slot
+# to this file as JSON lines, every PASSIVETHROTTLE_TELEMETRY_INTERVAL seconds.
+# Parallel crawls (-j) write to files suffixed with their lanes (FILE-1, ...).
+PASSIVETHROTTLE_TELEMETRY = None
+PASSIVETHROTTLE_TELEMETRY_INTERVAL = 5.0
+
+# Number of processes that parse XML reports for edgar spider. 0 parses them
+# in the crawling process, which blocks downloads while parsing.
+EDGAR_PARSER_WORKERS = 0
+
+# Scrapy stops scheduling downloads while the responses being scraped take
+# more than 5MB (fixed in Scrapy 0.24), so a big report would stop downloads
+# until it's parsed. Reports waiting for the parser workers aren't counted
+# there as long as they take at most this many bytes in total.
+EDGAR_PARSER_MAX_PENDING_SIZE = 50000000
+
+# How edgar spider finds the reports of a filing. 'html' follows the links on
+# the filing's index page. 'json' reads its directory listing (index.json),
+# which is a fraction of the size and needs no link extraction.
+EDGAR_FILING_INDEX = 'html'
+
+# Record time and number of matches of each field and XPath of XML reports in
+# stats, and log them for each report at DEBUG level
+EDGAR_LOADER_STATS = False
+
 DEPTH_STATS_VERBOSE = True
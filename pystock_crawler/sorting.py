@@ -0,0 +1,178 @@
+'''
+Sort and merge CSV files produced by the spiders.
+
+The rows are ordered by their columns compared one by one as strings, i.e.,
+by symbol and then by date. The first line of a file is the header and is
+never sorted.
+
+'''
+import heapq
+import os
+import shutil
+import string
+import tempfile
+
+
+# Approximate memory used by sorting a line, besides the line and its key
+LINE_OVERHEAD = 100
+
+DEFAULT_BUFFER_SIZE = 256 * 1024 * 1024
+
+# Max number of sorted runs to merge at a time
+DEFAULT_MAX_MERGE = 64
+
+# Replacing commas with the smallest character makes comparing two keys
+# equivalent to comparing the columns one by one, but it only takes one
+# string comparison
+KEY_TABLE = string.maketrans(',', '\x00')
+
+
+def csv_key(line):
+    '''Sort key of a CSV line.'''
+    return line.translate(KEY_TABLE)
+
+
+def sort_csv(filename, buffer_size=DEFAULT_BUFFER_SIZE, max_merge=DEFAULT_MAX_MERGE, tmp_dir=None):
+    '''
+    Sort a CSV file in place. If sorting the file would take more than
+    `buffer_size` bytes of memory, it's sorted in runs of `buffer_size` which
+    are saved to temporary files in `tmp_dir` (the directory of the file by
+    default) and then merged, at most `max_merge` of them at a time.
+
+    '''
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(filename))
+
+    runs = []
+    try:
+        with open(filename, 'rb') as f:
+            header = f.readline()
+            if not header:
+                return  # Empty file
+
+            lines = []
+            size = 0
+            for line in f:
+                if not line.endswith('\n'):
+                    line += '\n'
+                lines.append(line)
+                size += len(line) * 2 + LINE_OVERHEAD
+                if size >= buffer_size:
+                    runs.append(_write_run(lines, tmp_dir))
+                    lines = []
+                    size = 0
+
+        if not runs:
+            # Fits in memory
+            lines.sort(key=csv_key)
+            with open(filename, 'wb') as f:
+                f.write(header)
+                f.writelines(lines)
+            return
+
+        if lines:
+            runs.append(_write_run(lines, tmp_dir))
+        del lines
+
+        while len(runs) > max_merge:
+            merged = []
+            for i in xrange(0, len(runs), max_merge):
+                merged.append(_merge_runs(runs[i:i + max_merge], tmp_dir))
+            runs = merged
+
+        files = [open(run, 'rb') for run in runs]
+        try:
+            with open(filename, 'wb') as out:
+                out.write(header)
+                _merge_files(files, out)
+        finally:
+            for f in files:
+                f.close()
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+
+
+def _write_run(lines, tmp_dir):
+    lines.sort(key=csv_key)
+    fd, path = tempfile.mkstemp(prefix='pystock-sort-', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.writelines(lines)
+    return path
+
+
+def _merge_runs(runs, tmp_dir):
+    # Merge the runs into a new one and delete them
+    fd, path = tempfile.mkstemp(prefix='pystock-sort-', dir=tmp_dir)
+    files = [open(run, 'rb') for run in runs]
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            _merge_files(files, out)
+    finally:
+        for f in files:
+            f.close()
+    for run in runs:
+        os.remove(run)
+    return path
+
+
+def concat_csv(target, sources, append=False):
+    '''
+    Concatenate CSV files to `target`. Only the first header is kept. Empty
+    files are skipped. If `append` is True, the rows are appended to `target`
+    and the headers of the sources are skipped if it already has one.
+
+    '''
+    header_written = append and os.path.exists(target) and os.path.getsize(target) > 0
+    with open(target, 'ab' if append else 'wb') as out:
+        for source in sources:
+            with open(source, 'rb') as f:
+                header = f.readline()
+                if not header:
+                    continue  # Empty file
+                if not header_written:
+                    out.write(header)
+                    header_written = True
+                shutil.copyfileobj(f, out)
+
+
+def _decorate(f, index):
+    # heapq.merge() in Python 2 has no key argument. `index` keeps rows with
+    # equal keys in the order of the sources.
+    for line in f:
+        if not line.endswith('\n'):
+            line += '\n'
+        yield csv_key(line), index, line
+
+
+def _merge_files(files, out):
+    iterables = [_decorate(f, i) for i, f in enumerate(files)]
+    for key, i, line in heapq.merge(*iterables):
+        out.write(line)
+
+
+def merge_csv(target, sources):
+    '''
+    Merge sorted CSV files to `target` with a k-way merge. Only one line of
+    each source is kept in memory at a time.
+
+    '''
+    files = [open(source, 'rb') for source in sources]
+    try:
+        header = None
+        non_empty_files = []
+        for f in files:
+            line = f.readline()
+            if not line:
+                continue  # Empty file
+            header = header or line
+            non_empty_files.append(f)
+
+        with open(target, 'wb') as out:
+            if header:
+                out.write(header)
+            _merge_files(non_empty_files, out)
+    finally:
+        for f in files:
+            f.close()
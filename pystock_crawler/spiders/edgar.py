@@ -1,24 +1,56 @@
+import json
 import os
+import re
+import urlparse
 
-from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+from scrapy import log, signals
+from scrapy.http import Request
 from scrapy.contrib.spiders import CrawlSpider, Rule
 
 from pystock_crawler import utils
+from pystock_crawler.linkextractors import HrefLinkExtractor
 from pystock_crawler.loaders import ReportItemLoader
+from pystock_crawler.marks import is_marked, load_marks, save_marks, update_marks
+from pystock_crawler.pool import ReportLoaderPool
+
+
+# URLs of XBRL instance documents, e.g., .../abc-20130630.xml
+REPORT_URL_PATTERN = '/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml'
+
+RE_REPORT_URL = re.compile(REPORT_URL_PATTERN)
+
+RE_REPORT_DATE = re.compile(r'\-(\d{8})\.xml$')
+
+RE_INDEX_PAGE = re.compile(r'/[^/]+\-index\.html?$')
+
+RE_LIST_SYMBOL = re.compile(r'[?&]CIK=([^&]+)')
+
+
+def filter_report(item):
+    '''Drop the item if it's not from a 10-Q or 10-K report.'''
+    if 'doc_type' in item:
+        doc_type = item['doc_type']
+        if doc_type in ('10-Q', '10-K'):
+            return item
+
+    return None
 
 
 class URLGenerator(object):
 
-    def __init__(self, symbols, start_date='', end_date='', start=0, count=None):
+    def __init__(self, symbols, start_date='', end_date='', start=0, count=None, marks=None):
         end = start + count if count is not None else None
         self.symbols = symbols[start:end]
         self.start_date = start_date
         self.end_date = end_date
+        self.marks = marks or {}
 
     def __iter__(self):
         url = 'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=%s&type=10-&dateb=%s&datea=%s&owner=exclude&count=300'
         for symbol in self.symbols:
-            yield (url % (symbol, self.end_date, self.start_date))
+            # Filings of a marked symbol are filed after its mark
+            start_date = max(self.start_date, self.marks.get(symbol.upper(), ''))
+            yield (url % (symbol, self.end_date, start_date))
 
 
 class EdgarSpider(CrawlSpider):
@@ -27,10 +59,30 @@ class EdgarSpider(CrawlSpider):
     allowed_domains = ['sec.gov']
 
     rules = (
-        Rule(SgmlLinkExtractor(allow=('/Archives/edgar/data/[^\"]+\-index\.htm',))),
-        Rule(SgmlLinkExtractor(allow=('/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml',)), callback='parse_10qk'),
+        Rule(HrefLinkExtractor(allow=('/Archives/edgar/data/[^\"]+\-index\.htm',))),
+        Rule(HrefLinkExtractor(allow=(REPORT_URL_PATTERN,)), callback='parse_10qk'),
     )
 
+    # Indexes of the rules
+    INDEX_RULE = 0
+    REPORT_RULE = 1
+
+    # Parse XML reports in worker processes if EDGAR_PARSER_WORKERS > 0
+    parser_pool = None
+
+    # Bytes of reports in the parser pool that Scrapy's scraper slot doesn't
+    # count (see EDGAR_PARSER_MAX_PENDING_SIZE)
+    parser_max_pending_size = 0
+
+    # Record time and matches of each field and XPath if EDGAR_LOADER_STATS
+    # is True
+    loader_stats_enabled = False
+
+    # 'html' follows the links on the index page of every filing to find its
+    # reports. 'json' reads them from the directory listing of the filing
+    # (index.json), which is much smaller and needs no link extraction.
+    filing_index = 'html'
+
     def __init__(self, **kwargs):
         super(EdgarSpider, self).__init__(**kwargs)
 
@@ -38,11 +90,20 @@ class EdgarSpider(CrawlSpider):
         start_date = kwargs.get('startdate', '')
         end_date = kwargs.get('enddate', '')
         limit_arg = kwargs.get('limit', '')
+        marks_arg = kwargs.get('marks')
+        self.new_marks_path = kwargs.get('newmarks')
 
         utils.check_date_arg(start_date, 'startdate')
         utils.check_date_arg(end_date, 'enddate')
         start, count = utils.parse_limit_arg(limit_arg)
 
+        # Reports not later than the marks are already in the output
+        self.marks = load_marks(marks_arg)
+
+        # Latest end_date of the items of each symbol, saved to
+        # `new_marks_path` when the spider is closed
+        self.new_marks = {}
+
         if symbols_arg:
             if os.path.exists(symbols_arg):
                 # get symbols from a text file
@@ -50,18 +111,138 @@ class EdgarSpider(CrawlSpider):
             else:
                 # inline symbols in command
                 symbols = symbols_arg.split(',')
-            self.start_urls = URLGenerator(symbols, start_date, end_date, start, count)
+            self.start_urls = URLGenerator(symbols, start_date, end_date, start, count, self.marks)
         else:
             self.start_urls = []
 
+    def set_crawler(self, crawler):
+        super(EdgarSpider, self).set_crawler(crawler)
+
+        self.loader_stats_enabled = crawler.settings.getbool('EDGAR_LOADER_STATS')
+
+        self.filing_index = crawler.settings.get('EDGAR_FILING_INDEX', 'html')
+        if self.filing_index not in ('html', 'json'):
+            raise ValueError('Unknown EDGAR_FILING_INDEX: %s' % self.filing_index)
+
+        self.parser_max_pending_size = crawler.settings.getint('EDGAR_PARSER_MAX_PENDING_SIZE')
+        workers = crawler.settings.getint('EDGAR_PARSER_WORKERS')
+        if workers > 0:
+            callback = self.record_loader_stats if self.loader_stats_enabled else None
+            self.parser_pool = ReportLoaderPool(workers, callback)
+            crawler.signals.connect(self.parser_pool.close, signal=signals.spider_closed)
+        if self.new_marks_path:
+            crawler.signals.connect(self.save_new_marks, signal=signals.spider_closed)
+
     def parse_10qk(self, response):
         '''Parse 10-Q or 10-K XML report.'''
-        loader = ReportItemLoader(response=response)
-        item = loader.load_item()
+        if self.parser_pool:
+            d = self.parser_pool.load_report(response)
+            self._release_scraper_slot(response, d)
+            d.addCallback(self.filter_item, self._get_symbol(response))
+            return d
 
-        if 'doc_type' in item:
-            doc_type = item['doc_type']
-            if doc_type in ('10-Q', '10-K'):
-                return item
-
-        return None
+        loader = ReportItemLoader(response=response, instrument=self.loader_stats_enabled)
+        item = loader.load_item()
+        if loader.loader_stats:
+            self.record_loader_stats(response, loader.loader_stats)
+        return self.filter_item(item, self._get_symbol(response))
+
+    def parse_filing_index(self, response):
+        '''Request the reports in the directory listing (index.json) of a filing.'''
+        try:
+            items = json.loads(response.body)['directory']['item']
+        except (ValueError, KeyError, TypeError):
+            self.log(u'Invalid filing index: %s' % response.url, level=log.WARNING)
+            return
+
+        symbol = response.meta.get('symbol', '')
+        for item in items:
+            url = urlparse.urljoin(response.url, item.get('name', ''))
+            if not RE_REPORT_URL.search(url) or self._is_marked_report(symbol, url):
+                continue
+            # Handled like a link to a report on an HTML index page
+            request = Request(url, callback=self._response_downloaded)
+            request.meta.update(rule=self.REPORT_RULE, link_text=u'', symbol=symbol)
+            yield request
+
+    def record_loader_stats(self, response, loader_stats):
+        loader_stats.update_stats(self.crawler.stats, spider=self)
+        self.log(u'Loader stats of %s: %s' % (response.url, loader_stats.format()), level=log.DEBUG)
+
+    def filter_item(self, item, symbol=None):
+        '''
+        Drop the item if it's not a 10-Q or 10-K report or it's marked.
+
+        `symbol` is the symbol that the report is crawled for. Marks are kept
+        by it, since the symbol of the item comes from the report and may be
+        different. Amendments are kept even if their period is marked.
+
+        '''
+        item = filter_report(item)
+        if not item or not item.get('end_date'):
+            return item
+
+        symbol = symbol or item.get('symbol', '')
+        if not item.get('amend') and is_marked(self.marks, symbol, item['end_date']):
+            return None
+        if symbol:
+            update_marks(self.new_marks, symbol, item['end_date'])
+        return item
+
+    def save_new_marks(self):
+        save_marks(self.new_marks_path, self.new_marks)
+
+    def _get_symbol(self, response):
+        # The symbol that the report is crawled for
+        return response.request.meta.get('symbol') if response.request else None
+
+    def _release_scraper_slot(self, response, d):
+        # HACK: Scrapy counts the body of a response in the scraper slot until
+        # its callback is done, and stops scheduling downloads while the slot
+        # has more than 5MB. Take the body out while the report is in the
+        # parser pool, so downloads go on, and put it back before Scrapy
+        # subtracts it.
+        crawler = getattr(self, '_crawler', None)
+        engine = crawler and getattr(crawler, 'engine', None)
+        slot = engine and engine.scraper.slot
+        if not slot or self.parser_pool.pending_size > self.parser_max_pending_size:
+            return
+
+        size = len(response.body)
+        slot.active_size -= size
+
+        def restore(result):
+            slot.active_size += size
+            return result
+        d.addBoth(restore)
+
+    def _response_downloaded(self, response):
+        # HACK: CrawlSpider makes a generator of what a rule callback returns,
+        # which would yield the Deferred of parse_10qk() as is. Return it
+        # directly, so Scrapy waits for the item from the parser pool.
+        rule = self._rules[response.meta['rule']]
+        if self.parser_pool and rule.callback == self.parse_10qk:
+            return rule.callback(response, **rule.cb_kwargs)
+        return super(EdgarSpider, self)._response_downloaded(response)
+
+    def _requests_to_follow(self, response):
+        # HACK: Override this private method to pass the symbol of a filing
+        # list down to its index pages and reports, so that the reports not
+        # later than the mark of the symbol aren't downloaded
+        symbol = response.request.meta.get('symbol') if response.request else None
+        if symbol is None:
+            match = RE_LIST_SYMBOL.search(response.url)
+            symbol = match.group(1) if match else ''
+
+        for request in super(EdgarSpider, self)._requests_to_follow(response):
+            if self._is_marked_report(symbol, request.url):
+                continue
+            if self.filing_index == 'json' and request.meta['rule'] == self.INDEX_RULE:
+                request = request.replace(url=RE_INDEX_PAGE.sub('/index.json', request.url),
+                                          callback=self.parse_filing_index)
+            request.meta['symbol'] = symbol
+            yield request
+
+    def _is_marked_report(self, symbol, url):
+        match = RE_REPORT_DATE.search(url)
+        return bool(match) and is_marked(self.marks, symbol, match.group(1))
@@ -2,11 +2,13 @@ import cStringIO
 import os
 import re
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import izip
 from scrapy.spider import Spider
 
 from pystock_crawler import utils
-from pystock_crawler.items import PriceItem
+from pystock_crawler.items import PriceItem, PriceRecord, PriceSeriesItem
+from pystock_crawler.marks import is_marked, load_marks
 
 
 def parse_date(date_str):
@@ -35,9 +37,90 @@ def make_url(symbol, start_date=None, end_date=None):
     }
 
 
-def generate_urls(symbols, start_date=None, end_date=None):
+class Price(float):
+    '''
+    A price parsed from Yahoo's CSV. It's a float, but it's written as the
+    text it's parsed from, so the CSV output has Yahoo's number format (e.g.
+    34.50, not 34.5).
+
+    '''
+    __slots__ = ('text',)
+
+    def __new__(cls, text):
+        value = float.__new__(cls, text)
+        value.text = text
+        return value
+
+    def __repr__(self):
+        return self.text
+
+    __str__ = __repr__
+
+    def __reduce__(self):
+        return Price, (self.text,)
+
+
+# Types of price fields that are not strings
+PRICE_TYPES = {
+    'open': Price,
+    'high': Price,
+    'low': Price,
+    'close': Price,
+    'adj_close': Price,
+    'volume': int
+}
+
+
+def _convert(convert, value):
+    try:
+        return convert(value)
+    except ValueError:
+        return None
+
+
+def parse_price_columns(body):
+    '''
+    Parse Yahoo's CSV into a dict that maps field names of PriceItem to
+    lists of typed values. Columns that are not fields are dropped.
+
+    '''
+    file_like = cStringIO.StringIO(body)
+    try:
+        headers, columns = utils.parse_csv_columns(file_like)
+    finally:
+        file_like.close()
+
+    result = {}
+    for header, values in izip(headers, columns):
+        field = header.replace(' ', '_').lower()
+        if field not in PriceItem.fields or field == 'symbol':
+            continue
+        convert = PRICE_TYPES.get(field)
+        if convert:
+            try:
+                values = map(convert, values)
+            except ValueError:
+                # Missing values like '' or 'null'
+                values = [_convert(convert, value) for value in values]
+        else:
+            values = list(values)
+        result[field] = values
+    return result
+
+
+def next_day(date_str):
+    date = datetime.strptime(date_str, '%Y%m%d') + timedelta(days=1)
+    return date.strftime('%Y%m%d')
+
+
+def generate_urls(symbols, start_date=None, end_date=None, marks=None):
     for symbol in symbols:
-        yield make_url(symbol, start_date, end_date)
+        symbol_start_date = start_date
+        mark = marks.get(symbol.upper()) if marks else None
+        if mark:
+            # Prices until the mark are already in the output
+            symbol_start_date = max(start_date or '', next_day(mark))
+        yield make_url(symbol, symbol_start_date, end_date)
 
 
 class YahooSpider(Spider):
@@ -45,16 +128,25 @@ class YahooSpider(Spider):
     name = 'yahoo'
     allowed_domains = ['finance.yahoo.com']
 
+    # PriceRecord if PRICE_RECORDS setting is True
+    item_class = PriceItem
+
+    # Yield a PriceSeriesItem for each symbol if PRICE_SERIES setting is True
+    price_series = False
+
     def __init__(self, **kwargs):
         super(YahooSpider, self).__init__(**kwargs)
 
         symbols_arg = kwargs.get('symbols')
         start_date = kwargs.get('startdate', '')
         end_date = kwargs.get('enddate', '')
+        marks_arg = kwargs.get('marks')
 
         utils.check_date_arg(start_date, 'startdate')
         utils.check_date_arg(end_date, 'enddate')
 
+        self.marks = load_marks(marks_arg)
+
         if symbols_arg:
             if os.path.exists(symbols_arg):
                 # get symbols from a text file
@@ -62,22 +154,41 @@ class YahooSpider(Spider):
             else:
                 # inline symbols in command
                 symbols = symbols_arg.split(',')
-            self.start_urls = generate_urls(symbols, start_date, end_date)
+            self.start_urls = generate_urls(symbols, start_date, end_date, self.marks)
         else:
             self.start_urls = []
 
+    def set_crawler(self, crawler):
+        super(YahooSpider, self).set_crawler(crawler)
+        if crawler.settings.getbool('PRICE_RECORDS'):
+            self.item_class = PriceRecord
+        self.price_series = crawler.settings.getbool('PRICE_SERIES')
+
     def parse(self, response):
         symbol = self._get_symbol_from_url(response.url)
-        try:
-            file_like = cStringIO.StringIO(response.body)
-            rows = utils.parse_csv(file_like)
-            for row in rows:
-                item = PriceItem(symbol=symbol)
-                for k, v in row.iteritems():
-                    item[k.replace(' ', '_').lower()] = v
+        columns = parse_price_columns(response.body)
+        fields = columns.keys()
+        dates = columns.get('date')
+
+        if self.price_series:
+            if self.marks and dates:
+                kept = [i for i, date in enumerate(dates)
+                        if not (date and is_marked(self.marks, symbol, date))]
+                if len(kept) < len(dates):
+                    columns = dict((field, [values[i] for i in kept])
+                                   for field, values in columns.iteritems())
+            item = PriceSeriesItem(symbol=symbol, columns=columns)
+            if item.num_rows():
                 yield item
-        finally:
-            file_like.close()
+            return
+
+        # Items are created lazily from the columns
+        for i, values in enumerate(izip(*[columns[field] for field in fields])):
+            if self.marks and dates and dates[i] and is_marked(self.marks, symbol, dates[i]):
+                continue
+            item = self.item_class(izip(fields, values))
+            item['symbol'] = symbol
+            yield item
 
     def _get_symbol_from_url(self, url):
         match = re.search(r'[\?&]s=([^&]*)', url)
@@ -1,3 +1,5 @@
+import cPickle as pickle
+import leveldb
 import os
 import shutil
 import unittest
@@ -6,6 +8,9 @@ import pystock_crawler
 
 from envoy import run
 
+from pystock_crawler.tests.test_pool import BODY
+from pystock_crawler.tests.test_reparse import make_data
+
 
 TEST_DIR = './test_data'
 
@@ -132,6 +137,17 @@ class CrawlPricesTest(CrawlTest):
         self.assert_log()
         self.assert_cache()
 
+    def test_crawl_series(self):
+        r = run('./bin/pystock-crawler prices GOOG,IBM -o %(output)s -l %(log_file)s -w %(working_dir)s '
+                '--series' % self.args)
+        self.assertEqual(r.status_code, 0)
+
+        content = self.get_output_content()
+        self.assertIn('GOOG', content)
+        self.assertIn('IBM', content)
+        self.assert_log()
+        self.assert_cache()
+
     def test_crawl_symbol_file(self):
         # Create a sample symbol file
         symbol_file = os.path.join(TEST_DIR, 'symbols.txt')
@@ -205,3 +221,37 @@ class CrawlReportsTest(CrawlTest):
         filename = self.args['output']
         self.assertFalse(os.path.exists(os.path.join('%s.1' % filename)))
         self.assertFalse(os.path.exists(os.path.join('%s.2' % filename)))
+
+
+class ReparseTest(CrawlTest):
+
+    filename = 'reparse'
+    spider = 'edgar'
+
+    def setUp(self):
+        super(ReparseTest, self).setUp()
+
+        cache_dir = os.path.join(TEST_DIR, '.scrapy', 'httpcache', 'edgar.leveldb')
+        os.makedirs(cache_dir)
+        db = leveldb.LevelDB(cache_dir)
+        for i, symbol in enumerate(('KO', 'MCD')):
+            url = 'http://www.sec.gov/Archives/edgar/data/%d/%s-20130630.xml' % (i, symbol.lower())
+            db.Put('%d_data' % i, pickle.dumps(make_data(url, BODY), protocol=2))
+            db.Put('%d_time' % i, '1400000000.0')
+        del db
+
+    def test_reparse(self):
+        r = run('./bin/pystock-crawler reparse -o %(output)s -l %(log_file)s -w %(working_dir)s -j 2 --sort' % self.args)
+        self.assertEqual(r.status_code, 0)
+
+        lines = self.get_output_content().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('KO,2013-06-28,False,'))
+        self.assertTrue(lines[2].startswith('MCD,2013-06-28,False,'))
+        self.assert_log()
+
+    def test_no_cache(self):
+        shutil.rmtree(os.path.join(TEST_DIR, '.scrapy'))
+        r = run('./bin/pystock-crawler reparse -o %(output)s -w %(working_dir)s' % self.args)
+        self.assertIn('No HTTP cache', r.std_err)
+        self.assertFalse(os.path.exists(self.args['output']))
@@ -0,0 +1,165 @@
+import math
+import os
+import shutil
+import tempfile
+
+from StringIO import StringIO
+
+from pystock_crawler import columnar
+from pystock_crawler.columnar import NULL_INT32, NULL_INT64, ColumnReader, ColumnWriter
+from pystock_crawler.exporters import ColumnarItemExporter
+from pystock_crawler.items import PriceItem, PriceSeriesItem, ReportItem
+from pystock_crawler.tests.base import TestCaseBase
+
+
+COLUMNS = [
+    ('symbol', 'string'),
+    ('date', 'date'),
+    ('close', 'float64'),
+    ('volume', 'int64'),
+    ('amend', 'bool')
+]
+
+ROWS = [
+    ('KO', '1970-01-02', '39.5', '11096700', False),
+    (u'\xc5', '2013-01-02', 1.25, 100, True),
+    ('MCD', None, None, None, None),
+    ('', '', 'n/a', '1.5e3', 'True')
+]
+
+
+class ColumnarTestBase(TestCaseBase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'out.col')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class ColumnWriterTest(ColumnarTestBase):
+
+    def write(self, rows, chunk_size, prefix=''):
+        with open(self.path, 'wb') as f:
+            f.write(prefix)
+            writer = ColumnWriter(f, COLUMNS, chunk_size)
+            for row in rows:
+                writer.write_row(row)
+            writer.close()
+
+    def assert_columns(self, reader):
+        self.assertEqual(reader.names, ['symbol', 'date', 'close', 'volume', 'amend'])
+        self.assertEqual(reader.num_rows, 4)
+        self.assertEqual(list(reader.read_column('symbol')), [u'KO', u'\xc5', u'MCD', u''])
+        self.assertEqual(list(reader.read_column('date')), [1, 15707, NULL_INT32, NULL_INT32])
+        self.assertEqual(list(reader.read_column('volume')), [11096700, 100, NULL_INT64, 1500])
+        self.assertEqual(list(reader.read_column('amend')), [0, 1, -1, 1])
+
+        close = reader.read_column('close')
+        self.assertEqual(list(close[:2]), [39.5, 1.25])
+        self.assertTrue(math.isnan(close[2]))
+        self.assertTrue(math.isnan(close[3]))
+
+    def test_read_write(self):
+        for chunk_size in (1, 3, 100):
+            self.write(ROWS, chunk_size)
+            with ColumnReader(self.path) as reader:
+                self.assertEqual(len(reader.chunks), (len(ROWS) + chunk_size - 1) // chunk_size)
+                self.assert_columns(reader)
+
+    def test_read_after_close(self):
+        self.write(ROWS, 3)
+        with ColumnReader(self.path) as reader:
+            volume = reader.read_column('volume')
+            chunk = reader.read_chunk(0, 'volume')
+        self.assertEqual(volume[:2].sum(), 11096800)
+        self.assertEqual(list(chunk), [11096700, 100, NULL_INT64])
+
+    def test_without_numpy(self):
+        self.write(ROWS, 3)
+        numpy = columnar.numpy
+        columnar.numpy = None
+        try:
+            with ColumnReader(self.path) as reader:
+                self.assertIsInstance(reader.read_column('close'), tuple)
+                self.assert_columns(reader)
+        finally:
+            columnar.numpy = numpy
+
+    def test_prefix(self):
+        # Feed storage opens files in append mode
+        self.write(ROWS, 3, prefix='garbage')
+        with ColumnReader(self.path) as reader:
+            self.assert_columns(reader)
+
+    def test_no_rows(self):
+        self.write([], 3)
+        with ColumnReader(self.path) as reader:
+            self.assertEqual(reader.num_rows, 0)
+            self.assertEqual(list(reader.read_column('close')), [])
+            self.assertEqual(reader.read_column('symbol'), [])
+
+    def test_not_columnar(self):
+        with open(self.path, 'wb') as f:
+            f.write('symbol,date\r\n' * 10)
+        self.assertRaises(ValueError, ColumnReader, self.path)
+
+
+class ColumnarItemExporterTest(ColumnarTestBase):
+
+    def export(self, items):
+        f = StringIO()
+        exporter = ColumnarItemExporter(f)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+
+        with open(self.path, 'wb') as out:
+            out.write(f.getvalue())
+        return ColumnReader(self.path)
+
+    def test_prices(self):
+        items = [
+            PriceItem(symbol='KO', date='2013-01-02', open='38.27', close='38.88', high='38.99',
+                      low='38.2', adj_close='36.68', volume='20349600'),
+            PriceItem(symbol='KO', date='2013-01-03', open='38.9', close='38.75')
+        ]
+        with self.export(items) as reader:
+            self.assertEqual(reader.columns, [
+                ('symbol', 'string'), ('date', 'date'), ('open', 'float64'), ('high', 'float64'),
+                ('low', 'float64'), ('close', 'float64'), ('volume', 'int64'), ('adj_close', 'float64')
+            ])
+            self.assertEqual(list(reader.read_column('date')), [15707, 15708])
+            self.assertEqual(list(reader.read_column('close')), [38.88, 38.75])
+            self.assertEqual(list(reader.read_column('volume')), [20349600, NULL_INT64])
+
+    def test_price_series(self):
+        items = [
+            PriceSeriesItem(symbol='KO', columns={
+                'date': ['2013-01-02', '2013-01-03'],
+                'close': [38.88, 38.75],
+                'volume': [20349600, None]
+            }),
+            PriceItem(symbol='GOOG', date='2013-01-02', close='723.25')
+        ]
+        with self.export(items) as reader:
+            self.assertEqual(reader.num_rows, 3)
+            self.assertEqual(reader.read_column('symbol'), [u'KO', u'KO', u'GOOG'])
+            self.assertEqual(list(reader.read_column('date')), [15707, 15708, 15707])
+            self.assertEqual(list(reader.read_column('close')), [38.88, 38.75, 723.25])
+            self.assertEqual(list(reader.read_column('volume')), [20349600, NULL_INT64, NULL_INT64])
+
+    def test_reports(self):
+        items = [
+            ReportItem(symbol='KO', end_date='2013-03-29', amend=False, period_focus='Q1',
+                       fiscal_year=2013, doc_type='10-Q', revenues=11035000000.0, eps_basic=0.45)
+        ]
+        with self.export(items) as reader:
+            self.assertEqual(reader.names[:6], ['symbol', 'end_date', 'amend', 'period_focus',
+                                                'fiscal_year', 'doc_type'])
+            self.assertEqual(reader.read_column('period_focus'), [u'Q1'])
+            self.assertEqual(list(reader.read_column('fiscal_year')), [2013])
+            self.assertEqual(list(reader.read_column('revenues')), [11035000000.0])
+            self.assertTrue(math.isnan(reader.read_column('dividend')[0]))
@@ -0,0 +1,89 @@
+from StringIO import StringIO
+
+from pystock_crawler.exporters import CsvItemExporter2
+from pystock_crawler.items import PriceItem, PriceRecord, PriceSeriesItem
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class PriceRecordTest(TestCaseBase):
+
+    def test_item_api(self):
+        record = PriceRecord([('date', '2013-11-22'), ('close', 121.38)], symbol='GOOG')
+        self.assertEqual(record['symbol'], 'GOOG')
+        self.assertEqual(record.get('close'), 121.38)
+        self.assertIsNone(record.get('open'))
+        self.assertEqual(record.get('open', 0), 0)
+        self.assertIn('date', record)
+        self.assertNotIn('open', record)
+        self.assertNotIn('fields', record)
+        self.assertEqual(len(record), 3)
+        self.assertEqual(dict(record), {'symbol': 'GOOG', 'date': '2013-11-22', 'close': 121.38})
+        self.assertFalse(hasattr(record, '__dict__') and record.__dict__)
+
+        with self.assertRaises(KeyError):
+            record['open']
+
+        with self.assertRaises(KeyError):
+            record['name'] = 'Google'
+
+        with self.assertRaises(KeyError):
+            record['fields']
+
+        del record['close']
+        self.assertNotIn('close', record)
+
+    def test_export_csv(self):
+        values = {'symbol': 'GOOG', 'date': '2013-11-22', 'open': 121.58, 'volume': 11096700}
+        outputs = []
+        for item_class in (PriceItem, PriceRecord):
+            f = StringIO()
+            exporter = CsvItemExporter2(f)
+            exporter.start_exporting()
+            exporter.export_item(item_class(values))
+            exporter.finish_exporting()
+            outputs.append(f.getvalue())
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[1], 'symbol,date,open,high,low,close,volume,adj_close\r\n'
+                                     'GOOG,2013-11-22,121.58,,,,11096700,\r\n')
+
+
+class PriceSeriesItemTest(TestCaseBase):
+
+    def setUp(self):
+        self.item = PriceSeriesItem(symbol='GOOG', columns={
+            'date': ['2013-11-22', '2013-11-21'],
+            'open': [121.58, None],
+            'volume': [11096700, 8619700]
+        })
+
+    def test_rows(self):
+        self.assertEqual(self.item.num_rows(), 2)
+        self.assertEqual(list(self.item.rows(['symbol', 'date', 'open', 'close', 'volume'])), [
+            ('GOOG', '2013-11-22', 121.58, None, 11096700),
+            ('GOOG', '2013-11-21', None, None, 8619700)
+        ])
+        self.assertEqual(list(self.item.rows(['date'], default='')), [('2013-11-22',), ('2013-11-21',)])
+
+    def test_no_rows(self):
+        item = PriceSeriesItem(symbol='GOOG', columns={})
+        self.assertEqual(item.num_rows(), 0)
+        self.assertEqual(list(item.rows(['symbol', 'date'])), [])
+
+    def test_export_csv(self):
+        rows = [PriceItem(symbol='GOOG', date='2013-11-22', open=121.58, volume=11096700),
+                PriceItem(symbol='GOOG', date='2013-11-21', open=None, volume=8619700)]
+        outputs = []
+        for items in (rows, [self.item]):
+            f = StringIO()
+            exporter = CsvItemExporter2(f)
+            exporter.start_exporting()
+            for item in items:
+                exporter.export_item(item)
+            exporter.finish_exporting()
+            outputs.append(f.getvalue())
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[1], 'symbol,date,open,high,low,close,volume,adj_close\r\n'
+                                     'GOOG,2013-11-22,121.58,,,,11096700,\r\n'
+                                     'GOOG,2013-11-21,,,,,8619700,\r\n')
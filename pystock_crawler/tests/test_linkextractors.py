@@ -0,0 +1,55 @@
+from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+from scrapy.http import HtmlResponse
+
+from pystock_crawler.linkextractors import HrefLinkExtractor, extract_urls
+from pystock_crawler.tests.base import TestCaseBase
+
+
+BODY = '''
+    <html><head><title>EDGAR Filing Documents</title></head>
+    <body>
+    <a href="/Archives/edgar/data/123/456/abc-20130630.xml">abc-20130630.xml</a>
+    <A HREF='/Archives/edgar/data/123/456/abc-20130630_cal.xml'>Calculation</A>
+    <a class="link" href=/Archives/edgar/data/123/789/abc-20130331.xml>Unquoted</a>
+    <a name="top">No href</a>
+    <area shape="rect" href="http://www.sec.gov/Archives/edgar/data/123/456/abc-20130630.xml">
+    <a href="abc-20121231.xml">Relative</a>
+    <a href="/cgi-bin/browse-edgar?action=getcompany&amp;CIK=123&amp;type=10-Q">Filings</a>
+    <a href="/Archives/edgar/data/123/456/abc-20130630.xml#top">Fragment</a>
+    <link href="/Archives/edgar/data/123/456/style.css">
+    <a href="mailto:webmaster@sec.gov">Mail</a>
+    </body></html>
+'''
+
+
+class HrefLinkExtractorTest(TestCaseBase):
+
+    def setUp(self):
+        self.response = HtmlResponse('http://www.sec.gov/Archives/edgar/data/123/456/0001-index.htm', body=BODY)
+
+    def assert_same_as_sgml(self, allow):
+        urls = [link.url for link in HrefLinkExtractor(allow=allow).extract_links(self.response)]
+        sgml_urls = [link.url for link in SgmlLinkExtractor(allow=allow).extract_links(self.response)]
+        self.assertEqual(urls, sgml_urls)
+        return urls
+
+    def test_reports(self):
+        urls = self.assert_same_as_sgml(('/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml',))
+        self.assertEqual(urls, [
+            'http://www.sec.gov/Archives/edgar/data/123/456/abc-20130630.xml',
+            'http://www.sec.gov/Archives/edgar/data/123/789/abc-20130331.xml',
+            'http://www.sec.gov/Archives/edgar/data/123/456/abc-20121231.xml'
+        ])
+
+    def test_all_links(self):
+        urls = self.assert_same_as_sgml(())
+        self.assertIn('http://www.sec.gov/cgi-bin/browse-edgar?CIK=123&action=getcompany&type=10-Q', urls)
+        self.assertNotIn('mailto:webmaster@sec.gov', urls)
+
+    def test_base_url(self):
+        body = '<html><head><base href="http://www.sec.gov/Archives/"></head><a href="abc-index.htm">Link</a></html>'
+        response = HtmlResponse('http://sec.gov/mock', body=body)
+        self.assertEqual(extract_urls(response), ['http://www.sec.gov/Archives/abc-index.htm'])
+
+        # Shared by extractors of the same response
+        self.assertIs(extract_urls(response), extract_urls(response))
@@ -1,10 +1,18 @@
 import os
+import random
 import requests
 import urlparse
 
+from datetime import datetime
 from scrapy.http.response.xml import XmlResponse
-
-from pystock_crawler.loaders import ReportItemLoader
+from scrapy.selector import Selector
+from scrapy.statscol import StatsCollector
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler import loaders
+from pystock_crawler.loaders import (FactTable, IntermediateValue, LoaderStats, ReportElementFilter,
+                                     ReportItemLoader, compile_xpath, find_namespaces, get_fact_query,
+                                     index_contexts, register_namespaces, select_xpath, stream_selector)
 from pystock_crawler.tests.base import SAMPLE_DATA_DIR, TestCaseBase
 
 
@@ -3906,3 +3914,364 @@ class ReportItemLoaderTest(TestCaseBase):
             'cash_flow_inv': -174300000.00000003,
             'cash_flow_fin': -142000000.00000003
         })
+
+
+class IndexContextsTest(TestCaseBase):
+
+    def test_index_contexts(self):
+        selector = Selector(text='''
+            <xbrl>
+              <context id="c1">
+                <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+              </context>
+              <context id="c2">
+                <period><instant>2013-06-30</instant></period>
+              </context>
+              <context id="c3">
+                <period><endDate>2013-06-30</endDate></period>
+              </context>
+              <context id="c2">
+                <period><instant>2012-12-31</instant></period>
+              </context>
+              <Revenues id="f1" contextRef="c1">100</Revenues>
+            </xbrl>
+        ''', type='xml')
+
+        contexts = index_contexts(selector)
+        self.assertEqual(sorted(contexts.keys()), ['c1', 'c2', 'c3'])
+
+        self.assertIsNone(contexts['c1'].instant)
+        self.assertEqual(contexts['c1'].start_date, datetime(2013, 4, 1))
+        self.assertEqual(contexts['c1'].end_date, datetime(2013, 6, 30))
+
+        # First context wins if an ID is duplicated
+        self.assertEqual(contexts['c2'].instant, datetime(2013, 6, 30))
+        self.assertIsNone(contexts['c2'].start_date)
+        self.assertIsNone(contexts['c2'].end_date)
+
+        # Incomplete date range
+        self.assertIsNone(contexts['c3'].instant)
+        self.assertIsNone(contexts['c3'].start_date)
+        self.assertIsNone(contexts['c3'].end_date)
+
+    def test_memberness(self):
+        selector = Selector(text='''
+            <xbrl>
+              <context id="c1"><period><instant>2013-06-30</instant></period></context>
+              <context id="c2">
+                <entity><segment><explicitMember>abc:SegmentMember</explicitMember></segment></entity>
+                <period><instant>2013-06-30</instant></period>
+              </context>
+              <context id="c3">
+                <entity><segment><explicitMember>us-gaap:ParentCompanyMember</explicitMember></segment></entity>
+                <period><instant>2013-06-30</instant></period>
+              </context>
+              <context id="c4">
+                <entity><segment><explicitMember>abc:SuccessorMember</explicitMember></segment></entity>
+                <period><instant>2013-06-30</instant></period>
+              </context>
+            </xbrl>
+        ''', type='xml')
+
+        contexts = index_contexts(selector)
+        self.assertEqual([contexts[c].memberness for c in ('c1', 'c2', 'c3', 'c4')], [0, 3, 2, 1])
+        self.assertEqual([contexts[c].member for c in ('c1', 'c2', 'c3', 'c4')], [False, True, False, False])
+
+        imd_value = IntermediateValue('Revenues', 100.0, '100', contexts['c2'].context,
+                                      memberness=contexts['c2'].memberness, member=contexts['c2'].member)
+        self.assertEqual(imd_value.memberness, 3)
+        self.assertTrue(imd_value.is_member())
+
+        # Computed from the context if not given
+        imd_value = IntermediateValue('Revenues', 100.0, '100', contexts['c3'].context)
+        self.assertEqual(imd_value.memberness, 2)
+        self.assertFalse(imd_value.is_member())
+
+        # No context at all
+        imd_value = IntermediateValue('', 0.0, '0', None)
+        self.assertEqual(imd_value.memberness, 3)
+        self.assertTrue(imd_value.is_member())
+
+
+class FactTableTest(TestCaseBase):
+
+    def setUp(self):
+        self.selector = Selector(text='''
+            <xbrl xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31" xmlns:abc="http://abc.com/2011">
+              <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+              <abc:Revenues contextRef="c1">110</abc:Revenues>
+              <abc:TotalRevenuesAfterTax contextRef="c1">120</abc:TotalRevenuesAfterTax>
+              <us-gaap:NetIncomeLoss contextRef="c1">20</us-gaap:NetIncomeLoss>
+              <abc:NetIncomeLossPerShare contextRef="c1">0.2</abc:NetIncomeLossPerShare>
+              <us-gaap:Revenues contextRef="c2">130</us-gaap:Revenues>
+            </xbrl>
+        ''', type='xml')
+        register_namespaces(self.selector)
+        self.table = FactTable(self.selector)
+
+    def assert_same_as_xpath(self, xpath):
+        expected = self.selector.xpath(xpath).extract()
+        self.assertTrue(expected)
+        self.assertEqual(self.table.select(xpath).extract(), expected)
+
+    def test_select(self):
+        self.assert_same_as_xpath('//us-gaap:Revenues')
+        self.assert_same_as_xpath('//*[local-name()="Revenues"]')
+        self.assert_same_as_xpath('//*[contains(local-name(), "Revenues")]')
+        self.assert_same_as_xpath('//*[contains(local-name(), "TotalRevenues") and contains(local-name(), "After")]')
+        self.assert_same_as_xpath('//*[local-name()="NetIncomeLoss" or local-name()="Revenues"]')
+        self.assert_same_as_xpath('//*[contains(local-name(), "NetIncomeLoss") and not(contains(local-name(), "Per"))]')
+        self.assert_same_as_xpath('//*[starts-with(local-name(), "NetIncome")]')
+
+    def test_no_match(self):
+        self.assertEqual(self.table.select('//us-gaap:Assets'), [])
+        self.assertEqual(self.table.select('//*[local-name()="Assets"]'), [])
+
+    def test_undefined_prefix(self):
+        with self.assertRaises(ValueError):
+            self.table.select('//dei:DocumentType')
+
+    def test_unsupported_xpath(self):
+        self.assertIsNone(get_fact_query('//us-gaap:Revenues/text()'))
+        self.assertIsNone(get_fact_query('//*[@id="c1"]'))
+        self.assertIsNone(self.table.select('//*[@contextRef="c1"]'))
+
+
+class SelectXPathTest(TestCaseBase):
+
+    def make_selector(self, version):
+        selector = Selector(text='''
+            <xbrl xmlns:dei="http://xbrl.sec.gov/dei/%s" xmlns:us-gaap="http://fasb.org/us-gaap/%s">
+              <context id="c1"><instant>2013-06-30</instant></context>
+              <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+              <us-gaap:Revenues contextRef="c1" decimals="-6">100</us-gaap:Revenues>
+            </xbrl>
+        ''' % (version, version), type='xml')
+        register_namespaces(selector)
+        return selector
+
+    def test_same_as_xpath(self):
+        selector = self.make_selector('2011-01-31')
+        revenues = selector.xpath('//us-gaap:Revenues')[0]
+        for node, xpath in ((selector, '//dei:DocumentType/text()'),
+                            (selector, '//*[local-name()="context"]'),
+                            (selector, '//us-gaap:Revenues'),
+                            (revenues, '@contextRef'),
+                            (revenues, './text()'),
+                            (revenues, 'local-name()'),
+                            (revenues, '@id')):
+            self.assertEqual(select_xpath(node, xpath).extract(), node.xpath(xpath).extract())
+
+        # Text has no XPath
+        text = selector.xpath('//dei:DocumentType/text()')[0]
+        self.assertEqual(select_xpath(text, './text()'), [])
+
+    def test_cache(self):
+        selector_2011 = self.make_selector('2011-01-31')
+        selector_2012 = self.make_selector('2012-01-31')
+        xpath = '//us-gaap:Revenues/text()'
+
+        compiled = compile_xpath(xpath, selector_2011.namespaces)
+        self.assertIs(compile_xpath(xpath, selector_2011.namespaces), compiled)
+        self.assertIsNot(compile_xpath(xpath, selector_2012.namespaces), compiled)
+        self.assertIs(compile_xpath('@contextRef', selector_2011.namespaces),
+                      compile_xpath('@contextRef', selector_2012.namespaces))
+
+        # Prefixes are bound to the namespaces of each document
+        self.assertEqual(select_xpath(selector_2011, xpath).extract(), [u'100'])
+        self.assertEqual(select_xpath(selector_2012, xpath).extract(), [u'100'])
+
+    def test_invalid_xpath(self):
+        selector = self.make_selector('2011-01-31')
+        with self.assertRaises(ValueError):
+            select_xpath(selector, '//us-gaap:Revenues[')
+        with self.assertRaises(ValueError):
+            select_xpath(selector, '//abc:Revenues')
+
+
+class FindNamespacesTest(TestCaseBase):
+
+    names = ('xmlns', 'xbrli', 'dei', 'us-gaap')
+
+    def test_root(self):
+        selector = Selector(text='''
+            <xbrl xmlns="http://www.xbrl.org/2003/instance" xmlns:dei="http://xbrl.sec.gov/dei/2013-01-31">
+              <dei:DocumentType>10-K</dei:DocumentType>
+            </xbrl>
+        ''', type='xml')
+        self.assertEqual(find_namespaces(selector, self.names), {
+            'xmlns': 'http://www.xbrl.org/2003/instance',
+            'dei': 'http://xbrl.sec.gov/dei/2013-01-31'
+        })
+
+    def test_descendants(self):
+        selector = Selector(text='''
+            <xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance">
+              <xbrli:context id="c1"/>
+              <us-gaap:Revenues xmlns:us-gaap="http://fasb.org/us-gaap/2013-01-31">100</us-gaap:Revenues>
+            </xbrli:xbrl>
+        ''', type='xml')
+        self.assertEqual(find_namespaces(selector, self.names), {
+            'xbrli': 'http://www.xbrl.org/2003/instance',
+            'us-gaap': 'http://fasb.org/us-gaap/2013-01-31'
+        })
+
+        # Only the head of the document is scanned
+        limit = loaders.NAMESPACE_SCAN_LIMIT
+        loaders.NAMESPACE_SCAN_LIMIT = 2
+        try:
+            self.assertEqual(find_namespaces(selector, self.names), {
+                'xbrli': 'http://www.xbrl.org/2003/instance'
+            })
+        finally:
+            loaders.NAMESPACE_SCAN_LIMIT = limit
+
+
+class StreamSelectorTest(TestCaseBase):
+
+    def test_stream_selector(self):
+        body = '''<?xml version="1.0" encoding="utf-8"?>
+            <xbrl xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31" xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <entity><segment><explicitMember>us-gaap:ParentCompanyMember</explicitMember></segment></entity>
+                <period><instant>2013-06-30</instant></period>
+              </context>
+              <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+              <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+              <us-gaap:Liabilities contextRef="c1">200</us-gaap:Liabilities>
+              <us-gaap:SignificantAccountingPoliciesTextBlock contextRef="c1">Long text</us-gaap:SignificantAccountingPoliciesTextBlock>
+              <tuple>
+                <us-gaap:SalesRevenueNet contextRef="c1">300</us-gaap:SalesRevenueNet>
+                <us-gaap:Goodwill contextRef="c1">400</us-gaap:Goodwill>
+              </tuple>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        keep = ReportElementFilter(['//us-gaap:Revenues', '//*[contains(local-name(), "SalesRevenue")]'])
+        selector = stream_selector(response, keep)
+        register_namespaces(selector)
+
+        self.assertEqual(selector.xpath('//*[local-name()="explicitMember"]/text()').extract(),
+                         [u'us-gaap:ParentCompanyMember'])
+        self.assertEqual(selector.xpath('//*[local-name()="instant"]/text()').extract(), [u'2013-06-30'])
+        self.assertEqual(selector.xpath('//dei:DocumentType/text()').extract(), [u'10-Q'])
+        self.assertEqual(selector.xpath('//us-gaap:Revenues/text()').extract(), [u'100'])
+        self.assertEqual(selector.xpath('//us-gaap:SalesRevenueNet/text()').extract(), [u'300'])
+        self.assertEqual(selector.xpath('//us-gaap:Liabilities'), [])
+        self.assertEqual(selector.xpath('//us-gaap:SignificantAccountingPoliciesTextBlock'), [])
+        self.assertEqual(selector.xpath('//us-gaap:Goodwill'), [])
+
+    def test_multiple_chunks(self):
+        # Facts between text blocks of varied sizes, so dropped elements end
+        # at and around the boundaries of the parse chunks
+        rand = random.Random(2)
+        facts = [
+            ('dei:DocumentType', 'c1', '10-Q'),
+            ('dei:DocumentPeriodEndDate', 'c1', '2013-06-30'),
+            ('dei:DocumentFiscalYearFocus', 'c1', '2013'),
+            ('dei:DocumentFiscalPeriodFocus', 'c1', 'Q2'),
+            ('dei:TradingSymbol', 'c1', 'ABC'),
+            ('us-gaap:Revenues', 'c1', '1000'),
+            ('us-gaap:OperatingIncomeLoss', 'c1', '300'),
+            ('us-gaap:NetIncomeLoss', 'c1', '200'),
+            ('us-gaap:CashAndCashEquivalentsAtCarryingValue', 'c2', '500'),
+            ('us-gaap:NetCashProvidedByUsedInOperatingActivities', 'c1', '400'),
+            ('us-gaap:NetCashProvidedByUsedInInvestingActivities', 'c1', '-100'),
+            ('us-gaap:NetCashProvidedByUsedInFinancingActivities', 'c1', '-50')
+        ]
+        facts.extend(('us-gaap:Assets', 'c2', str(rand.randint(1, 10000))) for i in xrange(2000))
+        parts = ['''<?xml version="1.0" encoding="utf-8"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance" xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1"><period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period></context>
+              <context id="c2"><period><instant>2013-06-30</instant></period></context>
+        ''']
+        for name, context, value in facts:
+            parts.append('<%s contextRef="%s" decimals="0">%s</%s>\n' % (name, context, value, name))
+            parts.append('<us-gaap:SomeTextBlock contextRef="c1">%s</us-gaap:SomeTextBlock>\n' %
+                         ('x' * rand.randint(0, 5000)))
+        parts.append('</xbrl>')
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=''.join(parts))
+
+        selector = stream_selector(response, ReportElementFilter(['//us-gaap:Assets']))
+        register_namespaces(selector)
+        full_selector = Selector(response)
+        register_namespaces(full_selector)
+        self.assertEqual(selector.xpath('//us-gaap:Assets/text()').extract(),
+                         full_selector.xpath('//us-gaap:Assets/text()').extract())
+        self.assertEqual(selector.xpath('//us-gaap:SomeTextBlock'), [])
+
+        item = ReportItemLoader(response=response).load_item()
+        threshold = loaders.THRESHOLD_TO_CLEAN
+        loaders.THRESHOLD_TO_CLEAN = 0
+        try:
+            streamed_item = ReportItemLoader(response=response).load_item()
+        finally:
+            loaders.THRESHOLD_TO_CLEAN = threshold
+        self.assertEqual(dict(streamed_item), dict(item))
+        self.assertEqual(item['revenues'], 1000.0)
+
+    def test_keep_all(self):
+        # Unsupported XPath, can't tell which elements to drop
+        keep = ReportElementFilter(['//us-gaap:Revenues', '//*[@id="abc"]'])
+        self.assertTrue(keep.keep_all)
+
+    def test_unparsable(self):
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body='')
+        self.assertIsNone(stream_selector(response, lambda element: True))
+
+
+class LoaderStatsTest(TestCaseBase):
+
+    def setUp(self):
+        body = '''<?xml version="1.0" encoding="utf-8"?>
+            <xbrl xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31" xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <startDate>2013-03-31</startDate>
+                <endDate>2013-06-28</endDate>
+              </context>
+              <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+              <dei:DocumentPeriodEndDate contextRef="c1">2013-06-28</dei:DocumentPeriodEndDate>
+              <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+              <us-gaap:Revenues contextRef="c1">110</us-gaap:Revenues>
+            </xbrl>
+        '''
+        self.response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+
+    def test_instrument(self):
+        loader = ReportItemLoader(response=self.response, instrument=True)
+        item = loader.load_item()
+        self.assertEqual(item['revenues'], 110.0)
+
+        stats = loader.loader_stats
+        self.assertIn('revenues', stats.fields)
+        self.assertIn('doc_type', stats.fields)
+        self.assertEqual(stats.xpaths[('revenues', '//us-gaap:SalesRevenueNet')][1], 0)
+        self.assertEqual(stats.xpaths[('revenues', '//us-gaap:Revenues')][1], 2)
+
+        # Not tried after a match
+        self.assertNotIn(('revenues', '//us-gaap:SalesRevenueGoodsNet'), stats.xpaths)
+
+        self.assertAlmostEqual(stats.total_time(), sum(stats.fields.values()))
+        self.assertTrue(stats.format().endswith('ms'))
+
+    def test_not_instrumented(self):
+        loader = ReportItemLoader(response=self.response)
+        loader.load_item()
+        self.assertIsNone(loader.loader_stats)
+
+    def test_update_stats(self):
+        stats = LoaderStats()
+        stats.add_xpath('revenues', '//us-gaap:Revenues', 0.001, 0)
+        stats.add_xpath('revenues', '//us-gaap:SalesRevenueNet', 0.002, 2)
+        stats.add_output('revenues', 0.003)
+
+        crawler_stats = StatsCollector(get_crawler())
+        stats.update_stats(crawler_stats)
+        stats.update_stats(crawler_stats)
+        self.assertEqual(crawler_stats.get_value('loader/document_count'), 2)
+        self.assertAlmostEqual(crawler_stats.get_value('loader/time_ms'), 12.0)
+        self.assertAlmostEqual(crawler_stats.get_value('loader/field/revenues/time_ms'), 12.0)
+        self.assertEqual(crawler_stats.get_value('loader/xpath/revenues///us-gaap:SalesRevenueNet/count'), 2)
+        self.assertEqual(crawler_stats.get_value('loader/xpath/revenues///us-gaap:SalesRevenueNet/matches'), 4)
+        self.assertEqual(stats.format(), '6.0 ms: revenues 6.0 ms')
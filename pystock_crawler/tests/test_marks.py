@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.marks import is_marked, load_marks, save_marks, scan_marks, update_marks
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class MarksTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.dir, 'out.csv.marks')
+        self.assertEqual(load_marks(path), {})
+
+        save_marks(path, {'KO': '20130630', 'AAPL': '20140101'})
+        with open(path) as f:
+            self.assertEqual(f.read(), 'AAPL\t20140101\nKO\t20130630\n')
+        self.assertEqual(load_marks(path), {'KO': '20130630', 'AAPL': '20140101'})
+
+    def test_update_marks(self):
+        marks = {}
+        self.assertEqual(update_marks(marks, 'ko', '2013-06-30'), '20130630')
+        self.assertEqual(update_marks(marks, 'KO', '2013-03-31'), '20130630')
+        self.assertEqual(update_marks(marks, 'KO', '2013-09-30'), '20130930')
+        self.assertEqual(marks, {'KO': '20130930'})
+
+    def test_scan_marks(self):
+        path = os.path.join(self.dir, 'out.csv')
+        with open(path, 'wb') as f:
+            f.write('symbol,end_date,amend\r\n'
+                    'KO,2013-06-30,False\r\n'
+                    'AAPL,2013-03-31,False\r\n'
+                    'KO,2013-09-30,False\r\n'
+                    'KO,2013-03-31,True\r\n'
+                    'FB,,False\r\n')
+
+        self.assertEqual(scan_marks(path, 'end_date'), {'KO': '20130930', 'AAPL': '20130331'})
+
+        # Update existing marks
+        marks = {'AAPL': '20140101', 'FB': '20120101'}
+        self.assertEqual(scan_marks(path, 'end_date', marks),
+                         {'KO': '20130930', 'AAPL': '20140101', 'FB': '20120101'})
+
+        # No file or empty file
+        self.assertEqual(scan_marks(os.path.join(self.dir, 'none.csv'), 'end_date'), {})
+        open(path, 'w').close()
+        self.assertEqual(scan_marks(path, 'end_date'), {})
+
+    def test_is_marked(self):
+        marks = {'KO': '20130630'}
+        self.assertTrue(is_marked(marks, 'KO', '20130630'))
+        self.assertTrue(is_marked(marks, 'ko', '2013-03-31'))
+        self.assertFalse(is_marked(marks, 'KO', '2013-07-01'))
+        self.assertFalse(is_marked(marks, 'AAPL', '2013-03-31'))
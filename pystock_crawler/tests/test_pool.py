@@ -0,0 +1,86 @@
+from scrapy.http import XmlResponse
+from twisted.internet import defer
+
+from pystock_crawler.items import ReportItem
+from pystock_crawler.loaders import LoaderStats
+from pystock_crawler.pool import ReportLoaderError, ReportLoaderPool, _load_report, load_report
+from pystock_crawler.tests.base import TestCaseBase
+
+
+URL = 'http://sec.gov/Archives/edgar/data/123/abc-20130720.xml'
+
+BODY = '''<?xml version="1.0"?>
+<xbrl xmlns="http://www.xbrl.org/2003/instance"
+      xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+      xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+  <context id="c1">
+    <startDate>2013-03-31</startDate>
+    <endDate>2013-06-28</endDate>
+  </context>
+  <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+  <dei:DocumentPeriodEndDate contextRef="c1">2013-06-28</dei:DocumentPeriodEndDate>
+  <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+</xbrl>
+'''
+
+
+class LoadReportTest(TestCaseBase):
+
+    def test_load_report(self):
+        fields = load_report(URL, BODY)
+        self.assertEqual(fields['symbol'], 'ABC')
+        self.assertEqual(fields['doc_type'], '10-Q')
+        self.assertEqual(fields['end_date'], '2013-06-28')
+        self.assertEqual(fields['revenues'], 100.0)
+
+    def test_load_report_with_stats(self):
+        (fields, loader_stats), error = _load_report((URL, BODY, None), True)
+        self.assertIsNone(error)
+        self.assertEqual(fields['revenues'], 100.0)
+        self.assertIsInstance(loader_stats, LoaderStats)
+        self.assertEqual(loader_stats.xpaths[('revenues', '//us-gaap:Revenues')][1], 1)
+
+    def test_error(self):
+        fields, error = _load_report((None, BODY, None))
+        self.assertIsNone(fields)
+        self.assertIn('Traceback', error)
+
+
+class ReportLoaderPoolTest(TestCaseBase):
+
+    def setUp(self):
+        self.pool = ReportLoaderPool(1)
+        self.response = XmlResponse(URL, body=BODY)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def fire(self, result):
+        # Deliver the result like the pool does, without a running reactor
+        d = defer.Deferred()
+        self.pool._fire(d, self.response, result)
+        results = []
+        d.addBoth(results.append)
+        return results[0]
+
+    def test_load_report(self):
+        result = self.pool.pool.apply(_load_report, ((URL, BODY, None),))
+        item = self.fire(result)
+        self.assertIsInstance(item, ReportItem)
+        self.assertEqual(item['doc_type'], '10-Q')
+        self.assertEqual(item['revenues'], 100.0)
+
+    def test_error(self):
+        failure = self.fire((None, 'Traceback'))
+        self.assertTrue(failure.check(ReportLoaderError))
+        self.assertIn(URL, str(failure.value))
+
+    def test_loader_stats_callback(self):
+        results = []
+        self.pool.loader_stats_callback = lambda response, loader_stats: results.append(loader_stats)
+
+        result = self.pool.pool.apply(_load_report, ((URL, BODY, None), True))
+        item = self.fire(result)
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(len(results), 1)
+        self.assertIn('revenues', results[0].fields)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler import pricestore
+from pystock_crawler.items import PriceItem, PriceSeriesItem, SymbolItem
+from pystock_crawler.pipelines import PriceStorePipeline
+from pystock_crawler.tests.base import TestCaseBase
+
+
+def make_item(symbol, date, close, volume='100'):
+    return PriceItem(symbol=symbol, date=date, open='1.0', high='2.0', low='0.5',
+                     close=close, adj_close=close, volume=volume)
+
+
+class PriceStoreTestBase(TestCaseBase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'prices')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+@unittest.skipIf(pricestore.numpy is None, 'NumPy is not installed')
+class PriceStoreTest(PriceStoreTestBase):
+
+    def test_read_write(self):
+        writer = pricestore.PriceStoreWriter(self.path, buffer_size=2)
+        writer.append('KO', make_item('KO', '2013-01-02', '38.88'))
+        writer.append('KO', make_item('KO', '2013-01-03', '38.75'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-02', '723.25'))
+        writer.append('ko', make_item('KO', '2013-01-04', '39.1', volume=''))
+        writer.close()
+
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(store.symbols, {'KO': [[0, 2], [3, 1]], 'GOOG': [[2, 1]]})
+        self.assertIn('goog', store)
+        self.assertNotIn('MCD', store)
+
+        goog = store['GOOG']
+        self.assertIsInstance(goog, pricestore.numpy.memmap)
+        self.assertEqual(goog['close'].tolist(), [723.25])
+
+        ko = store['KO']
+        self.assertEqual(ko['close'].tolist(), [38.88, 38.75, 39.1])
+        self.assertEqual(ko['volume'].tolist(), [100, 100, pricestore.to_int64(None)])
+        self.assertEqual([str(d) for d in store.dates('KO')], ['2013-01-02', '2013-01-03', '2013-01-04'])
+
+    def test_append(self):
+        writer = pricestore.PriceStoreWriter(self.path)
+        writer.append('KO', make_item('KO', '2013-01-02', '38.88'))
+        writer.close()
+
+        # Records written after the last saved index are dropped
+        with open(self.path + '.dat', 'ab') as f:
+            f.write('garbage')
+
+        writer = pricestore.PriceStoreWriter(self.path)
+        writer.append('KO', make_item('KO', '2013-01-03', '38.75'))
+        writer.close()
+
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(store.symbols, {'KO': [[0, 1], [1, 1]]})
+        self.assertEqual(store['KO']['close'].tolist(), [38.88, 38.75])
+
+    def test_same_dates(self):
+        writer = pricestore.PriceStoreWriter(self.path, buffer_size=2)
+        writer.append('KO', make_item('KO', '2013-01-03', '38.75'))
+        writer.append('KO', make_item('KO', '2013-01-02', '38.88'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-02', '723.25'))
+        writer.close()
+
+        # Crawl the same prices again, with newer ones and a changed price
+        writer = pricestore.PriceStoreWriter(self.path, buffer_size=2)
+        writer.append('KO', make_item('KO', '2013-01-04', '39.1'))
+        writer.append('KO', make_item('KO', '2013-01-03', '38.76'))
+        writer.append('KO', make_item('KO', '2013-01-02', '38.88'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-03', '723.67'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-03', '723.68'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-02', '723.25'))
+        writer.close()
+
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(store.symbols, {'KO': [[0, 2], [3, 1]], 'GOOG': [[2, 1], [4, 1]]})
+        self.assertEqual(len(store.data), 5)
+        self.assertEqual(store['KO']['close'].tolist(), [38.76, 38.88, 39.1])
+        self.assertEqual(store['GOOG']['close'].tolist(), [723.25, 723.68])
+
+    def test_same_dates_after_other_symbols(self):
+        # Only the dates of the current symbol are kept, the others are looked
+        # up again from the file and the buffer
+        writer = pricestore.PriceStoreWriter(self.path, buffer_size=3)
+        writer.append('KO', make_item('KO', '2013-01-02', '38.88'))
+        writer.append('KO', make_item('KO', '2013-01-03', '38.75'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-02', '723.25'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-03', '723.67'))
+        self.assertEqual(writer._positions_symbol, 'GOOG')
+        writer.append('KO', make_item('KO', '2013-01-03', '38.76'))
+        writer.append('GOOG', make_item('GOOG', '2013-01-03', '723.68'))
+        writer.close()
+
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(len(store.data), 4)
+        self.assertEqual(store['KO']['close'].tolist(), [38.88, 38.76])
+        self.assertEqual(store['GOOG']['close'].tolist(), [723.25, 723.68])
+
+    def test_empty(self):
+        pricestore.PriceStoreWriter(self.path).close()
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(store.symbols, {})
+        self.assertEqual(len(store.data), 0)
+
+
+@unittest.skipIf(pricestore.numpy is None, 'NumPy is not installed')
+class PriceStorePipelineTest(PriceStoreTestBase):
+
+    def test_not_configured(self):
+        crawler = get_crawler()
+        self.assertRaises(NotConfigured, PriceStorePipeline.from_crawler, crawler)
+
+    def test_process_item(self):
+        crawler = get_crawler({'PRICE_STORE': self.path})
+        pipeline = PriceStorePipeline.from_crawler(crawler)
+        pipeline.open_spider(None)
+
+        item = make_item('KO', '2013-01-02', '38.88')
+        self.assertIs(pipeline.process_item(item, None), item)
+
+        # Skip other items
+        item = SymbolItem(symbol='KO', name='Coca-Cola')
+        self.assertIs(pipeline.process_item(item, None), item)
+
+        item = PriceSeriesItem(symbol='GOOG', columns={
+            'date': ['2013-01-02', '2013-01-03'],
+            'close': [723.25, 723.67]
+        })
+        self.assertIs(pipeline.process_item(item, None), item)
+
+        pipeline.close_spider(None)
+
+        store = pricestore.PriceStore(self.path)
+        self.assertEqual(store['KO']['close'].tolist(), [38.88])
+        self.assertEqual(store['GOOG']['close'].tolist(), [723.25, 723.67])
+        self.assertEqual(store['GOOG']['volume'].tolist(), [pricestore.to_int64(None)] * 2)
+        self.assertEqual(crawler.stats.get_value('price_store/item_count'), 3)
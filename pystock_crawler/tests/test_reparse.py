@@ -0,0 +1,81 @@
+import cPickle as pickle
+import leveldb
+import shutil
+import tempfile
+
+from pystock_crawler.reparse import iter_cached_reports, reparse_reports
+from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.tests.test_pool import BODY
+
+
+def make_data(url, body, status=200):
+    return {
+        'status': status,
+        'url': url,
+        'headers': {'Content-Type': ['text/xml']},
+        'body': body
+    }
+
+
+def make_db(db_dir, entries):
+    db = leveldb.LevelDB(db_dir)
+    for i, data in enumerate(entries):
+        db.Put('%040d_data' % i, pickle.dumps(data, protocol=2))
+        db.Put('%040d_time' % i, '1400000000.0')
+    del db
+
+
+class ReparseTest(TestCaseBase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        make_db(self.db_dir, [
+            make_data('http://www.sec.gov/Archives/edgar/data/1/0001-index.htm', '<html></html>'),
+            make_data('http://www.sec.gov/Archives/edgar/data/1/2/abc-20130630.xml', BODY),
+            make_data('http://www.sec.gov/Archives/edgar/data/3/4/def-20130630.xml', BODY.replace('10-Q', '8-K')),
+            make_data('http://www.sec.gov/Archives/edgar/data/5/6/ghi-20130630.xml', '', status=404),
+            make_data('http://www.sec.gov/Archives/edgar/data/7/8/jkl-20131231.xml', BODY.replace('10-Q', '10-K')),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir)
+
+    def test_iter_cached_reports(self):
+        urls = [url for url, body, encoding in iter_cached_reports(self.db_dir)]
+        self.assertEqual(urls, [
+            'http://www.sec.gov/Archives/edgar/data/1/2/abc-20130630.xml',
+            'http://www.sec.gov/Archives/edgar/data/3/4/def-20130630.xml',
+            'http://www.sec.gov/Archives/edgar/data/7/8/jkl-20131231.xml'
+        ])
+
+    def test_reparse_reports(self):
+        items = list(reparse_reports(self.db_dir))
+        self.assertEqual(len(items), 2)
+        self.assert_item(items[0], {
+            'symbol': 'ABC',
+            'amend': False,
+            'doc_type': '10-Q',
+            'end_date': '2013-06-28',
+            'revenues': 100.0,
+            'dividend': 0.0
+        })
+        self.assertEqual(items[1]['symbol'], 'JKL')
+        self.assertEqual(items[1]['doc_type'], '10-K')
+
+    def test_reparse_reports_in_pool(self):
+        items = list(reparse_reports(self.db_dir, processes=2))
+        self.assertEqual(items, list(reparse_reports(self.db_dir)))
+
+    def test_reports_in_multiple_caches(self):
+        # The cache of another lane has ABC's report too
+        lane_dir = tempfile.mkdtemp()
+        try:
+            make_db(lane_dir, [
+                make_data('http://www.sec.gov/Archives/edgar/data/1/2/abc-20130630.xml', BODY),
+                make_data('http://www.sec.gov/Archives/edgar/data/9/9/mno-20130630.xml', BODY)
+            ])
+            for processes in (1, 2):
+                items = list(reparse_reports([self.db_dir, lane_dir], processes))
+                self.assertEqual([item['symbol'] for item in items], ['ABC', 'JKL', 'MNO'])
+        finally:
+            shutil.rmtree(lane_dir)
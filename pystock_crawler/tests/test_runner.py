@@ -0,0 +1,67 @@
+from scrapy.settings import Settings
+
+from pystock_crawler.runner import crawl_batches, crawl_in_child, lane_settings, split_lanes
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class SplitLanesTest(TestCaseBase):
+
+    def test_one_lane(self):
+        self.assertEqual(split_lanes([1, 2, 3], 1), [[1, 2, 3]])
+
+    def test_multiple_lanes(self):
+        self.assertEqual(split_lanes(range(7), 3), [[0, 3, 6], [1, 4], [2, 5]])
+
+    def test_more_lanes_than_tasks(self):
+        self.assertEqual(split_lanes([1, 2], 4), [[1], [2]])
+
+    def test_no_tasks(self):
+        self.assertEqual(split_lanes([], 4), [[]])
+
+
+class LaneSettingsTest(TestCaseBase):
+
+    def test_first_lane(self):
+        settings = Settings({'HTTPCACHE_DIR': 'httpcache', 'PASSIVETHROTTLE_TELEMETRY': 'slots.jl'})
+        self.assertEqual(lane_settings(settings, 0), {})
+
+    def test_other_lanes(self):
+        settings = Settings({'HTTPCACHE_DIR': 'httpcache', 'PASSIVETHROTTLE_TELEMETRY': 'slots.jl'})
+        self.assertEqual(lane_settings(settings, 2), {
+            'HTTPCACHE_DIR': 'httpcache-2',
+            'PASSIVETHROTTLE_TELEMETRY': 'slots.jl-2'
+        })
+
+    def test_no_telemetry(self):
+        settings = Settings({'HTTPCACHE_DIR': 'httpcache', 'PASSIVETHROTTLE_TELEMETRY': None})
+        self.assertEqual(lane_settings(settings, 1), {'HTTPCACHE_DIR': 'httpcache-1'})
+
+
+class CrawlInChildTest(TestCaseBase):
+
+    def test_exit_code(self):
+        # Spider not found
+        self.assertNotEqual(crawl_in_child('no-such-spider'), 0)
+
+
+class CrawlBatchesTest(TestCaseBase):
+
+    # Spiders that crawl nothing
+    settings = {'HTTPCACHE_ENABLED': False}
+    tasks = [
+        ('yahoo', {'symbols': ''}, settings),
+        ('no-such-spider', {}, settings),
+        ('yahoo', {'symbols': ''}, settings)
+    ]
+
+    def test_failed_tasks(self):
+        finished = []
+
+        def finish(spider_name, spider_kwargs, settings):
+            finished.append(spider_name)
+
+        self.assertEqual(crawl_batches(self.tasks, 1, finish), [self.tasks[1]])
+        self.assertEqual(finished, ['yahoo', 'yahoo'])
+
+    def test_failed_tasks_in_lanes(self):
+        self.assertEqual(crawl_batches(self.tasks, 2), [self.tasks[1]])
@@ -0,0 +1,135 @@
+import os
+import random
+import shutil
+import tempfile
+
+from pystock_crawler.sorting import concat_csv, merge_csv, sort_csv
+from pystock_crawler.tests.base import TestCaseBase
+
+
+HEADER = 'symbol,date,close\r\n'
+
+
+class SortingTestBase(TestCaseBase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class SortCsvTest(SortingTestBase):
+
+    def test_sort(self):
+        path = self.write('a.csv', HEADER +
+                          'KO,2013-01-02,1\r\n'
+                          'A,2013-01-03,2\r\n'
+                          'KO,2013-01-01,3\r\n'
+                          'AA,2013-01-01,4\r\n'
+                          'A!,2013-01-01,5')
+        sort_csv(path)
+        self.assertEqual(self.read(path), HEADER +
+                         'A,2013-01-03,2\r\n'
+                         'A!,2013-01-01,5\n'
+                         'AA,2013-01-01,4\r\n'
+                         'KO,2013-01-01,3\r\n'
+                         'KO,2013-01-02,1\r\n')
+
+    def test_empty_file(self):
+        path = self.write('a.csv', '')
+        sort_csv(path)
+        self.assertEqual(self.read(path), '')
+
+    def test_external_sort(self):
+        rand = random.Random(0)
+        symbols = ['A', 'AA', 'A-B', 'KO', 'MCD', 'Z']
+        lines = ['%s,2013-01-%02d,%d\r\n' % (rand.choice(symbols), rand.randint(1, 31), i)
+                 for i in xrange(2000)]
+        content = HEADER + ''.join(lines)
+        expected = HEADER + ''.join(sorted(lines, key=lambda a: a.split(',')))
+
+        for max_merge in (100, 3, 2):
+            path = self.write('a.csv', content)
+
+            # Small buffer to spill many runs to disk
+            sort_csv(path, buffer_size=5000, max_merge=max_merge)
+            self.assertEqual(self.read(path), expected)
+
+            # Temporary files are deleted
+            self.assertEqual(os.listdir(self.dir), ['a.csv'])
+
+
+class ConcatCsvTest(SortingTestBase):
+
+    def test_concat(self):
+        sources = [
+            self.write('a.csv', HEADER + 'KO,2013-01-02,1\r\n'),
+            self.write('b.csv', ''),
+            self.write('c.csv', HEADER + 'A,2013-01-01,2\r\nB,2013-01-01,3\r\n')
+        ]
+        target = os.path.join(self.dir, 'out.csv')
+        concat_csv(target, sources)
+        self.assertEqual(self.read(target), HEADER +
+                         'KO,2013-01-02,1\r\n'
+                         'A,2013-01-01,2\r\n'
+                         'B,2013-01-01,3\r\n')
+
+    def test_empty_first_file(self):
+        sources = [
+            self.write('a.csv', ''),
+            self.write('b.csv', HEADER + 'A,2013-01-01,2\r\n')
+        ]
+        target = os.path.join(self.dir, 'out.csv')
+        concat_csv(target, sources)
+        self.assertEqual(self.read(target), HEADER + 'A,2013-01-01,2\r\n')
+
+
+    def test_append(self):
+        target = self.write('out.csv', HEADER + 'KO,2013-01-02,1\r\n')
+        sources = [self.write('a.csv', HEADER + 'A,2013-01-01,2\r\n')]
+        concat_csv(target, sources, append=True)
+        self.assertEqual(self.read(target), HEADER +
+                         'KO,2013-01-02,1\r\n'
+                         'A,2013-01-01,2\r\n')
+
+        # Append to an empty file
+        target = self.write('out.csv', '')
+        concat_csv(target, sources, append=True)
+        self.assertEqual(self.read(target), HEADER + 'A,2013-01-01,2\r\n')
+
+
+class MergeCsvTest(SortingTestBase):
+
+    def test_merge(self):
+        sources = [
+            self.write('a.csv', HEADER + 'A,2013-01-01,1\r\nKO,2013-01-02,2\r\n'),
+            self.write('b.csv', ''),
+            self.write('c.csv', HEADER + 'A,2013-01-01,3\r\nB,2013-01-01,4\r\nZ,2013-01-01,5'),
+            self.write('d.csv', HEADER + 'KO,2013-01-01,6\r\n')
+        ]
+        target = os.path.join(self.dir, 'out.csv')
+        merge_csv(target, sources)
+        self.assertEqual(self.read(target), HEADER +
+                         'A,2013-01-01,1\r\n'
+                         'A,2013-01-01,3\r\n'
+                         'B,2013-01-01,4\r\n'
+                         'KO,2013-01-01,6\r\n'
+                         'KO,2013-01-02,2\r\n'
+                         'Z,2013-01-01,5\n')
+
+    def test_all_empty(self):
+        sources = [self.write('a.csv', ''), self.write('b.csv', '')]
+        target = os.path.join(self.dir, 'out.csv')
+        merge_csv(target, sources)
+        self.assertEqual(self.read(target), '')
@@ -1,8 +1,12 @@
 import os
 import tempfile
 
-from scrapy.http import HtmlResponse, XmlResponse
+from scrapy.core.scraper import Slot
+from scrapy.http import HtmlResponse, Request, TextResponse, XmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
 
+from pystock_crawler.items import ReportItem
 from pystock_crawler.spiders.edgar import EdgarSpider, URLGenerator
 from pystock_crawler.tests.base import TestCaseBase
 
@@ -49,6 +53,22 @@ class URLGeneratorTest(TestCaseBase):
             make_url('KO', '20111230', '20121230')
         ])
 
+    def test_with_marks(self):
+        marks = {'AAPL': '20130630', 'KO': '20100101'}
+        urls = URLGenerator(('AAPL', 'ko', 'FB'), start_date='20120101', marks=marks)
+        self.assertEqual(list(urls), [
+            make_url('AAPL', start_date='20130630'),
+            make_url('ko', start_date='20120101'),
+            make_url('FB', start_date='20120101')
+        ])
+
+
+def make_marks_file(content):
+    f = tempfile.NamedTemporaryFile('w', delete=False)
+    f.write(content)
+    f.close()
+    return f.name
+
 
 class EdgarSpiderTest(TestCaseBase):
 
@@ -96,6 +116,18 @@ class EdgarSpiderTest(TestCaseBase):
 
         os.remove(f.name)
 
+    def test_marks(self):
+        marks_file = make_marks_file('GOOG\t20130630\n')
+        spider = EdgarSpider(symbols='GOOG,FB', startdate='20110101', marks=marks_file)
+        urls = list(spider.start_urls)
+
+        self.assertEqual(urls, [
+            make_url('GOOG', '20130630'),
+            make_url('FB', '20110101')
+        ])
+
+        os.remove(marks_file)
+
     def test_parse_company_filing_page(self):
         '''
         Parse the page that lists all filings of a company.
@@ -166,6 +198,102 @@ class EdgarSpiderTest(TestCaseBase):
             'http://sec.gov/Archives/edgar/data/456/789/hello-20130630.xml'
         ])
 
+    def test_skip_marked_reports(self):
+        marks_file = make_marks_file('ABC\t20130630\n')
+        spider = EdgarSpider(marks=marks_file)
+        spider._follow_links = True  # HACK
+
+        # Filing list of ABC
+        body = '<html><body><a href="/Archives/edgar/data/123/0001-index.htm">Link</a></body></html>'
+        response = HtmlResponse(make_url('ABC'), body=body)
+        requests = list(spider.parse(response))
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].meta['symbol'], 'ABC')
+
+        # Index pages of ABC's filings
+        body = '''
+            <html><body>
+            <a href="/Archives/edgar/data/123/abc-20130331.xml">Link</a>
+            <a href="/Archives/edgar/data/123/abc-20130630.xml">Link</a>
+            <a href="/Archives/edgar/data/123/abc-20130930.xml">Link</a>
+            </body></html>
+        '''
+        response = HtmlResponse('http://sec.gov/Archives/edgar/data/123/0001-index.htm', body=body,
+                                request=requests[0])
+        urls = [r.url for r in spider.parse(response)]
+        self.assertEqual(urls, ['http://sec.gov/Archives/edgar/data/123/abc-20130930.xml'])
+
+        os.remove(marks_file)
+
+    def test_filter_marked_item(self):
+        marks_file = make_marks_file('ABC\t20130630\n')
+        spider = EdgarSpider(marks=marks_file)
+
+        item = ReportItem(symbol='ABC', doc_type='10-Q', end_date='2013-06-30')
+        self.assertIsNone(spider.filter_item(item))
+
+        item = ReportItem(symbol='ABC', doc_type='10-Q', end_date='2013-09-30')
+        self.assertEqual(spider.filter_item(item), item)
+
+        item = ReportItem(symbol='XYZ', doc_type='10-K', end_date='2013-06-30')
+        self.assertEqual(spider.filter_item(item), item)
+
+        item = ReportItem(symbol='XYZ', doc_type='8-K', end_date='2013-06-30')
+        self.assertIsNone(spider.filter_item(item))
+
+        os.remove(marks_file)
+
+    def test_filter_item_by_requested_symbol(self):
+        marks_file = make_marks_file('ABC\t20130630\n')
+        new_marks_file = make_marks_file('')
+        spider = EdgarSpider(marks=marks_file, newmarks=new_marks_file)
+
+        # The report of ABC says its symbol is ABC.A
+        item = ReportItem(symbol='ABC.A', doc_type='10-Q', end_date='2013-06-30')
+        self.assertIsNone(spider.filter_item(item, 'ABC'))
+
+        item = ReportItem(symbol='ABC.A', doc_type='10-Q', end_date='2013-09-30')
+        self.assertEqual(spider.filter_item(item, 'ABC'), item)
+
+        # Amendments of marked periods are kept
+        item = ReportItem(symbol='ABC.A', doc_type='10-Q', end_date='2013-03-31', amend=True)
+        self.assertEqual(spider.filter_item(item, 'abc'), item)
+
+        item = ReportItem(symbol='XYZ', doc_type='10-K', end_date='2013-12-31')
+        self.assertEqual(spider.filter_item(item), item)
+
+        # New marks are kept by the requested symbol
+        spider.save_new_marks()
+        with open(new_marks_file) as f:
+            self.assertEqual(f.read(), 'ABC\t20130930\nXYZ\t20131231\n')
+
+        os.remove(marks_file)
+        os.remove(new_marks_file)
+
+    def test_parse_xml_report_of_requested_symbol(self):
+        marks_file = make_marks_file('ABC\t20130630\n')
+        spider = EdgarSpider(marks=marks_file)
+
+        body = '''
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <startDate>2013-03-31</startDate>
+                <endDate>2013-06-28</endDate>
+              </context>
+              <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+              <dei:DocumentPeriodEndDate contextRef="c1">2013-06-28</dei:DocumentPeriodEndDate>
+              <dei:TradingSymbol contextRef="c1">XYZ</dei:TradingSymbol>
+            </xbrl>
+        '''
+        request = Request('http://sec.gov/Archives/edgar/data/123/xyz-20130628.xml',
+                          meta={'symbol': 'ABC'})
+        response = XmlResponse(request.url, body=body, request=request)
+        self.assertIsNone(spider.parse_10qk(response))
+
+        os.remove(marks_file)
+
     def test_parse_xml_report(self):
         '''Parse XML 10-Q or 10-K report.'''
         spider = EdgarSpider()
@@ -220,3 +348,122 @@ class EdgarSpiderTest(TestCaseBase):
             'equity': 300.0,
             'cash': 150.0
         })
+
+    def test_parse_xml_report_in_pool(self):
+        class Pool(object):
+            def load_report(self, response):
+                return defer.succeed(ReportItem(symbol='ABC', doc_type='10-Q'))
+
+        spider = EdgarSpider()
+        spider._follow_links = True  # HACK
+        spider.parser_pool = Pool()
+
+        # The Deferred is returned to Scrapy instead of yielded as an item
+        request = Request('http://sec.gov/Archives/edgar/data/123/abc-20130720.xml', meta={'rule': 1})
+        response = XmlResponse(request.url, body='<xbrl/>', request=request)
+        d = spider._response_downloaded(response)
+        self.assertIsInstance(d, defer.Deferred)
+        self.assertEqual(d.result, ReportItem(symbol='ABC', doc_type='10-Q'))
+
+        # Index pages are parsed as usual
+        request = Request('http://sec.gov/Archives/edgar/data/123/0001-index.htm', meta={'rule': 0})
+        body = '<html><body><a href="/Archives/edgar/data/123/abc-20130720.xml">Link</a></body></html>'
+        response = HtmlResponse(request.url, body=body, request=request)
+        urls = [r.url for r in spider._response_downloaded(response)]
+        self.assertEqual(urls, ['http://sec.gov/Archives/edgar/data/123/abc-20130720.xml'])
+
+    def test_release_scraper_slot(self):
+        class Pool(object):
+            pending_size = 0
+
+            def load_report(self, response):
+                self.pending_size += len(response.body)
+                return defer.Deferred()
+
+        class Scraper(object):
+            slot = Slot()
+
+        class Engine(object):
+            scraper = Scraper()
+
+        crawler = get_crawler({'EDGAR_PARSER_MAX_PENDING_SIZE': 10000})
+        crawler.engine = Engine()
+        slot = Scraper.slot
+
+        spider = EdgarSpider()
+        spider.set_crawler(crawler)
+        spider.parser_pool = Pool()
+
+        # Not counted by the scraper slot while it's in the pool
+        request = Request('http://sec.gov/Archives/edgar/data/123/abc-20130720.xml')
+        response = XmlResponse(request.url, body='<xbrl>%s</xbrl>' % (' ' * 6000), request=request)
+        slot.add_response_request(response, request)
+        d = spider.parse_10qk(response)
+        self.assertEqual(slot.active_size, 0)
+        d.callback(ReportItem(symbol='ABC', doc_type='10-Q'))
+        self.assertEqual(slot.active_size, len(response.body))
+
+        # Too many bytes in the pool
+        response2 = XmlResponse(request.url, body='<xbrl>%s</xbrl>' % (' ' * 5000), request=request)
+        slot.add_response_request(response2, request)
+        spider.parse_10qk(response2)
+        self.assertEqual(slot.active_size, len(response.body) + len(response2.body))
+
+    def test_filing_index_json(self):
+        marks_file = make_marks_file('ABC\t20130331\n')
+        spider = EdgarSpider(marks=marks_file)
+        spider.set_crawler(get_crawler({'EDGAR_FILING_INDEX': 'json'}))
+        spider._follow_links = True  # HACK
+
+        # Filing list of ABC
+        body = '<html><body><a href="/Archives/edgar/data/123/456/0000000123-13-000456-index.htm">Link</a></body></html>'
+        response = HtmlResponse(make_url('ABC'), body=body)
+        requests = list(spider.parse(response))
+        self.assertEqual([r.url for r in requests], ['http://www.sec.gov/Archives/edgar/data/123/456/index.json'])
+        self.assertEqual(requests[0].callback, spider.parse_filing_index)
+        self.assertEqual(requests[0].meta['symbol'], 'ABC')
+
+        # Directory listing of the filing
+        body = '''{"directory": {"name": "/Archives/edgar/data/123/456", "item": [
+            {"name": "0000000123-13-000456-index.htm", "type": "text.gif"},
+            {"name": "abc-20130331.xml", "type": "text.gif"},
+            {"name": "abc-20130630.xml", "type": "text.gif"},
+            {"name": "abc-20130630_cal.xml", "type": "text.gif"}
+        ]}}'''
+        response = TextResponse(requests[0].url, body=body, request=requests[0])
+        requests = list(spider.parse_filing_index(response))
+        self.assertEqual([r.url for r in requests], ['http://www.sec.gov/Archives/edgar/data/123/456/abc-20130630.xml'])
+        self.assertEqual(requests[0].meta['symbol'], 'ABC')
+        self.assertEqual(requests[0].meta['rule'], EdgarSpider.REPORT_RULE)
+
+        response = TextResponse(requests[0].url, body='<html></html>')
+        self.assertEqual(list(spider.parse_filing_index(response)), [])
+
+        os.remove(marks_file)
+
+    def test_unknown_filing_index(self):
+        spider = EdgarSpider()
+        self.assertRaises(ValueError, spider.set_crawler, get_crawler({'EDGAR_FILING_INDEX': 'xml'}))
+
+    def test_loader_stats(self):
+        spider = EdgarSpider()
+        crawler = get_crawler({'EDGAR_LOADER_STATS': True})
+        crawler.stats.open_spider(spider)
+        spider.set_crawler(crawler)
+
+        body = '''<?xml version="1.0"?>
+            <xbrl xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31" xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <startDate>2013-03-31</startDate>
+                <endDate>2013-06-28</endDate>
+              </context>
+              <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+              <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130628.xml', body=body)
+        item = spider.parse_10qk(response)
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(crawler.stats.get_value('loader/document_count'), 1)
+        self.assertEqual(crawler.stats.get_value('loader/xpath/revenues///us-gaap:Revenues/matches'), 1)
+        self.assertIsNotNone(crawler.stats.get_value('loader/field/revenues/time_ms'))
@@ -1,9 +1,14 @@
 import os
+import pickle
 import tempfile
 
+from StringIO import StringIO
 from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
 
-from pystock_crawler.spiders.yahoo import make_url, YahooSpider
+from pystock_crawler.exporters import CsvItemExporter2
+from pystock_crawler.items import PriceItem, PriceRecord, PriceSeriesItem
+from pystock_crawler.spiders.yahoo import make_url, Price, YahooSpider
 from pystock_crawler.tests.base import TestCaseBase
 
 
@@ -69,6 +74,30 @@ class YahooSpiderTest(TestCaseBase):
         with self.assertRaises(ValueError):
             YahooSpider(enddate='12345678')
 
+    def test_marks(self):
+        f = tempfile.NamedTemporaryFile('w', delete=False)
+        f.write('KO\t20131231\nDIS\t20100228\n')
+        f.close()
+
+        try:
+            spider = YahooSpider(symbols='KO,DIS,ATVI', startdate='20120101', marks=f.name)
+            self.assertEqual(list(spider.start_urls), [
+                make_url('KO', start_date='20140101'),
+                make_url('DIS', start_date='20120101'),
+                make_url('ATVI', start_date='20120101')
+            ])
+
+            # Rows until the mark are dropped
+            body = ('Date,Open,High,Low,Close,Volume,Adj Close\n'
+                    '2014-01-02,31.00,31.50,30.90,31.20,1000,31.20\n'
+                    '2013-12-31,30.00,30.50,29.90,30.20,1000,30.20\n')
+            response = TextResponse(make_url('KO', start_date='20131231'), body=body)
+            items = list(spider.parse(response))
+            self.assertEqual(len(items), 1)
+            self.assertEqual(items[0]['date'], '2014-01-02')
+        finally:
+            os.remove(f.name)
+
     def test_parse(self):
         spider = YahooSpider()
 
@@ -110,3 +139,103 @@ class YahooSpiderTest(TestCaseBase):
             'volume': 6602600,
             'adj_close': 105.72
         })
+
+    def test_parse_types(self):
+        spider = YahooSpider()
+
+        body = ('Date,Open,High,Low,Close,Volume,Adj Close,Unknown\n'
+                '2013-11-22,121.50,122.75,117.93,121.38,11096700,121.38,1\n'
+                '\n'
+                '2013-11-21,null,122.75,117.93,121.38,,121.38,2\n'
+                '2013-11-20,121.00,122.00\n')
+        response = TextResponse(make_url('YHOO'), body=body)
+        items = list(spider.parse(response))
+        self.assertEqual(len(items), 3)
+
+        self.assertEqual(dict(items[0]), {
+            'symbol': 'YHOO',
+            'date': '2013-11-22',
+            'open': 121.5,
+            'high': 122.75,
+            'low': 117.93,
+            'close': 121.38,
+            'volume': 11096700,
+            'adj_close': 121.38
+        })
+        self.assertIsInstance(items[0]['open'], float)
+        self.assertIsInstance(items[0]['volume'], int)
+        self.assertIsNone(items[1]['open'])
+        self.assertIsNone(items[1]['volume'])
+        self.assertEqual(items[2]['high'], 122.0)
+        self.assertIsNone(items[2]['close'])
+
+        # Prices are exported as they are in the CSV
+        f = StringIO()
+        exporter = CsvItemExporter2(f)
+        exporter.start_exporting()
+        exporter.export_item(items[0])
+        exporter.finish_exporting()
+        self.assertEqual(f.getvalue(), 'symbol,date,open,high,low,close,volume,adj_close\r\n'
+                                       'YHOO,2013-11-22,121.50,122.75,117.93,121.38,11096700,121.38\r\n')
+
+    def test_price(self):
+        price = Price('34.50')
+        self.assertEqual(price, 34.5)
+        self.assertEqual(price + 1, 35.5)
+        self.assertEqual(str(price), '34.50')
+        self.assertEqual(repr(price), '34.50')
+        self.assertEqual(pickle.loads(pickle.dumps(price, 2)).text, '34.50')
+        self.assertRaises(ValueError, Price, 'null')
+
+    def test_price_records(self):
+        body = ('Date,Open,High,Low,Close,Volume,Adj Close\n'
+                '2013-11-22,121.58,122.75,117.93,121.38,11096700,121.38\n')
+        response = TextResponse(make_url('YHOO'), body=body)
+
+        spider = YahooSpider()
+        spider.set_crawler(get_crawler())
+        items = list(spider.parse(response))
+        self.assertIsInstance(items[0], PriceItem)
+
+        spider = YahooSpider()
+        spider.set_crawler(get_crawler({'PRICE_RECORDS': True}))
+        items = list(spider.parse(response))
+        self.assertIsInstance(items[0], PriceRecord)
+        self.assertEqual(items[0]['symbol'], 'YHOO')
+        self.assertEqual(items[0]['volume'], 11096700)
+
+    def test_price_series(self):
+        f = tempfile.NamedTemporaryFile('w', delete=False)
+        f.write('KO\t20131231\n')
+        f.close()
+
+        try:
+            body = ('Date,Open,High,Low,Close,Volume,Adj Close\n'
+                    '2014-01-02,31.00,31.50,30.90,31.20,1000,31.20\n'
+                    '2013-12-31,30.00,30.50,29.90,30.20,1000,30.20\n')
+
+            spider = YahooSpider(marks=f.name)
+            spider.set_crawler(get_crawler({'PRICE_SERIES': True}))
+
+            items = list(spider.parse(TextResponse(make_url('YHOO'), body=body)))
+            self.assertEqual(len(items), 1)
+            self.assertIsInstance(items[0], PriceSeriesItem)
+            self.assertEqual(items[0]['symbol'], 'YHOO')
+            self.assertEqual(items[0]['columns']['date'], ['2014-01-02', '2013-12-31'])
+            self.assertEqual(items[0]['columns']['close'], [31.2, 30.2])
+
+            # Rows until the mark are dropped
+            items = list(spider.parse(TextResponse(make_url('KO'), body=body)))
+            self.assertEqual(items[0]['columns']['date'], ['2014-01-02'])
+            self.assertEqual(items[0]['columns']['volume'], [1000])
+
+            # No item if no rows are left
+            body = 'Date,Open,High,Low,Close,Volume,Adj Close\n'
+            self.assertEqual(list(spider.parse(TextResponse(make_url('KO'), body=body))), [])
+        finally:
+            os.remove(f.name)
+
+    def test_parse_empty(self):
+        spider = YahooSpider()
+        response = TextResponse(make_url('YHOO'), body='')
+        self.assertEqual(list(spider.parse(response)), [])
@@ -0,0 +1,143 @@
+import json
+
+from StringIO import StringIO
+
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.throttle import PassiveThrottle, SlotRate, ThrottleTelemetry
+
+
+class Slot(object):
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.concurrency = 8
+        self.active = set()
+        self.queue = []
+        self.transferring = set()
+
+
+class SlotRateTest(TestCaseBase):
+
+    def test_increase(self):
+        rate = SlotRate(5.0, 0.1, 10.0)
+        for i in xrange(20):
+            rate.update(0.1, False, i)
+        self.assertEqual(rate.rate, 10.0)
+        self.assertAlmostEqual(rate.delay, 0.1)
+
+    def test_decrease_once_per_round_trip(self):
+        rate = SlotRate(10.0, 0.1, 10.0)
+        rate.update(0.5, True, 100.0)
+        self.assertAlmostEqual(rate.rate, 7.0)
+
+        # Responses of requests sent before the first error
+        rate.update(0.5, True, 100.1)
+        rate.update(0.5, True, 100.2)
+        self.assertAlmostEqual(rate.rate, 7.0)
+
+        rate.update(0.5, True, 100.6)
+        self.assertAlmostEqual(rate.rate, 4.9)
+
+        for i in xrange(100):
+            rate.update(0.5, True, 101.0 + i)
+        self.assertEqual(rate.rate, 0.1)
+
+    def test_hold(self):
+        rate = SlotRate(5.0, 0.1, 10.0)
+        rate.update(0.1, False, 0.0)
+
+        # Not faster while latency is high
+        for i in xrange(10):
+            rate.update(1.0, False, i)
+        self.assertLess(rate.rate, 10.0)
+        held = rate.rate
+        rate.update(1.0, False, 11.0)
+        self.assertEqual(rate.rate, held)
+
+        # Not faster right after errors
+        rate = SlotRate(5.0, 0.1, 10.0)
+        rate.update(None, True, 0.0)
+        rate.update(None, False, 1.0)
+        self.assertAlmostEqual(rate.rate, 3.5)
+
+
+class PassiveThrottleTest(TestCaseBase):
+
+    def create_throttle(self, settings):
+        settings = dict(settings, PASSIVETHROTTLE_ENABLED=True, RETRY_HTTP_CODES=[500, 503])
+        crawler = get_crawler(settings)
+        throttle = PassiveThrottle.from_crawler(crawler)
+        throttle._spider_opened(None)
+        return throttle
+
+    def test_passive(self):
+        throttle = self.create_throttle({'PASSIVETHROTTLE_MAX_DELAY': 60.0})
+        slot = Slot()
+        throttle._adjust_delay(slot, Response('http://example.com/', status=503))
+        self.assertEqual(slot.delay, 4)
+        throttle._adjust_delay(slot, Response('http://example.com/', status=200))
+        self.assertEqual(slot.delay, 2)
+
+    def test_adaptive(self):
+        throttle = self.create_throttle({'PASSIVETHROTTLE_MODE': 'adaptive', 'PASSIVETHROTTLE_TARGET_RATE': 8.0})
+        slot = Slot()
+        request = Request('http://example.com/', meta={'download_latency': 0.2})
+
+        throttle._adjust_rate('example.com', slot, request, Response('http://example.com/'), 0.0)
+        self.assertAlmostEqual(slot.delay, 1 / 4.4)
+        for i in xrange(20):
+            throttle._adjust_rate('example.com', slot, request, Response('http://example.com/'), i)
+        self.assertAlmostEqual(slot.delay, 1 / 8.0)
+
+        throttle._adjust_rate('example.com', slot, request, Response('http://example.com/', status=503), 30.0)
+        self.assertAlmostEqual(slot.delay, 1 / 5.6)
+
+        stats = throttle.stats
+        self.assertEqual(stats.get_value('passivethrottle/rate/example.com'), 5.6)
+        self.assertEqual(stats.get_value('passivethrottle/error_rate/example.com'), 0.2)
+        self.assertEqual(stats.get_value('passivethrottle/latency_ms/example.com'), 200)
+        self.assertEqual(stats.get_value('delay_count'), 1)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, self.create_throttle, {'PASSIVETHROTTLE_MODE': 'fast'})
+
+
+class ThrottleTelemetryTest(TestCaseBase):
+
+    def test_sample(self):
+        f = StringIO()
+        telemetry = ThrottleTelemetry(f)
+        slots = {'www.sec.gov': Slot(0.5), 'finance.yahoo.com': Slot()}
+        slots['www.sec.gov'].active.update(['a', 'b'])
+        slots['www.sec.gov'].transferring.add('a')
+        rates = {'www.sec.gov': SlotRate(2.0, 0.1, 10.0)}
+
+        telemetry.sample(slots, rates, 100.0)
+        telemetry.add_response('www.sec.gov', 200)
+        telemetry.add_response('www.sec.gov', 200)
+        telemetry.add_response('www.sec.gov', 503)
+        telemetry.add_response('www.google.com', 200)
+        del slots['finance.yahoo.com']
+        telemetry.sample(slots, rates, 102.0)
+
+        records = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0], {
+            'time': 100.0, 'slot': 'finance.yahoo.com', 'responses': 0, 'throughput': None, 'statuses': {},
+            'delay': 0.0, 'concurrency': 8, 'active': 0, 'transferring': 0, 'queued': 0
+        })
+        self.assertEqual(records[1]['throughput'], None)
+
+        # Slot that has been removed from the downloader
+        self.assertEqual(records[2], {
+            'time': 102.0, 'slot': 'www.google.com', 'responses': 1, 'throughput': 0.5,
+            'statuses': {'200': 1}
+        })
+        self.assertEqual(records[3], {
+            'time': 102.0, 'slot': 'www.sec.gov', 'responses': 3, 'throughput': 1.5,
+            'statuses': {'200': 2, '503': 1}, 'delay': 0.5, 'concurrency': 8, 'active': 2,
+            'transferring': 1, 'queued': 0, 'rate': 2.0, 'error_rate': 0.0, 'latency': None
+        })
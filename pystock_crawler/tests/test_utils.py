@@ -57,3 +57,29 @@ class UtilsTest(TestCaseBase):
             { 'name': 'Omar', 'age': '29' },
             { 'name': 'Joe', 'age': '45' }
         ])
+
+    def test_parse_csv_columns(self):
+        f = cStringIO.StringIO('name,age\nAvon,30\nOmar,29\nJoe,45\n')
+        headers, columns = utils.parse_csv_columns(f)
+        self.assertEqual(headers, ['name', 'age'])
+        self.assertEqual(columns, [('Avon', 'Omar', 'Joe'), ('30', '29', '45')])
+
+        headers, columns = utils.parse_csv_columns(cStringIO.StringIO('name,age\n'))
+        self.assertEqual(headers, ['name', 'age'])
+        self.assertEqual(columns, [(), ()])
+
+        self.assertEqual(utils.parse_csv_columns(cStringIO.StringIO('')), ([], []))
+
+    def test_parse_csv_columns_empty_rows(self):
+        f = cStringIO.StringIO('name,age\nAvon,30\n\nOmar,29\n\n')
+        headers, columns = utils.parse_csv_columns(f)
+        self.assertEqual(columns, [('Avon', 'Omar'), ('30', '29')])
+
+    def test_parse_csv_columns_short_rows(self):
+        f = cStringIO.StringIO('name,age,city\nAvon,30,Baltimore\nOmar\nJoe,45\n')
+        headers, columns = utils.parse_csv_columns(f)
+        self.assertEqual(columns, [('Avon', 'Omar', 'Joe'), ('30', '', '45'), ('Baltimore', '', '')])
+
+        f = cStringIO.StringIO('name,age\nAvon\nOmar\n')
+        headers, columns = utils.parse_csv_columns(f)
+        self.assertEqual(columns, [('Avon', 'Omar'), ('', '')])
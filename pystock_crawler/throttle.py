@@ -1,7 +1,125 @@
+import json
 import logging
+import time
 
+from collections import Counter, defaultdict
 from scrapy.exceptions import NotConfigured
 from scrapy import signals
+from twisted.internet import task
+
+
+class SlotRate(object):
+    '''
+    Request rate of a download slot, adjusted from the latency and errors of
+    its responses.
+
+    The rate goes up by a step of `max_rate` after every good response until
+    it reaches `max_rate`, as long as the average latency stays close to the
+    lowest average latency seen. It's cut by `DECREASE` on an error response,
+    at most once a round trip, so a burst of errors from requests already in
+    flight doesn't drop it to `min_rate` at once.
+
+    '''
+    # Weight of a new response in the moving averages
+    ALPHA = 0.2
+
+    INCREASE = 0.05
+    DECREASE = 0.7
+
+    # Don't go faster if the average error rate or latency is above these
+    ERROR_THRESHOLD = 0.05
+    LATENCY_FACTOR = 2.0
+
+    def __init__(self, rate, min_rate, max_rate):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.latency = None
+        self.base_latency = None
+        self.error_rate = 0.0
+        self.last_decrease = None
+
+    @property
+    def delay(self):
+        return 1.0 / self.rate
+
+    def update(self, latency, error, now):
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.ALPHA * (latency - self.latency)
+            if self.base_latency is None or self.latency < self.base_latency:
+                self.base_latency = self.latency
+        self.error_rate += self.ALPHA * ((1.0 if error else 0.0) - self.error_rate)
+
+        if error:
+            round_trip = max(self.latency or 0.0, self.delay)
+            if self.last_decrease is None or now - self.last_decrease >= round_trip:
+                self.rate = max(self.rate * self.DECREASE, self.min_rate)
+                self.last_decrease = now
+        elif self.error_rate < self.ERROR_THRESHOLD and \
+                (self.latency is None or self.latency <= self.base_latency * self.LATENCY_FACTOR):
+            self.rate = min(self.rate + self.max_rate * self.INCREASE, self.max_rate)
+
+
+class ThrottleTelemetry(object):
+    '''
+    Write a sample of every download slot to `file` as a line of JSON:
+
+    * time: UNIX time of the sample
+    * slot: key of the download slot
+    * delay: download delay in seconds
+    * concurrency, active, transferring, queued: the concurrency limit, and
+      numbers of requests in the slot, being downloaded and waiting
+    * responses, throughput: responses since the last sample, and per second
+    * statuses: numbers of responses of each status code since the last sample
+    * rate, error_rate, latency: state of the slot's SlotRate, adaptive mode only
+
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.last_time = None
+        self._statuses = defaultdict(Counter)
+
+    def add_response(self, key, status):
+        self._statuses[key][status] += 1
+
+    def sample(self, slots, rates, now):
+        elapsed = now - self.last_time if self.last_time else None
+        for key in sorted(set(slots) | set(self._statuses)):
+            statuses = self._statuses.pop(key, {})
+            responses = sum(statuses.itervalues())
+            record = {
+                'time': round(now, 3),
+                'slot': key,
+                'responses': responses,
+                'throughput': round(responses / elapsed, 3) if elapsed else None,
+                'statuses': dict((str(status), count) for status, count in statuses.iteritems())
+            }
+
+            slot = slots.get(key)
+            if slot is not None:
+                record.update({
+                    'delay': slot.delay,
+                    'concurrency': slot.concurrency,
+                    'active': len(slot.active),
+                    'transferring': len(slot.transferring),
+                    'queued': len(slot.queue)
+                })
+
+            rate = rates.get(key)
+            if rate is not None:
+                record.update({
+                    'rate': round(rate.rate, 3),
+                    'error_rate': round(rate.error_rate, 3),
+                    'latency': rate.latency
+                })
+
+            self.file.write(json.dumps(record, sort_keys=True) + '\n')
+
+        self.file.flush()
+        self.last_time = now
 
 
 class PassiveThrottle(object):
@@ -12,6 +130,16 @@ class PassiveThrottle(object):
     PassiveThrottle takes a more "passive" approach. It adds download delay
     only if there is an error response.
 
+    With PASSIVETHROTTLE_MODE = 'adaptive', it keeps a SlotRate for every
+    download slot instead, and sets the download delay of the slot to one
+    over its rate. Downloader slots send at most one request per delay, so
+    the rate converges on what the server can take without going over
+    PASSIVETHROTTLE_TARGET_RATE.
+
+    If PASSIVETHROTTLE_TELEMETRY is set to a path, the state of every
+    download slot is appended to it every PASSIVETHROTTLE_TELEMETRY_INTERVAL
+    seconds (see ThrottleTelemetry).
+
     '''
     def __init__(self, crawler):
         self.crawler = crawler
@@ -19,8 +147,16 @@ class PassiveThrottle(object):
             raise NotConfigured
 
         self.debug = crawler.settings.getbool("PASSIVETHROTTLE_DEBUG")
+        self.mode = crawler.settings.get('PASSIVETHROTTLE_MODE', 'passive')
+        if self.mode not in ('passive', 'adaptive'):
+            raise ValueError('Unknown PASSIVETHROTTLE_MODE: %s' % self.mode)
+        self.rates = {}
+        self.telemetry_path = crawler.settings.get('PASSIVETHROTTLE_TELEMETRY')
+        self.telemetry_interval = crawler.settings.getfloat('PASSIVETHROTTLE_TELEMETRY_INTERVAL', 5.0)
+        self.telemetry = None
         self.stats = crawler.stats
         crawler.signals.connect(self._spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self._spider_closed, signal=signals.spider_closed)
         crawler.signals.connect(self._response_downloaded, signal=signals.response_downloaded)
 
     @classmethod
@@ -31,9 +167,26 @@ class PassiveThrottle(object):
         self.mindelay = self._min_delay(spider)
         self.maxdelay = self._max_delay(spider)
         self.retry_http_codes = self._retry_http_codes()
+        self.target_rate = self._target_rate()
 
         self.stats.set_value('delay_count', 0)
 
+        if self.telemetry_path:
+            self.telemetry = ThrottleTelemetry(open(self.telemetry_path, 'a'))
+            self.telemetry_task = task.LoopingCall(self._sample_telemetry)
+            self.telemetry_task.start(self.telemetry_interval)
+
+    def _spider_closed(self, spider, reason):
+        if self.telemetry:
+            if self.telemetry_task.running:
+                self.telemetry_task.stop()
+            self._sample_telemetry()
+            self.telemetry.file.close()
+            self.telemetry = None
+
+    def _sample_telemetry(self):
+        self.telemetry.sample(self.crawler.engine.downloader.slots, self.rates, time.time())
+
     def _min_delay(self, spider):
         s = self.crawler.settings
         return getattr(spider, 'download_delay', 0.0) or \
@@ -45,13 +198,24 @@ class PassiveThrottle(object):
     def _retry_http_codes(self):
         return self.crawler.settings.getlist('RETRY_HTTP_CODES', [])
 
+    def _target_rate(self):
+        rate = self.crawler.settings.getfloat('PASSIVETHROTTLE_TARGET_RATE', 10.0)
+        if self.mindelay:
+            rate = min(rate, 1.0 / self.mindelay)
+        return rate
+
     def _response_downloaded(self, response, request, spider):
         key, slot = self._get_slot(request, spider)
+        if self.telemetry:
+            self.telemetry.add_response(key, response.status)
         if slot is None:
             return
 
         olddelay = slot.delay
-        self._adjust_delay(slot, response)
+        if self.mode == 'adaptive':
+            self._adjust_rate(key, slot, request, response, time.time())
+        else:
+            self._adjust_delay(slot, response)
         if self.debug:
             diff = slot.delay - olddelay
             conc = len(slot.transferring)
@@ -76,3 +240,20 @@ class PassiveThrottle(object):
             if new_delay < 0.01:
                 new_delay = 0
             slot.delay = new_delay
+
+    def _adjust_rate(self, key, slot, request, response, now):
+        rate = self.rates.get(key)
+        if rate is None:
+            min_rate = 1.0 / self.maxdelay if self.maxdelay else self.target_rate
+            rate = self.rates[key] = SlotRate(self.target_rate / 2, min_rate, self.target_rate)
+
+        error = response.status in self.retry_http_codes
+        if error:
+            self.stats.inc_value('delay_count')
+        rate.update(request.meta.get('download_latency'), error, now)
+        slot.delay = rate.delay
+
+        self.stats.set_value('passivethrottle/rate/%s' % key, round(rate.rate, 3))
+        self.stats.set_value('passivethrottle/error_rate/%s' % key, round(rate.error_rate, 3))
+        if rate.latency is not None:
+            self.stats.set_value('passivethrottle/latency_ms/%s' % key, int(rate.latency * 1000))
@@ -1,6 +1,7 @@
 import csv
 
 from datetime import datetime
+from itertools import izip_longest
 
 
 def check_date_arg(value, arg_name=None):
@@ -45,3 +46,25 @@ def parse_csv(file_like):
             header = headers[i]
             item[header] = value
         yield item
+
+
+def parse_csv_columns(file_like):
+    '''
+    Parse a CSV file into columns. Return a list of headers and a list of
+    columns, each a tuple of values. Empty rows are skipped, and values
+    missing at the end of a short row are ''.
+
+    '''
+    reader = csv.reader(file_like)
+    try:
+        headers = reader.next()
+    except StopIteration:
+        return [], []
+
+    # Transpose rows to columns without a dict per row. izip_longest() pads
+    # short rows instead of cutting every column to the shortest row.
+    rows = [row for row in reader if row]
+    columns = list(izip_longest(*rows, fillvalue=''))
+    if len(columns) < len(headers):
+        columns.extend([('',) * len(rows)] * (len(headers) - len(columns)))
+    return headers, columns